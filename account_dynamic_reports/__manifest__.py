@@ -22,8 +22,10 @@
     'depends': ['account', 'web'],
     'data': [
              'security/ir.model.access.csv',
+             'security/report_job_security.xml',
              'data/data_account_account_type.xml',
              'data/data_financial_report.xml',
+             'data/data_report_job.xml',
 
              'views/views.xml',
              'views/res_company_view.xml',
@@ -34,6 +36,7 @@
              'views/partner_ageing_view.xml',
              'views/financial_report_view.xml',
              'views/analytic_report_view.xml',
+             'views/report_job_view.xml',
 
              'wizard/general_ledger_view.xml',
              'wizard/partner_ledger_view.xml',
@@ -17,6 +17,22 @@ from odoo.http import content_disposition
 from odoo.http import serialize_exception as _serialize_exception
 from odoo.tools.translate import _
 import base64
+import tempfile
+from werkzeug.wsgi import wrap_file
+
+try:
+    from odoo.tools.misc import xlsxwriter
+except ImportError:
+    import xlsxwriter
+
+XLSX_REPORT_MODELS = [
+    'ins.general.ledger',
+    'ins.partner.ledger',
+    'ins.trial.balance',
+    'ins.partner.ageing',
+    'ins.financial.report',
+    'ins.analytic.report',
+]
 
 
 class Binary(http.Controller):
@@ -34,3 +50,31 @@ class Binary(http.Controller):
         return request.make_response(filecontent,
                                      [('Content-Type', 'application/octet-stream'),
                                       ('Content-Disposition', content_disposition(filename))])
+
+    @http.route('/account_dynamic_reports/xlsx/<string:model>/<int:wizard_id>', type='http', auth="user")
+    def download_xlsx(self, model, wizard_id, filename=None, **kw):
+        """Stream the XLSX export of a dynamic report wizard.
+        The workbook is written in constant_memory mode into a temporary file which is sent
+        chunk by chunk and removed once the response is closed."""
+        if model not in XLSX_REPORT_MODELS:
+            return request.not_found()
+        wizard = request.env[model].browse(wizard_id).exists()
+        if not wizard:
+            return request.not_found()
+        output = tempfile.TemporaryFile()
+        try:
+            workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+            wizard._write_xlsx(workbook)
+            workbook.close()
+        except Exception:
+            output.close()
+            raise
+        size = output.seek(0, 2)
+        output.seek(0)
+        response = request.make_response(
+            wrap_file(request.httprequest.environ, output),
+            [('Content-Type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+             ('Content-Length', size),
+             ('Content-Disposition', content_disposition(filename or '%s.xlsx' % model.replace('.', '_')))])
+        response.direct_passthrough = True
+        return response
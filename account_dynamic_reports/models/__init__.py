@@ -1,3 +1,10 @@
 from . import res_company
 from . import account_account_type
 from . import account_account
+from . import account_balance_snapshot
+from . import account_move
+from . import account_partial_reconcile
+from . import res_partner
+from . import report_cache
+from . import report_job
+from . import report_parallel
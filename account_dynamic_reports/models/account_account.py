@@ -28,3 +28,16 @@ class AccountAccount(models.Model):
             # self.env.ref(
             #     'account_dynamic_reports.ins_account_financial_report_cashflow0').write(
             #     {'account_ids': [(3, self._origin.id)]})
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(AccountAccount, self).create(vals_list)
+
+    def write(self, vals):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(AccountAccount, self).write(vals)
+
+    def unlink(self):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(AccountAccount, self).unlink()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, fields, models, tools
+
+
+class InsAccountBalanceSnapshot(models.Model):
+    _name = 'ins.account.balance.snapshot'
+    _description = 'Monthly Account Balance Snapshot'
+    _order = 'month, account_id'
+
+    company_id = fields.Many2one('res.company', string='Company', required=True, readonly=True)
+    account_id = fields.Many2one('account.account', string='Account', required=True, readonly=True)
+    partner_id = fields.Many2one('res.partner', string='Partner', readonly=True)
+    journal_id = fields.Many2one('account.journal', string='Journal', readonly=True)
+    month = fields.Date(string='Month', required=True, readonly=True,
+                        help='First day of the month of the posted move lines summed in this row')
+    debit = fields.Float(string='Debit', readonly=True)
+    credit = fields.Float(string='Credit', readonly=True)
+    balance = fields.Float(string='Balance', readonly=True)
+
+    def init(self):
+        tools.create_index(self._cr, 'ins_account_balance_snapshot_company_account_month_index',
+                           self._table, ['company_id', 'account_id', 'month'])
+        tools.create_unique_index(self._cr, 'ins_account_balance_snapshot_key_index', self._table,
+                                  ['company_id', 'account_id', 'COALESCE(partner_id, 0)',
+                                   'COALESCE(journal_id, 0)', 'month'])
+        tools.create_index(self._cr, 'ins_account_balance_snapshot_write_date_index',
+                           self._table, ['write_date'])
+        self._cr.execute('SELECT 1 FROM ins_account_balance_snapshot LIMIT 1')
+        if not self._cr.fetchone():
+            self.rebuild()
+
+    @api.model
+    def _get_edge_date(self, date_from):
+        '''
+        First day of the month of date_from. The snapshot holds every month before it,
+        the lines from this day on have to be read from account_move_line.
+        '''
+        return fields.Date.to_date(date_from).replace(day=1)
+
+    def _flush_lines(self):
+        self.env['account.move.line'].flush_model(
+            ['company_id', 'account_id', 'partner_id', 'journal_id', 'date', 'debit', 'credit', 'balance',
+             'parent_state'])
+
+    def _add_lines(self, where, params, sign=1):
+        '''
+        Adds the posted move lines selected by the given condition on account_move_line to the
+        snapshot, or subtracts them when sign is -1. Each (company, account, partner, journal, month)
+        row is updated in place by its own delta, so concurrent postings only wait on the rows
+        they share.
+        '''
+        self.env['ins.report.cache']._touch_ledger()
+        params = dict(params, uid=self.env.uid, sign=sign)
+        self.env.cr.execute('''
+            INSERT INTO ins_account_balance_snapshot AS s
+                (company_id, account_id, partner_id, journal_id, month, debit, credit, balance,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT
+                l.company_id, l.account_id, l.partner_id, l.journal_id,
+                date_trunc('month', l.date)::date AS month,
+                %(sign)s * COALESCE(SUM(l.debit), 0), %(sign)s * COALESCE(SUM(l.credit), 0),
+                %(sign)s * COALESCE(SUM(l.balance), 0),
+                %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+            FROM account_move_line l
+            WHERE l.parent_state = 'posted' AND ''' + where + '''
+            GROUP BY l.company_id, l.account_id, l.partner_id, l.journal_id, date_trunc('month', l.date)
+            ON CONFLICT (company_id, account_id, COALESCE(partner_id, 0), COALESCE(journal_id, 0), month)
+            DO UPDATE SET
+                debit = s.debit + EXCLUDED.debit,
+                credit = s.credit + EXCLUDED.credit,
+                balance = s.balance + EXCLUDED.balance,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        ''', params)
+        self.invalidate_model()
+
+    @api.model
+    def _add_moves(self, moves, sign=1):
+        '''
+        Adds the lines of the given moves to the snapshot when they are posted, and subtracts them
+        with sign -1 before they are reset to draft or changed.
+        '''
+        if not moves:
+            return
+        self._flush_lines()
+        self._add_lines('l.move_id IN %(move_ids)s', {'move_ids': tuple(moves.ids)}, sign=sign)
+
+    @api.model
+    def _add_move_lines(self, lines, sign=1):
+        '''
+        Same as _add_moves for single lines, e.g. around a write on posted lines.
+        '''
+        if not lines:
+            return
+        self._flush_lines()
+        self._add_lines('l.id IN %(line_ids)s', {'line_ids': tuple(lines.ids)}, sign=sign)
+
+    @api.model
+    def rebuild(self):
+        '''
+        Rebuilds the whole snapshot from the posted move lines, e.g. when posted lines were
+        changed directly in the database:
+            env['ins.account.balance.snapshot'].rebuild()
+        It runs when the module is installed or upgraded with an empty snapshot.
+        '''
+        self.env['account.move.line'].flush_model()
+        self.env.cr.execute('DELETE FROM ins_account_balance_snapshot')
+        self._add_lines('TRUE', {})
+        return True
+
+    @api.model
+    def _read_balances(self, date_from, groupby, company_ids, account_ids=None, partner_ids=None,
+                       journal_ids=None, account_types=None):
+        '''
+        Debit, credit and balance of the months before the month of date_from.
+        The filters left to None are not applied.
+        :param groupby: 'account_id' or 'partner_id'
+        :return: dict {groupby value: {'debit', 'credit', 'balance'}}
+        '''
+        assert groupby in ('account_id', 'partner_id')
+        where = ''
+        params = {'month': self._get_edge_date(date_from)}
+        if company_ids is not None:
+            where += ' AND s.company_id IN %(company_ids)s '
+            params['company_ids'] = tuple(company_ids) + (0,)
+        if account_ids is not None:
+            where += ' AND s.account_id IN %(account_ids)s '
+            params['account_ids'] = tuple(account_ids) + (0,)
+        if partner_ids is not None:
+            where += ' AND s.partner_id IN %(partner_ids)s '
+            params['partner_ids'] = tuple(partner_ids) + (0,)
+        if journal_ids is not None:
+            where += ' AND s.journal_id IN %(journal_ids)s '
+            params['journal_ids'] = tuple(journal_ids) + (0,)
+        if account_types is not None:
+            where += ' AND a.account_type IN %(account_types)s '
+            params['account_types'] = tuple(account_types)
+        self.env.cr.execute('''
+            SELECT
+                s.''' + groupby + ''' AS key,
+                COALESCE(SUM(s.debit), 0) AS debit,
+                COALESCE(SUM(s.credit), 0) AS credit,
+                COALESCE(SUM(s.balance), 0) AS balance
+            FROM ins_account_balance_snapshot s
+            JOIN account_account a ON (s.account_id=a.id)
+            WHERE s.month < %(month)s ''' + where + '''
+            GROUP BY s.''' + groupby, params)
+        return {row['key']: row for row in self.env.cr.dictfetchall()}
+
+    @api.model
+    def _merge_history(self, totals, history, prefixes, defaults):
+        '''
+        Adds the balances read by _read_balances to the columns of the given prefixes
+        (e.g. 'initial_', 'ending_') of the rows computed from the move lines.
+        Keys that only have history get a row built from defaults.
+        '''
+        for key, values in history.items():
+            row = totals.setdefault(key, dict(defaults))
+            for prefix in prefixes:
+                for field in ['debit', 'credit', 'balance']:
+                    row[prefix + field] = (row.get(prefix + field) or 0) + values[field]
+        return totals
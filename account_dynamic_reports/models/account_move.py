@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, models
+
+# Values of the move lines summed in ins.account.balance.snapshot
+SNAPSHOT_MOVE_FIELDS = ('company_id', 'journal_id', 'partner_id', 'date', 'line_ids')
+SNAPSHOT_LINE_FIELDS = ('company_id', 'account_id', 'partner_id', 'journal_id', 'date',
+                        'debit', 'credit', 'balance')
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(AccountMove, self).create(vals_list)
+
+    def unlink(self):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(AccountMove, self).unlink()
+
+    def _post(self, soft=True):
+        posted = super(AccountMove, self)._post(soft=soft)
+        self.env['ins.account.balance.snapshot']._add_moves(posted)
+        return posted
+
+    def button_draft(self):
+        posted = self.filtered(lambda move: move.state == 'posted')
+        self.env['ins.account.balance.snapshot']._add_moves(posted, sign=-1)
+        return super(AccountMove, self).button_draft()
+
+    def write(self, vals):
+        self.env['ins.report.cache']._touch_ledger()
+        posted = self.filtered(lambda move: move.state == 'posted')
+        if self.env.context.get('skip_balance_snapshot') or not posted \
+                or not any(fname in vals for fname in SNAPSHOT_MOVE_FIELDS):
+            return super(AccountMove, self).write(vals)
+        # The lines written along are handled here as a whole, not by account.move.line
+        snapshot = self.env['ins.account.balance.snapshot']
+        snapshot._add_moves(posted, sign=-1)
+        res = super(AccountMove, self.with_context(skip_balance_snapshot=True)).write(vals)
+        snapshot._add_moves(posted)
+        return res
+
+
+class AccountMoveLine(models.Model):
+    _inherit = 'account.move.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(AccountMoveLine, self).create(vals_list)
+
+    def unlink(self):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(AccountMoveLine, self).unlink()
+
+    def write(self, vals):
+        self.env['ins.report.cache']._touch_ledger()
+        posted = self.filtered(lambda line: line.parent_state == 'posted')
+        if self.env.context.get('skip_balance_snapshot') or not posted \
+                or not any(fname in vals for fname in SNAPSHOT_LINE_FIELDS):
+            return super(AccountMoveLine, self).write(vals)
+        snapshot = self.env['ins.account.balance.snapshot']
+        snapshot._add_move_lines(posted, sign=-1)
+        res = super(AccountMoveLine, self.with_context(skip_balance_snapshot=True)).write(vals)
+        snapshot._add_move_lines(posted.exists())
+        return res
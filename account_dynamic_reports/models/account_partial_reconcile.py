@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, models
+
+
+class AccountPartialReconcile(models.Model):
+    _inherit = 'account.partial.reconcile'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(AccountPartialReconcile, self).create(vals_list)
+
+    def unlink(self):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(AccountPartialReconcile, self).unlink()
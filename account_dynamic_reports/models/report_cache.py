@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import json
+
+from odoo import api, models
+from odoo.tools.lru import LRU
+
+REPORT_CACHE_SIZE = 32
+
+# Shared by all the databases of the worker, the keys start with the database name
+_report_cache = LRU(REPORT_CACHE_SIZE)
+
+KEY_EXCLUDED_FIELDS = ('id', 'display_name', 'create_uid', 'create_date', 'write_uid', 'write_date')
+
+
+class InsReportCache(models.AbstractModel):
+    _name = 'ins.report.cache'
+    _description = 'Dynamic Report Result Cache'
+
+    def init(self):
+        # One row counting the committed changes of the ledger, see _touch_ledger
+        self._cr.execute('''
+            CREATE TABLE IF NOT EXISTS ins_report_ledger_revision (
+                id integer PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                revision bigint NOT NULL DEFAULT 0
+            )
+        ''')
+        self._cr.execute('''
+            INSERT INTO ins_report_ledger_revision (id, revision) VALUES (1, 0)
+            ON CONFLICT (id) DO NOTHING
+        ''')
+
+    @api.model
+    def _touch_ledger(self):
+        '''
+        Bumps the ledger revision in the current transaction, right before it commits.
+        Called on every change the reports read: moves, move lines and their reconciliations,
+        the balance snapshot, partners, accounts and the financial report structure.
+        The revision row is only locked while committing.
+        '''
+        cr = self.env.cr
+        if cr.precommit.data.get('ins_report_ledger_touched'):
+            return
+        cr.precommit.data['ins_report_ledger_touched'] = True
+        cr.precommit.add(lambda: cr.execute(
+            'UPDATE ins_report_ledger_revision SET revision = revision + 1'))
+
+    @api.model
+    def _get_ledger_watermark(self):
+        '''
+        The ledger revision, bumped by every transaction that changed something the reports
+        read (see _touch_ledger). It is committed along with the changes, so a transaction
+        reads the revision of the state of the ledger it sees.
+        '''
+        self.env.cr.execute('SELECT revision FROM ins_report_ledger_revision')
+        row = self.env.cr.fetchone()
+        return (str(row[0]) if row else None,)
+
+    @api.model
+    def _get_cache_key(self, wizard, method):
+        filters = wizard.prepare_values_for_component()
+        for value in filters.values():
+            # Only the selected value matters, the labels of the choices do not
+            if isinstance(value, dict):
+                value.pop('choices', None)
+        fnames = [name for name, field in wizard._fields.items()
+                  if field.store and name not in KEY_EXCLUDED_FIELDS]
+        values = wizard.read(fnames, load=None)[0]
+        values.pop('id', None)
+        return (
+            self.env.cr.dbname,
+            wizard._name,
+            method,
+            self.env.uid,
+            self.env.lang,
+            tuple(self.env.companies.ids),
+            json.dumps([filters, values], sort_keys=True, default=str),
+            self._get_ledger_watermark(),
+        )
+
+    @api.model
+    def _get_or_compute(self, wizard, method):
+        '''
+        Returns the result of wizard.method(), served from the cache when the same filters were
+        computed on the same state of the ledger. Wizards expose the cached method as the public
+        one and keep the computation in the underscored one, e.g. prepare_main_lines calls
+        _get_or_compute(self, '_prepare_main_lines').
+        '''
+        wizard.ensure_one()
+        key = self._get_cache_key(wizard, method)
+        try:
+            return copy.deepcopy(_report_cache[key])
+        except KeyError:
+            pass
+        result = getattr(wizard, method)()
+        _report_cache[key] = copy.deepcopy(result)
+        return result
+
+    @api.model
+    def clear(self):
+        _report_cache.clear()
+        return True
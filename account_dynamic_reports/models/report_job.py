@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import tempfile
+from datetime import timedelta
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+try:
+    from odoo.tools.misc import xlsxwriter
+except ImportError:
+    import xlsxwriter
+
+_logger = logging.getLogger(__name__)
+
+JOB_REPORT_MODELS = {
+    'ins.general.ledger': 'General Ledger',
+    'ins.partner.ledger': 'Partner Ledger',
+    'ins.trial.balance': 'Trial Balance',
+}
+
+# {job id: [steps done, steps total, last percentage written]}, for the jobs run by this worker
+_job_progress = {}
+
+
+class InsReportJob(models.Model):
+    _name = 'ins.report.job'
+    _description = 'Dynamic Report Background Job'
+    _order = 'id desc'
+
+    name = fields.Char(string='Report', required=True, readonly=True)
+    user_id = fields.Many2one('res.users', string='User', required=True, readonly=True,
+                              default=lambda self: self.env.user)
+    company_id = fields.Many2one('res.company', string='Company', required=True, readonly=True,
+                                 default=lambda self: self.env.company)
+    res_model = fields.Char(string='Wizard Model', required=True, readonly=True)
+    res_id = fields.Integer(string='Wizard', required=True, readonly=True)
+    wizard_values = fields.Json(string='Filters', readonly=True,
+                                help='Values of the wizard when the job was queued, the report is '
+                                     'computed on a copy of them as the wizard may be vacuumed meanwhile')
+    report_type = fields.Selection([('pdf', 'PDF'), ('xlsx', 'XLSX')], string='Format',
+                                   required=True, readonly=True)
+    state = fields.Selection([('queued', 'Queued'),
+                              ('running', 'Running'),
+                              ('done', 'Done'),
+                              ('failed', 'Failed')], string='Status', default='queued', required=True, readonly=True)
+    progress = fields.Integer(string='Progress (%)', readonly=True)
+    attachment_id = fields.Many2one('ir.attachment', string='File', readonly=True)
+    error = fields.Text(string='Error', readonly=True)
+    date_done = fields.Datetime(string='Done On', readonly=True)
+
+    @api.model
+    def create_job(self, res_model, res_id, report_type):
+        '''
+        Called by the report components instead of action_pdf/action_xlsx, returns the id of the
+        queued job. The report is computed by _cron_run_jobs.
+        '''
+        if res_model not in JOB_REPORT_MODELS or report_type not in ('pdf', 'xlsx'):
+            raise UserError(_('This report can not be run in the background.'))
+        wizard = self.env[res_model].browse(res_id).exists()
+        if not wizard:
+            raise UserError(_('The report does not exist any more, please open it again.'))
+        wizard.check_access('read')
+        # Dates are kept as strings, create() reads them back
+        values = json.loads(json.dumps(wizard.copy_data()[0], default=str))
+        job = self.sudo().create({
+            'name': '%s (%s)' % (JOB_REPORT_MODELS[res_model], report_type.upper()),
+            'user_id': self.env.uid,
+            'company_id': self.env.company.id,
+            'res_model': res_model,
+            'res_id': wizard.id,
+            'wizard_values': values,
+            'report_type': report_type,
+        })
+        self.env.ref('account_dynamic_reports.ir_cron_report_jobs')._trigger()
+        return job.id
+
+    def get_progress(self):
+        return [{
+            'id': job.id,
+            'state': job.state,
+            'progress': job.progress,
+            'error': job.error or '',
+            'url': job.attachment_id and '/web/content/%s?download=true' % job.attachment_id.id or False,
+        } for job in self]
+
+    def action_download(self):
+        self.ensure_one()
+        if not self.attachment_id:
+            raise UserError(_('The report is not ready yet.'))
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=true' % self.attachment_id.id,
+            'target': 'new',
+        }
+
+    @api.model
+    def _report_progress(self, total=None):
+        '''
+        Called by the wizards from their loops when they run inside a job: with a total to
+        start counting, then once per step. The percentage is written on a separate cursor,
+        so that the polling users see it before the job's transaction is committed.
+        '''
+        job_id = self.env.context.get('report_job_id')
+        if not job_id:
+            return
+        if total is not None:
+            _job_progress[job_id] = [0, total, 0]
+            return
+        counter = _job_progress.get(job_id)
+        if not counter or not counter[1]:
+            return
+        counter[0] += 1
+        percentage = min(99, int(counter[0] * 100 / counter[1]))
+        if percentage > counter[2]:
+            counter[2] = percentage
+            with self.env.registry.cursor() as cr:
+                cr.execute('UPDATE ins_report_job SET progress = %s WHERE id = %s', (percentage, job_id))
+
+    def _render_file(self, wizard):
+        '''
+        :return: (content, filename) of the report of the given wizard
+        '''
+        self.ensure_one()
+        if self.report_type == 'pdf':
+            action = wizard.action_pdf()
+            content, _type = wizard.env['ir.actions.report'].with_context(**action.get('context', {})).\
+                _render_qweb_pdf(action['report_name'], wizard.ids, data=action.get('data'))
+            return content, '%s.pdf' % JOB_REPORT_MODELS[self.res_model]
+        with tempfile.TemporaryFile() as output:
+            workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+            wizard._write_xlsx(workbook)
+            workbook.close()
+            output.seek(0)
+            return output.read(), '%s.xlsx' % JOB_REPORT_MODELS[self.res_model]
+
+    def _run(self):
+        self.ensure_one()
+        wizard = self.env[self.res_model].with_user(self.user_id).with_company(self.company_id).with_context(
+            report_job_id=self.id).create(self.wizard_values)
+        content, filename = self._render_file(wizard)
+        attachment = self.env['ir.attachment'].create({
+            'name': filename,
+            'raw': content,
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+        self.write({
+            'state': 'done',
+            'progress': 100,
+            'attachment_id': attachment.id,
+            'date_done': fields.Datetime.now(),
+        })
+
+    @api.model
+    def _cron_run_jobs(self):
+        '''
+        Runs the queued jobs one by one, each in its own transaction, then removes the jobs
+        older than the retention period.
+        '''
+        while True:
+            self.env.cr.execute('''
+                SELECT id FROM ins_report_job
+                WHERE state = 'queued'
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            ''')
+            row = self.env.cr.fetchone()
+            if not row:
+                break
+            job = self.browse(row[0])
+            job.write({'state': 'running', 'progress': 0})
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+            try:
+                job._run()
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.exception('Dynamic report job %s failed', job.id)
+                job.write({'state': 'failed', 'error': str(e), 'date_done': fields.Datetime.now()})
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            finally:
+                _job_progress.pop(job.id, None)
+        self._gc_jobs()
+
+    @api.model
+    def _gc_jobs(self):
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'account_dynamic_reports.report_job_retention_days', 7))
+        jobs = self.search([('state', 'in', ('done', 'failed')),
+                            ('date_done', '<', fields.Datetime.now() - timedelta(days=days))])
+        jobs.attachment_id.unlink()
+        jobs.unlink()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from psycopg2.pool import PoolError
+
+from odoo import api, models, sql_db
+from odoo.tools import config
+
+
+class InsReportParallel(models.AbstractModel):
+    _name = 'ins.report.parallel'
+    _description = 'Dynamic Report Parallel Computation'
+
+    @api.model
+    def _get_workers(self):
+        '''
+        Number of connections used to compute one report, set with the system parameter
+        account_dynamic_reports.report_parallel_workers. 0 or 1 computes the reports serially.
+        It is capped to a quarter of db_maxconn, the connection pool is shared by all the
+        requests of the worker.
+        '''
+        workers = int(self.env['ir.config_parameter'].sudo().get_param(
+            'account_dynamic_reports.report_parallel_workers', 0))
+        return min(workers, max(1, config['db_maxconn'] // 4))
+
+    @api.model
+    def _split_chunks(self, company_ids, ids):
+        '''
+        Splits the run in (company_id, ids) chunks, one per company and range of ids,
+        about as many as there are workers.
+        :return: list of chunks, empty when the run should not be split
+        '''
+        workers = self._get_workers()
+        if workers < 2 or not company_ids or not ids:
+            return []
+        ids = sorted(ids)
+        ranges = max(1, workers // len(company_ids))
+        size = math.ceil(len(ids) / ranges)
+        chunks = [(company_id, ids[i:i + size]) for company_id in company_ids for i in range(0, len(ids), size)]
+        return chunks if len(chunks) > 1 else []
+
+    @api.model
+    def _execute_chunks(self, query, chunk_params):
+        '''
+        Executes the query once for every params dict, each one on its own connection.
+        All the connections import the snapshot of the current transaction, so they read the
+        same state of the database as a serial run would (the changes not committed yet by
+        the current transaction excepted, the reports only read). The chunks that find the
+        connection pool full are executed afterwards on the current cursor.
+        :return: list of dictfetchall() results, in the order of chunk_params
+        '''
+        self.env.cr.execute('SELECT pg_export_snapshot()')
+        snapshot_id = self.env.cr.fetchone()[0]
+        dbname = self.env.cr.dbname
+
+        def execute(params):
+            try:
+                cr = sql_db.db_connect(dbname).cursor()
+            except PoolError:
+                return None
+            # Odoo cursors are REPEATABLE READ, the snapshot has to be set before any query
+            with closing(cr):
+                cr.execute('SET TRANSACTION SNAPSHOT %s', [snapshot_id])
+                cr.execute(query, params)
+                return cr.dictfetchall()
+
+        with ThreadPoolExecutor(max_workers=self._get_workers()) as executor:
+            results = list(executor.map(execute, chunk_params))
+        for index, params in enumerate(chunk_params):
+            if results[index] is None:
+                self.env.cr.execute(query, params)
+                results[index] = self.env.cr.dictfetchall()
+        return results
@@ -105,6 +105,19 @@ class ins_account_financial_report(models.Model):
         ], 'Financial Report Style', default='0',
         help="You can set up here the format you want this record to be displayed. If you leave the automatic formatting, it will be computed based on the financial reports hierarchy (auto-computed field 'level').")
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(ins_account_financial_report, self).create(vals_list)
+
+    def write(self, vals):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(ins_account_financial_report, self).write(vals)
+
+    def unlink(self):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(ins_account_financial_report, self).unlink()
+
 
 class CommonXlsxOut(models.TransientModel):
     _name = 'common.xlsx.out'
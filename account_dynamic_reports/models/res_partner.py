@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+from odoo import api, models
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(ResPartner, self).create(vals_list)
+
+    def write(self, vals):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(ResPartner, self).write(vals)
+
+    def unlink(self):
+        self.env['ins.report.cache']._touch_ledger()
+        return super(ResPartner, self).unlink()
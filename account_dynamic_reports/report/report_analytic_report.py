@@ -31,8 +31,8 @@ class InsReportAnalyticReport(models.AbstractModel):
         main_lines = wiz_id.prepare_main_lines()
         return main_lines
 
-    def _get_sub_lines(self, wiz_id, id_list, account_id):
-        sub_lines = wiz_id.prepare_detailed_lines(id_list, account_id)
+    def _get_sub_lines(self, wiz_id, analytic_id):
+        sub_lines = wiz_id.prepare_detailed_lines(analytic_id)
         return sub_lines
 
 
@@ -29,10 +29,11 @@ class InsReportGeneralLedger(models.AbstractModel):
 
     def _get_main_lines(self, wiz_id):
         main_lines = wiz_id.prepare_main_lines()
+        self.env['ins.report.job']._report_progress(total=len(main_lines))
         return main_lines
 
-    def _get_sub_lines(self, wiz_id, id_list, account_id):
-        sub_lines = wiz_id.prepare_detailed_lines(id_list, [], account_id)
+    def _get_sub_lines(self, wiz_id, line):
+        sub_lines = wiz_id.prepare_detailed_lines(line['account_id'], line)
         return sub_lines
 
 
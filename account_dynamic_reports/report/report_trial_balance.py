@@ -15,6 +15,7 @@ class InsReportTrialBalance(models.AbstractModel):
                      'rep': self,
                      'get_filters': self._get_filters,
                      'get_main_lines': self._get_main_lines,
+                     'report_progress': self._report_progress,
                      })
         return data
 
@@ -28,4 +29,12 @@ class InsReportTrialBalance(models.AbstractModel):
 
     def _get_main_lines(self, wiz_id):
         main_lines = wiz_id.prepare_main_lines()
+        self.env['ins.report.job']._report_progress(total=len(main_lines))
         return main_lines
+
+    def _report_progress(self):
+        '''
+        Called by the template once per account row, when the report runs in a job.
+        '''
+        self.env['ins.report.job']._report_progress()
+        return ''
@@ -32,7 +32,7 @@ export class PycusAnalyticReportLine extends Component {
             rowsPerPage: 2000,
             subLinesVisibility: false,
             viewGlVisibility: false,
-            active_ids: this.props.gl_line.id_list ? this.props.gl_line.id_list.slice(0, 2000) : [], // To hold current active ids for pagination
+            cursors: [false], // Cursor of each page already reached, pages are keyset paginated on (date, id)
             data: [], //Holds move lines data [{}],
         })
 
@@ -47,46 +47,42 @@ export class PycusAnalyticReportLine extends Component {
         }
 
         this.goToPage = async (pageNumber) => {
+            if(pageNumber < 1 || pageNumber > this.totalPages() || this.state.cursors[pageNumber - 1] === undefined){
+                return
+            }
             this.state.currentPage = pageNumber;
-            const rowsPerPage = this.state.rowsPerPage; // assuming you have this variable defined
-            const startIndex = (pageNumber - 1) * rowsPerPage;
-            const endIndex = pageNumber * rowsPerPage;
-            this.state.active_ids = this.state.account_line.id_list.slice(startIndex, endIndex);
             this.fetchMoveLines()
         }
 
         this.fetchMoveLines = async () => {
-            if(this.state.active_ids.length > 0){
-                this.state.data = await this.ormService.call(
-                    'ins.analytic.report', 'prepare_detailed_lines',
-                    [parseInt(this.state.activeId), this.state.active_ids, this.state.account_line.account_id]
+            if(this.state.account_line.size > 0){
+                const page = await this.ormService.call(
+                    'ins.analytic.report', 'prepare_detailed_page',
+                    [parseInt(this.state.activeId), this.state.account_line.analytic_id,
+                     this.state.cursors[this.state.currentPage - 1], this.state.rowsPerPage]
                     );
+                this.state.data = page.lines;
+                this.state.cursors[this.state.currentPage] = page.cursor;
             }
         }
 
     }
 
-    renderPageNumbers() {
-        const totalPages = Math.ceil(this.state.account_line.size / this.state.rowsPerPage);
-        const pageNumbers = Array.from({ length: totalPages }, (_, i) => i + 1);
-        return pageNumbers
+    totalPages() {
+        return Math.ceil(this.state.account_line.size / this.state.rowsPerPage);
     }
 
     handleHover(ev, st) {
         this.state.viewGlVisibility = st
     }
 
-    viewGlLinesAction(ev, id_list) {
+    async viewGlLinesAction(ev, analytic_id) {
         ev.preventDefault();
-        return this.action.doAction({
-            name: _t("Account Analytic Lines"),
-            type: "ir.actions.act_window",
-            res_model: "account.analytic.line",
-            domain: [["id", "in", id_list]],
-            views: [[false, "list"]],
-            view_mode: "list",
-            target: "new",
-        });
+        const action = await this.ormService.call(
+            'ins.analytic.report', 'action_view_move_lines',
+            [parseInt(this.state.activeId), analytic_id]
+            );
+        return this.action.doAction(action);
     }
 
     viewJournalEnryAction(ev, rec_id) {
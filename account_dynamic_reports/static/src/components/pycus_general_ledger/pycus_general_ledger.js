@@ -12,6 +12,7 @@ const { DateTime } = luxon;
 import { useBus, useService,  } from "@web/core/utils/hooks";
 import { PycusGeneralLedgerLine } from "../pycus_general_ledger/pycus_general_ledger_line";
 import { PycusGeneralLedgerFilters } from "../pycus_general_ledger/pycus_general_ledger_filters";
+import { PycusReportJob } from "../pycus_report_job/pycus_report_job";
 
 export class PycusGeneralLedger extends Component {
     setup(){
@@ -106,5 +107,5 @@ export class PycusGeneralLedger extends Component {
 PycusGeneralLedger.template = 'account_dynamic_reports.generalLedger';
 PycusGeneralLedger.components = {
     Dropdown, DropdownItem, DatePicker: DateTimePicker, DateTimeInput,
-    PycusGeneralLedgerLine, PycusGeneralLedgerFilters};
+    PycusGeneralLedgerLine, PycusGeneralLedgerFilters, PycusReportJob};
 registry.category('actions').add('account_dynamic_reports.action_general_ledger', PycusGeneralLedger)
\ No newline at end of file
@@ -12,6 +12,7 @@ const { DateTime } = luxon;
 import { useBus, useService,  } from "@web/core/utils/hooks";
 import { PycusPartnerLedgerLine } from "../pycus_partner_ledger/pycus_partner_ledger_line";
 import { PycusPartnerLedgerFilters } from "../pycus_partner_ledger/pycus_partner_ledger_filters";
+import { PycusReportJob } from "../pycus_report_job/pycus_report_job";
 
 export class PycusPartnerLedger extends Component {
     setup(){
@@ -105,5 +106,5 @@ export class PycusPartnerLedger extends Component {
 PycusPartnerLedger.template = 'account_dynamic_reports.partnerLedger';
 PycusPartnerLedger.components = {
     Dropdown, DropdownItem, DatePicker: DateTimePicker, DateTimeInput,
-    PycusPartnerLedgerLine, PycusPartnerLedgerFilters};
+    PycusPartnerLedgerLine, PycusPartnerLedgerFilters, PycusReportJob};
 registry.category('actions').add('account_dynamic_reports.action_partner_ledger', PycusPartnerLedger)
\ No newline at end of file
@@ -0,0 +1,68 @@
+/** @odoo-module **/
+
+const { Component, useState, onWillUnmount } = owl
+import { useService } from "@web/core/utils/hooks";
+
+const POLL_INTERVAL = 2000;
+
+export class PycusReportJob extends Component {
+    setup(){
+        this.ormService = useService("orm");
+        this.action = useService("action");
+        this.notification = useService("notification");
+        this.state = useState({
+            jobId: false,
+            jobState: false,
+            progress: 0,
+        });
+        this.timer = false;
+
+        onWillUnmount(() => {
+            clearTimeout(this.timer);
+        })
+    }
+
+    async queueXlsx($this) {
+        await this.queueJob('xlsx');
+    }
+
+    async queuePdf($this) {
+        await this.queueJob('pdf');
+    }
+
+    async queueJob(reportType) {
+        clearTimeout(this.timer);
+        const jobId = await this.ormService.call('ins.report.job', 'create_job', [this.props.model, this.props.wizardId, reportType]);
+        this.state.jobId = jobId;
+        this.state.jobState = 'queued';
+        this.state.progress = 0;
+        this.timer = setTimeout(() => this.pollJob(), POLL_INTERVAL);
+    }
+
+    async pollJob() {
+        const [job] = await this.ormService.call('ins.report.job', 'get_progress', [[this.state.jobId]]);
+        if (!job) {
+            this.state.jobState = false;
+            return;
+        }
+        this.state.jobState = job.state;
+        this.state.progress = job.progress;
+        if (job.state === 'done') {
+            this.action.doAction({type: 'ir.actions.act_url', url: job.url, target: 'new'});
+        } else if (job.state === 'failed') {
+            this.notification.add(job.error, {type: 'danger'});
+        } else {
+            this.timer = setTimeout(() => this.pollJob(), POLL_INTERVAL);
+        }
+    }
+
+    openJobs($this) {
+        this.action.doAction('account_dynamic_reports.action_ins_report_job');
+    }
+
+}
+PycusReportJob.template = 'account_dynamic_reports.reportJob';
+PycusReportJob.props = {
+    model: String,
+    wizardId: Number,
+};
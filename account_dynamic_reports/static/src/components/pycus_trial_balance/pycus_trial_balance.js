@@ -13,6 +13,7 @@ import { parseDate, formatDate } from "@web/core/l10n/dates";
 import { useBus, useService,  } from "@web/core/utils/hooks";
 import { PycusTrialBalanceLine } from "../pycus_trial_balance/pycus_trial_balance_line";
 import { PycusTrialBalanceFilters } from "../pycus_trial_balance/pycus_trial_balance_filters";
+import { PycusReportJob } from "../pycus_report_job/pycus_report_job";
 
 export class PycusTrialBalance extends Component {
     setup(){
@@ -111,5 +112,5 @@ PycusTrialBalance.template = 'account_dynamic_reports.trialBalance';
 PycusTrialBalance.components = {
     Dropdown, DropdownItem, DatePicker: DateTimePicker, DateTimeInput,
     PycusTrialBalanceLine,
-    PycusTrialBalanceFilters};
+    PycusTrialBalanceFilters, PycusReportJob};
 registry.category('actions').add('account_dynamic_reports.action_trial_balance', PycusTrialBalance)
\ No newline at end of file
@@ -5,14 +5,8 @@ import calendar
 from dateutil.relativedelta import relativedelta
 from odoo.tools import DEFAULT_SERVER_DATE_FORMAT
 import json
-import io
 from odoo.tools import date_utils
-import base64
-
-try:
-    from odoo.tools.misc import xlsxwriter
-except ImportError:
-    import xlsxwriter
+from urllib.parse import urlencode
 
 DATE_DICT = {
     '%m/%d/%Y' : 'mm/dd/yyyy',
@@ -35,6 +29,8 @@ DATE_DICT = {
     '%e-%f-%y' : 'd-m-yy'
 }
 
+FETCH_RANGE = 2000
+
 class InsAnalyticReport(models.TransientModel):
     _name = "ins.analytic.report"
 
@@ -235,6 +231,26 @@ class InsAnalyticReport(models.TransientModel):
         '''
         return sql_from
 
+    def _compute_analytic_amounts(self, analytic_ids):
+        '''
+        Amount and number of lines of every analytic account from one grouped query.
+        :param analytic_ids: list of analytic account ids
+        :return: dict {analytic_id: {'size', 'amount'}}
+        '''
+        if not analytic_ids:
+            return {}
+        sql = ('''
+            SELECT
+                anl_line.account_id AS analytic_id,
+                COUNT(anl_line.id) AS size,
+                COALESCE(SUM(anl_line.amount),0) AS amount
+            ''' + self.prepare_from() + self.prepare_where() + '''
+                AND anl_line.account_id IN %(analytic_ids)s
+            GROUP BY anl_line.account_id
+        ''')
+        self.env.cr.execute(sql, {'analytic_ids': tuple(analytic_ids)})
+        return {row['analytic_id']: row for row in self.env.cr.dictfetchall()}
+
     def prepare_main_lines(self):
         '''
         It is the method for showing summary details of each accounts. Just basic details to show up
@@ -242,10 +258,9 @@ class InsAnalyticReport(models.TransientModel):
         1. Initial Balance
         2. Current Balance
         3. Final Balance
+        Analytic lines are not listed here, they are fetched page by page with prepare_detailed_page.
         :return:
         '''
-        cr = self.env.cr
-
         analytic_company_domain = [('company_id', '=', self.env.context.get('company_id') or self.env.company.id)]
         if self.plan_ids:
             analytic_company_domain.append(('plan_id', 'in', self.plan_ids.ids))
@@ -253,31 +268,17 @@ class InsAnalyticReport(models.TransientModel):
             analytic_company_domain.append(('id', 'in', self.analytic_ids.ids))
 
         analytic_ids = self.env['account.analytic.account'].search(analytic_company_domain, order='code asc')
+        amounts = self._compute_analytic_amounts(analytic_ids.ids)
+        time_string = fields.Datetime.now().strftime('%H:%M:%S')
         analytic_lines = []
         for analytic in analytic_ids:
 
             result = {
-                'id_list': [],
                 'size': 0,
                 'amount': 0,
-                'time_string': ''
+                'time_string': '%s:%s' % (time_string, analytic.id),
             }
-            # Current
-            sql = ('''
-                SELECT
-                    array_agg(anl_line.id) AS id_list,
-                    COUNT(anl_line.id) AS size,
-                    COALESCE(SUM(anl_line.amount),0) AS amount,
-                    EXTRACT(HOUR FROM CURRENT_TIME)::TEXT || ':' ||
-                    EXTRACT(MINUTE FROM CURRENT_TIME)::TEXT || ':' ||
-                    EXTRACT(SECOND FROM CURRENT_TIME)::TEXT || ':' || '%s' AS time_string
-                ''' % str(analytic.id) + self.prepare_from() + self.prepare_where() +
-                   ''' AND anl_line.account_id = %s 
-                   ''' % analytic.id)
-            cr.execute(sql)
-            res = cr.dictfetchone() or {}
-
-            result.update(res)
+            result.update(amounts.get(analytic.id, {}))
             # Extra args
             result.update(
                 {
@@ -291,35 +292,86 @@ class InsAnalyticReport(models.TransientModel):
                 analytic_lines.append(result)
         return analytic_lines
 
-    def prepare_detailed_lines(self, move_line_ids=[], analytic_account_id=False):
-        cr = self.env.cr
-        final_list = []
-        user_language = self.env.user.lang
-
-        # Current
-        where_current = self.prepare_where() + ' AND anl_line.id in %s ' % str(tuple(move_line_ids) + tuple([0]))
+    def _fetch_detailed_rows(self, analytic_account_id, cursor=False, limit=None):
+        '''
+        Analytic lines of the analytic account in the period, ordered by (date, id).
+        :param cursor: [date, id] of the last line already fetched, False to start from the beginning
+        :param limit: maximum number of rows, None for all of them
+        '''
         sql = ('''
-                SELECT
-                    anl_line.id AS id,
-                    anl_line.date AS date,
-                    move.id AS move_id,
-                    p.name AS partner_name,
-                    j.code AS journal_code,
-                    COALESCE(a.name::jsonb ->> %(lang)s, a.name::jsonb ->> 'en_US') AS account_name,
-                    a.code_store AS account_code,
-                    COALESCE(analytic.name::jsonb ->> %(lang)s, analytic.name::jsonb ->> 'en_US') AS analytic_name,
-                    anl_line.amount AS amount,
-                    COALESCE(analytic_plan.name::jsonb ->> %(lang)s, analytic_plan.name::jsonb ->> 'en_US') AS plan,
-                    COALESCE(p_template.name::jsonb ->> %(lang)s, p_template.name::jsonb ->> 'en_US') AS product
-                    ''' + self.prepare_from() + where_current +
-                    '''
-                    GROUP BY
-                        anl_line.date, p.name, move.id, anl_line.id, j.code, a.name, a.code_store ,j.code, analytic.name, analytic_plan.name, p_template.name, anl_line.amount
-                    ORDER BY anl_line.date
-                ''')
-        cr.execute(sql, {'lang': user_language})
-        final_list += cr.dictfetchall()
-        return final_list
+            SELECT
+                anl_line.id AS id,
+                anl_line.date AS date,
+                move.id AS move_id,
+                p.name AS partner_name,
+                j.code AS journal_code,
+                COALESCE(a.name::jsonb ->> %(lang)s, a.name::jsonb ->> 'en_US') AS account_name,
+                a.code_store AS account_code,
+                COALESCE(analytic.name::jsonb ->> %(lang)s, analytic.name::jsonb ->> 'en_US') AS analytic_name,
+                anl_line.amount AS amount,
+                COALESCE(analytic_plan.name::jsonb ->> %(lang)s, analytic_plan.name::jsonb ->> 'en_US') AS plan,
+                COALESCE(p_template.name::jsonb ->> %(lang)s, p_template.name::jsonb ->> 'en_US') AS product
+            ''' + self.prepare_from() + self.prepare_where() + '''
+                AND anl_line.account_id = %(analytic_id)s
+        ''')
+        params = {'lang': self.env.user.lang, 'analytic_id': analytic_account_id, 'limit': limit}
+        if cursor:
+            sql += ' AND (anl_line.date, anl_line.id) > (%(cursor_date)s, %(cursor_id)s) '
+            params.update({'cursor_date': cursor[0], 'cursor_id': cursor[1]})
+        sql += ' ORDER BY anl_line.date, anl_line.id LIMIT %(limit)s '
+        self.env.cr.execute(sql, params)
+        return self.env.cr.dictfetchall()
+
+    def prepare_detailed_page(self, analytic_account_id, cursor=False, limit=FETCH_RANGE):
+        '''
+        One page of the analytic lines, keyset paginated on (date, id).
+        :param cursor: cursor returned with the previous page, False for the first page
+        :return: {'lines': [rows], 'cursor': cursor of the next page or False on the last page}
+        '''
+        rows = self._fetch_detailed_rows(analytic_account_id, cursor, limit + 1)
+        next_cursor = False
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = [fields.Date.to_string(rows[-1]['date']), rows[-1]['id']]
+        return {'lines': rows, 'cursor': next_cursor}
+
+    def prepare_detailed_lines(self, analytic_account_id=False):
+        return self._fetch_detailed_rows(analytic_account_id)
+
+    def _iter_detailed_lines(self, analytic_account_id=False):
+        '''
+        Same rows as prepare_detailed_lines, read FETCH_RANGE analytic lines at a time for the XLSX export.
+        '''
+        cursor = False
+        while True:
+            rows = self._fetch_detailed_rows(analytic_account_id, cursor, FETCH_RANGE)
+            yield from rows
+            if len(rows) < FETCH_RANGE:
+                break
+            cursor = [rows[-1]['date'], rows[-1]['id']]
+
+    def action_view_move_lines(self, analytic_account_id):
+        cmpny_ids = self.env.company.ids + self.env.company.child_ids.ids
+        domain = [('company_id', 'in', cmpny_ids),
+                  ('account_id', '=', analytic_account_id),
+                  ('move_line_id', '!=', False),
+                  ('date', '>=', self.date_from),
+                  ('date', '<=', self.date_to)]
+        if self.journal_ids:
+            domain.append(('journal_id', 'in', self.journal_ids.ids))
+        if self.partner_ids:
+            domain.append(('partner_id', 'in', self.partner_ids.ids))
+        if self.account_ids:
+            domain.append(('general_account_id', 'in', self.account_ids.ids))
+        return {
+            'name': _('Analytic Items'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.analytic.line',
+            'domain': domain,
+            'views': [[False, 'list']],
+            'view_mode': 'list',
+            'target': 'new',
+        }
 
     def prepare_values_for_component(self):
         self.onchange_date_range()
@@ -385,11 +437,22 @@ class InsAnalyticReport(models.TransientModel):
         return res
 
     def action_xlsx(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/account_dynamic_reports/xlsx/%s/%s?%s' % (
+                self._name, self.id, urlencode({'filename': 'Analytic Report.xlsx'})),
+            'target': 'new',
+        }
+
+    def _write_xlsx(self, workbook):
+        '''
+        Writes the report in the given workbook, which is opened in constant_memory mode:
+        the rows of each sheet have to be written in increasing order.
+        '''
         data = self.read()[0]
         # Initialize
         #############################################################
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
         sheet = workbook.add_worksheet('Analytic Report')
         sheet.set_zoom(95)
         sheet_2 = workbook.add_worksheet('Filters')
@@ -582,8 +645,8 @@ class InsAnalyticReport(models.TransientModel):
                                   line_header_left)
                 sheet.write(row_pos, 6, float(line.get('amount')), line_header)
 
-                sub_lines = record.prepare_detailed_lines(line.get('id_list'), line.get('account_id'))
                 if record.include_details == 'yes':
+                    sub_lines = record._iter_detailed_lines(line.get('analytic_id'))
                     for sub_line in sub_lines:
                         row_pos += 1
                         datestring = fields.Date.from_string(str(sub_line.get('date'))).strftime(lang_id.date_format)
@@ -594,19 +657,3 @@ class InsAnalyticReport(models.TransientModel):
                         sheet.write(row_pos, 4, sub_line.get('plan') or '', line_header_light)
                         sheet.write(row_pos, 5, sub_line.get('product') or '', line_header_light)
                         sheet.write(row_pos, 6, float(sub_line.get('amount')), line_header_light)
-
-        # Close and return
-        #################################################################
-        workbook.close()
-        output.seek(0)
-        result = base64.b64encode(output.read())
-
-        report_id = self.env['common.xlsx.out'].sudo().create({'filedata': result, 'filename': 'GL.xls'})
-        return {
-            'type': 'ir.actions.act_url',
-            'url': '/web/binary/download_document?model=common.xlsx.out&field=filedata&id=%s&filename=%s.xls' % (
-                report_id.id, 'Analytic Report.xls'),
-            'target': 'new',
-        }
-
-        output.close()
\ No newline at end of file
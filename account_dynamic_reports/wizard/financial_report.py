@@ -8,14 +8,8 @@ import calendar
 from dateutil.relativedelta import relativedelta
 from odoo.exceptions import UserError
 import json
-import io
 from odoo.tools import date_utils
-import base64
-
-try:
-    from odoo.tools.misc import xlsxwriter
-except ImportError:
-    import xlsxwriter
+from urllib.parse import urlencode
 
 DATE_DICT = {
     '%m/%d/%Y' : 'mm/dd/yyyy',
@@ -237,75 +231,121 @@ class InsFinancialReport(models.TransientModel):
                         self.comparison_date_from = datetime(date.year, 7, 1).strftime("%Y-%m-%d")
                         self.comparison_date_to = datetime(date.year + 1, 6, 30).strftime("%Y-%m-%d")
 
+    def _get_report_company_ids(self):
+        # Get the companies selected in the top-right corner (from context)
+        selected_company_ids = self.env.context.get('allowed_company_ids', [self.company_id.id])
+        # Include only the parent company and its branches that are selected
+        company_ids = []
+        # Always include the parent company if it's in selected_company_ids
+        if self.company_id.id in selected_company_ids:
+            company_ids.append(self.company_id.id)
+        # Include only branches of self.company_id that are selected
+        company_ids += [
+            branch.id for branch in self.company_id.child_ids if branch.id in selected_company_ids
+        ]
+        # Ensure at least one company ID is included to avoid empty IN clause
+        return company_ids or [self.company_id.id]
+
     def prepare_where(self):
         where = " WHERE (m.state = 'posted') "
         if self.journal_ids:
             where += ' AND j.id IN %s ' % str(tuple(self.journal_ids.ids) + tuple([0]))
         if self.company_id:
-            # Get the companies selected in the top-right corner (from context)
-            selected_company_ids = self.env.context.get('allowed_company_ids', [self.company_id.id])
-            # Include only the parent company and its branches that are selected
-            company_ids = []
-            # Always include the parent company if it's in selected_company_ids
-            if self.company_id.id in selected_company_ids:
-                company_ids.append(self.company_id.id)
-            # Include only branches of self.company_id that are selected
-            company_ids += [
-                branch.id for branch in self.company_id.child_ids if branch.id in selected_company_ids
-            ]
-            # Ensure at least one company ID is included to avoid empty IN clause
-            company_ids = company_ids or [self.company_id.id]
+            company_ids = self._get_report_company_ids()
             where += ' AND l.company_id IN %s ' % str(tuple(company_ids) + tuple([0]))
         return where
 
-    def _compute_account_balance(self, accounts, report, mode='current'):
+    def _get_account_balance_map(self, mode='current'):
+        """ compute the balance, debit and credit of every account for one period in a single
+        grouped query. Each range selection of the report heads is a FILTER over the same scan,
+        the unfiltered sums are used by the heads without range selection.
+        The months before the one of date_from come from the balance snapshot, the scan starts
+        on the first day of that month and the snapshot is added to every range but the current one.
+        :return: {account_id: {range_selection or 'all': {'debit', 'credit', 'balance'}}}
+        """
+        if mode == 'current':
+            date_from, date_to = self.date_from, self.date_to
+        else:
+            date_from, date_to = self.comparison_date_from, self.comparison_date_to
+        snapshot = self.env['ins.account.balance.snapshot']
+        ranges = {
+            'from_the_beginning': "l.date <= %(date_to)s",
+            'current_date_range': "l.date >= %(date_from)s AND l.date <= %(date_to)s",
+            'initial_date_range': "l.date < %(date_from)s",
+        }
+        select = []
+        for range_selection, condition in ranges.items():
+            for field in ['debit', 'credit', 'balance']:
+                select.append("COALESCE(SUM(l.%s) FILTER (WHERE %s), 0) AS %s_%s" % (
+                    field, condition, range_selection, field))
+        sql = """
+            SELECT
+                l.account_id AS account_id,
+                COALESCE(SUM(l.debit), 0) AS all_debit,
+                COALESCE(SUM(l.credit), 0) AS all_credit,
+                COALESCE(SUM(l.balance), 0) AS all_balance,
+                """ + ', '.join(select) + """
+            FROM account_move_line l
+            JOIN account_move m ON (l.move_id=m.id)
+            JOIN account_account a ON (l.account_id=a.id)
+            LEFT JOIN res_currency c ON (l.currency_id=c.id)
+            JOIN account_journal j ON (l.journal_id=j.id)
+        """ + self.prepare_where() + " AND l.date >= %(edge_date)s GROUP BY l.account_id"
+        self.env.cr.execute(sql, {
+            'date_from': date_from,
+            'date_to': date_to,
+            'edge_date': snapshot._get_edge_date(date_from),
+        })
+        result = {}
+        for row in self.env.cr.dictfetchall():
+            result[row['account_id']] = {
+                range_selection: {
+                    field: row['%s_%s' % (range_selection, field)] for field in ['debit', 'credit', 'balance']
+                } for range_selection in ['all'] + list(ranges)
+            }
+        company_ids = self._get_report_company_ids() if self.company_id else None
+        history = snapshot._read_balances(date_from, 'account_id', company_ids,
+                                          journal_ids=self.journal_ids.ids or None)
+        for account_id, values in history.items():
+            account_result = result.setdefault(account_id, {
+                range_selection: {'debit': 0.0, 'credit': 0.0, 'balance': 0.0}
+                for range_selection in ['all'] + list(ranges)
+            })
+            for range_selection in ['all', 'from_the_beginning', 'initial_date_range']:
+                for field in ['debit', 'credit', 'balance']:
+                    account_result[range_selection][field] += values[field]
+        return result
+
+    def _compute_account_balance(self, accounts, report, mode='current', balance_map=None):
         """ compute the balance, debit and credit for the provided accounts
         """
-        cr = self.env.cr
         # Validation
         if report.type in ['accounts','account_type'] and not report.range_selection:
             raise UserError(_('Please choose "Custom Date Range" for the report head %s') % (report.name))
 
-        where = self.prepare_where()
+        if balance_map is None:
+            balance_map = self._get_account_balance_map(mode=mode)
         # Range Based Separation
+        range_selection = 'all'
         if report.type in ['accounts', 'account_type']:
-            if mode == 'current':
-                if report.range_selection == 'from_the_beginning':
-                    where += " AND l.date <= '%s'" % self.date_to
-                if report.range_selection == 'current_date_range':
-                    where += " AND l.date >= '%s' AND l.date <= '%s'" % (self.date_from, self.date_to)
-                if report.range_selection == 'initial_date_range':
-                    where += " AND l.date < '%s'" % self.date_from
-            else:
-                if report.range_selection == 'from_the_beginning':
-                    where += " AND l.date <= '%s'" % self.comparison_date_to
-                if report.range_selection == 'current_date_range':
-                    where += " AND l.date >= '%s' AND l.date <= '%s'" % (self.comparison_date_from, self.comparison_date_to)
-                if report.range_selection == 'initial_date_range':
-                    where += " AND l.date < '%s'" % self.comparison_date_from
+            range_selection = report.range_selection
         result = {}
         for account in accounts:
-            new_where = where + " AND a.id = %s " % account.id
-            sql = """
-                SELECT
-                    COALESCE(SUM(debit), 0) as debit,
-                    COALESCE(SUM(credit), 0) as credit,
-                    COALESCE(SUM(balance), 0) as balance
-                FROM account_move_line l
-                JOIN account_move m ON (l.move_id=m.id)
-                JOIN account_account a ON (l.account_id=a.id)
-                LEFT JOIN res_currency c ON (l.currency_id=c.id)
-                JOIN account_journal j ON (l.journal_id=j.id)
-            """ + new_where
-            cr.execute(sql)
-            financial = cr.dictfetchone()
+            financial = balance_map.get(account.id, {}).get(range_selection)
             result.update({
-                account.id: financial
+                account.id: dict(financial or {'debit': 0.0, 'credit': 0.0, 'balance': 0.0})
             })
         return result
 
-    def _compute_report_balance(self, reports, mode='current'):
-        res = {}
+    def _compute_report_balance(self, reports, mode='current', balance_map=None, res=None):
+        """ compute the report heads from the account balances of the period. The account
+        balances are fetched once per mode and the results of the heads are shared through
+        the whole tree, so a head referenced several times is only aggregated once.
+        """
+        if balance_map is None:
+            balance_map = self._get_account_balance_map(mode=mode)
+        if res is None:
+            res = {}
         fields = ['credit', 'debit', 'balance']
         for report in reports:
             if report.id in res:
@@ -314,7 +354,8 @@ class InsFinancialReport(models.TransientModel):
             if report.type == 'accounts':
                 if self.account_report_id != self.env.ref(
                         'account_dynamic_reports.ins_account_financial_report_cashflow0'):
-                    res[report.id]['account'] = self._compute_account_balance(report.account_ids, report, mode=mode)
+                    res[report.id]['account'] = self._compute_account_balance(
+                        report.account_ids, report, mode=mode, balance_map=balance_map)
                     for value in res[report.id]['account'].values():
                         for field in fields:
                             res[report.id][field] += value.get(field)
@@ -324,7 +365,8 @@ class InsFinancialReport(models.TransientModel):
                         self.env.ref('account_dynamic_reports.ins_account_financial_report_investing_cash_in'),
                         self.env.ref('account_dynamic_reports.ins_account_financial_report_financial_cash_in')]:
 
-                        res2 = self._compute_account_balance(report.parent_id.account_ids, report, mode=mode)
+                        res2 = self._compute_account_balance(
+                            report.parent_id.account_ids, report, mode=mode, balance_map=balance_map)
                         for key, value in res2.items():
                             res[report.id]['debit'] += value['debit']
                             res[report.id]['balance'] += value['debit']
@@ -333,12 +375,14 @@ class InsFinancialReport(models.TransientModel):
                         self.env.ref('account_dynamic_reports.ins_account_financial_report_investing_cash_out'),
                         self.env.ref('account_dynamic_reports.ins_account_financial_report_financial_cash_out')]:
 
-                        res2 = self._compute_account_balance(report.parent_id.account_ids, report, mode=mode)
+                        res2 = self._compute_account_balance(
+                            report.parent_id.account_ids, report, mode=mode, balance_map=balance_map)
                         for key, value in res2.items():
                             res[report.id]['credit'] += value['credit']
                             res[report.id]['balance'] += -(value['credit'])
                     else:
-                        res[report.id]['account'] = self._compute_account_balance(report.account_ids, report, mode=mode)
+                        res[report.id]['account'] = self._compute_account_balance(
+                            report.account_ids, report, mode=mode, balance_map=balance_map)
                         for value in res[report.id]['account'].values():
                             for field in fields:
                                 res[report.id][field] += value.get(field)
@@ -348,24 +392,27 @@ class InsFinancialReport(models.TransientModel):
                 accounts = self.env['account.account'].search(
                     [('account_type', 'in', report.account_type_ids.mapped('type'))]
                 )
-                res[report.id]['account'] = self._compute_account_balance(accounts, report, mode=mode)
+                res[report.id]['account'] = self._compute_account_balance(
+                    accounts, report, mode=mode, balance_map=balance_map)
                 for value in res[report.id]['account'].values():
                     for field in fields:
                         res[report.id][field] += value.get(field)
             elif report.type == 'account_report' and report.account_report_id:
                 # it's the amount of the linked report
-                res2 = self._compute_report_balance(report.account_report_id, mode=mode)
-                for key, value in res2.items():
-                    for field in fields:
-                        res[report.id][field] += value[field]
+                self._compute_report_balance(
+                    report.account_report_id, mode=mode, balance_map=balance_map, res=res)
+                for field in fields:
+                    res[report.id][field] += res[report.account_report_id.id][field]
             elif report.type == 'sum':
                 # it's the sum of the children of this account.report
-                res2 = self._compute_report_balance(report.children_ids, mode=mode)
-                for key, value in res2.items():
+                self._compute_report_balance(
+                    report.children_ids, mode=mode, balance_map=balance_map, res=res)
+                for child in report.children_ids:
                     for field in fields:
-                        res[report.id][field] += value[field]
+                        res[report.id][field] += res[child.id][field]
                 accounts = report.account_ids
-                res[report.id]['account'] = self._compute_account_balance(accounts, report, mode=mode)
+                res[report.id]['account'] = self._compute_account_balance(
+                    accounts, report, mode=mode, balance_map=balance_map)
                 for values in res[report.id]['account'].values():
                     for field in fields:
                         res[report.id][field] += values.get(field)
@@ -432,6 +479,12 @@ class InsFinancialReport(models.TransientModel):
             return round(percentage, 2)
 
     def get_account_lines(self):
+        '''
+        Served from ins.report.cache, the report only reads posted entries.
+        '''
+        return self.env['ins.report.cache']._get_or_compute(self, '_get_account_lines')
+
+    def _get_account_lines(self):
         lines = []
         account_report = self.account_report_id
         child_reports = account_report._get_children_by_order(strict_range=True)
@@ -710,11 +763,22 @@ class InsFinancialReport(models.TransientModel):
         return res
 
     def action_xlsx(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/account_dynamic_reports/xlsx/%s/%s?%s' % (
+                self._name, self.id, urlencode({'filename': '%s.xlsx' % self.report_name})),
+            'target': 'new',
+        }
+
+    def _write_xlsx(self, workbook):
+        '''
+        Writes the report in the given workbook, which is opened in constant_memory mode:
+        the rows of each sheet have to be written in increasing order.
+        '''
         data = self.read()[0]
         # Initialize
         #############################################################
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
         sheet = workbook.add_worksheet(data['account_report_id'][1])
         sheet.set_zoom(95)
         sheet2 = workbook.add_worksheet('Filters')
@@ -895,19 +959,3 @@ class InsFinancialReport(models.TransientModel):
             sheet.write(row_pos, 2, float(line.get('balance') or 0), tmp_style_num)
             if filter['comparison_range_string']:
                 sheet.write(row_pos, 3, float(line.get('percentage_change') or 0), tmp_style_num)
-
-        # Close and return
-        #################################################################
-        workbook.close()
-        output.seek(0)
-        result = base64.b64encode(output.read())
-        report_id = self.env['common.xlsx.out'].sudo().create({'filedata': result, 'filename': 'FIN.xls'})
-
-        return {
-            'type': 'ir.actions.act_url',
-            'url': '/web/binary/download_document?model=common.xlsx.out&field=filedata&id=%s&filename=%s.xls' % (
-                report_id.id, filter['report_name']),
-            'target': 'new',
-        }
-
-        output.close()
@@ -5,14 +5,8 @@ import calendar
 from dateutil.relativedelta import relativedelta
 from odoo.tools import DEFAULT_SERVER_DATE_FORMAT
 import json
-import io
 from odoo.tools import date_utils
-import base64
-
-try:
-    from odoo.tools.misc import xlsxwriter
-except ImportError:
-    import xlsxwriter
+from urllib.parse import urlencode
 
 DATE_DICT = {
     '%m/%d/%Y' : 'mm/dd/yyyy',
@@ -275,16 +269,76 @@ class InsGeneralLedger(models.TransientModel):
         '''
         return sql_from
 
+    def _compute_account_totals(self, account_ids):
+        '''
+        Computes initial, current and ending totals of every account in one grouped query.
+        Each section is a FILTER over the same scan of the ledger up to date_to.
+        For posted entries the months before date_from come from the balance snapshot,
+        so the scan starts on the first day of the month of date_from.
+        :param account_ids: list of account ids
+        :return: dict {account_id: {'size', 'debit', 'credit', 'balance', 'initial_*', 'ending_*'}}
+        '''
+        if not account_ids:
+            return {}
+        snapshot = self.env['ins.account.balance.snapshot']
+        use_snapshot = self.target_moves == 'posted_only'
+        params = {
+            'date_from': self.date_from,
+            'account_ids': tuple(account_ids),
+        }
+        where = self.prepare_where(mode='ending')
+        if use_snapshot:
+            where += ' AND l.date >= %(edge_date)s '
+            params['edge_date'] = snapshot._get_edge_date(self.date_from)
+        sql = ('''
+            SELECT
+                l.account_id AS account_id,
+                COUNT(l.id) FILTER (WHERE l.date >= %(date_from)s) AS size,
+                COALESCE(SUM(l.debit) FILTER (WHERE l.date >= %(date_from)s),0) AS debit,
+                COALESCE(SUM(l.credit) FILTER (WHERE l.date >= %(date_from)s),0) AS credit,
+                COALESCE(SUM(l.debit - l.credit) FILTER (WHERE l.date >= %(date_from)s),0) AS balance,
+                COALESCE(SUM(l.debit) FILTER (WHERE l.date < %(date_from)s),0) AS initial_debit,
+                COALESCE(SUM(l.credit) FILTER (WHERE l.date < %(date_from)s),0) AS initial_credit,
+                COALESCE(SUM(l.debit - l.credit) FILTER (WHERE l.date < %(date_from)s),0) AS initial_balance,
+                COALESCE(SUM(l.debit),0) AS ending_debit,
+                COALESCE(SUM(l.credit),0) AS ending_credit,
+                COALESCE(SUM(l.debit - l.credit),0) AS ending_balance
+            ''' + self.prepare_from() + where +
+            ''' AND l.account_id IN %(account_ids)s
+            GROUP BY l.account_id
+        ''')
+        self.env.cr.execute(sql, params)
+        totals = {row['account_id']: row for row in self.env.cr.dictfetchall()}
+        if use_snapshot:
+            history = snapshot._read_balances(
+                self.date_from, 'account_id', self.env.company.ids + self.env.company.child_ids.ids,
+                account_ids=account_ids,
+                partner_ids=self.partner_ids.ids or None,
+                journal_ids=self.journal_ids.ids or None)
+            snapshot._merge_history(totals, history, ['initial_', 'ending_'],
+                                    {'size': 0, 'debit': 0, 'credit': 0, 'balance': 0})
+        return totals
+
     def prepare_main_lines(self):
+        '''
+        Served from ins.report.cache when only posted entries are reported,
+        computed by _prepare_main_lines otherwise.
+        '''
+        if self.target_moves == 'posted_only':
+            return self.env['ins.report.cache']._get_or_compute(self, '_prepare_main_lines')
+        return self._prepare_main_lines()
+
+    def _prepare_main_lines(self):
         '''
         It is the method for showing summary details of each accounts. Just basic details to show up
         Three sections,
         1. Initial Balance
         2. Current Balance
         3. Final Balance
+        All accounts are computed together by _compute_account_totals. Move lines are
+        not listed here, they are fetched page by page with prepare_detailed_page.
         :return:
         '''
-        cr = self.env.cr
         account_company_domain = []
         if self.account_tag_ids:
             account_company_domain.append(('tag_ids', 'in', self.account_tag_ids.ids))
@@ -292,34 +346,23 @@ class InsGeneralLedger(models.TransientModel):
             account_company_domain.append(('id', 'in', self.account_ids.ids))
 
         account_ids = self.env['account.account'].search(account_company_domain, order='code_store asc')
+        totals = self._compute_account_totals(account_ids.ids)
         gl_lines = []
         for account in account_ids:
 
             result = {
-                'id_list': [],
                 'size': 0,
                 'debit': 0,
                 'credit': 0,
-                'balance': 0
+                'balance': 0,
+                'initial_debit': 0,
+                'initial_credit': 0,
+                'initial_balance': 0,
+                'ending_debit': 0,
+                'ending_credit': 0,
+                'ending_balance': 0,
             }
-            # Current
-            sql = ('''
-                SELECT
-                    array_agg(l.id) AS id_list,
-                    COUNT(l.id) AS size,
-                    COALESCE(SUM(l.debit),0) AS debit, 
-                    COALESCE(SUM(l.credit),0) AS credit, 
-                    COALESCE(SUM(l.debit - l.credit),0) AS balance,
-                    EXTRACT(HOUR FROM CURRENT_TIME)::TEXT || ':' ||
-                    EXTRACT(MINUTE FROM CURRENT_TIME)::TEXT || ':' ||
-                    EXTRACT(SECOND FROM CURRENT_TIME)::TEXT || ':' || '%s' AS time_string
-                ''' % str(account.id) + self.prepare_from() + self.prepare_where(mode='strict') +
-                   ''' AND l.account_id = %s 
-                   ''' % account.id)
-            cr.execute(sql)
-            res = cr.dictfetchone() or {}
-
-            result.update(res)
+            result.update(totals.get(account.id, {}))
             # Extra args
             result.update(
                 {
@@ -327,6 +370,7 @@ class InsGeneralLedger(models.TransientModel):
                     'account_name': account.name,
                     'account_code': account.code,
                     'currency_id': self.currency_id.id,
+                    'time_string': '%s:%s' % (fields.Datetime.now().strftime('%H:%M:%S'), account.id),
                 }
             )
 
@@ -334,86 +378,105 @@ class InsGeneralLedger(models.TransientModel):
                 continue
 
             gl_lines.append(result)
+
         return gl_lines
 
-    def prepare_detailed_lines(self, move_line_ids=[], previous_move_line_ids=[], account_id=False):
-        cr = self.env.cr
-        balance_previous_page = 0
-        final_list = []
-
-        # Previous page balance
-        if previous_move_line_ids:
-            where_current = self.prepare_where(mode='strict') + ' AND l.id in %s ' % str(
-                tuple(previous_move_line_ids) + tuple([0]))
-            sql = ('''
-                        SELECT
-                            COALESCE(SUM(l.debit - l.credit),0) AS balance
-                            ''' + self.prepare_from() + where_current +
-                ''' AND l.account_id = %s 
-            ''' % account_id)
-            cr.execute(sql)
-            dt_previous_period = cr.dictfetchone()
-            balance_previous_page = dt_previous_period.get('balance') or 0
-
-        # Initial
-        if self.include_initial_balance == 'yes':
-            where_initial = self.prepare_where(mode='initial')
-            sql = ('''
-                    SELECT
-                        'initial' AS ttype,
-                        COALESCE(SUM(l.debit),0) AS debit, 
-                        COALESCE(SUM(l.credit),0) AS credit, 
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                        ''' + self.prepare_from() + where_initial +
-                        ''' AND l.account_id = %s 
-               ''' % account_id)
-            cr.execute(sql)
-            dt_initial = cr.dictfetchone()
-            dt_initial.update({'lid': str(account_id)+'initial'})
-            final_list.append(dt_initial)
-
-        # Current
-        where_current = self.prepare_where(mode='strict') + ' AND l.id in %s ' % str(tuple(move_line_ids) + tuple([0]))
+    def _prepare_balance_row(self, ttype, account_id, totals):
+        return {
+            'ttype': ttype,
+            'lid': str(account_id) + ttype,
+            'debit': totals.get(ttype + '_debit', 0),
+            'credit': totals.get(ttype + '_credit', 0),
+            'balance': totals.get(ttype + '_balance', 0),
+        }
+
+    def _fetch_detailed_rows(self, account_id, cursor=False, limit=None):
+        '''
+        Move lines of the account in the period, ordered by (date, id).
+        :param cursor: [date, id, ...] of the last line already fetched, False to start from the beginning
+        :param limit: maximum number of rows, None for all of them
+        '''
         sql = ('''
-                SELECT
-                    'strict' AS ttype,
-                    l.id AS lid,
-                    l.date AS ldate,
-                    j.code AS lcode,
-                    p.name AS partner_name,
-                    m.name AS move_name,
-                    m.id AS move_id,
-                    l.name AS lname,
-                    l.debit AS debit,
-                    l.credit AS credit,
-                    (l.debit - l.credit) AS balance
-                    ''' + self.prepare_from() + where_current +
-                    ''' AND l.account_id = %s 
-                    GROUP BY
-                        l.date, l.id, m.id ,j.code, p.name, m.name, l.name, l.debit, l.credit
-                    ORDER BY l.date
-                ''' % account_id)
-        cr.execute(sql)
-        final_list += cr.dictfetchall()
-
-        # Ending
+            SELECT
+                'strict' AS ttype,
+                l.id AS lid,
+                l.date AS ldate,
+                j.code AS lcode,
+                p.name AS partner_name,
+                m.name AS move_name,
+                m.id AS move_id,
+                l.name AS lname,
+                l.debit AS debit,
+                l.credit AS credit,
+                (l.debit - l.credit) AS balance
+            ''' + self.prepare_from() + self.prepare_where(mode='strict') + '''
+                AND l.account_id = %(account_id)s
+        ''')
+        params = {'account_id': account_id, 'limit': limit}
+        if cursor:
+            sql += ' AND (l.date, l.id) > (%(cursor_date)s, %(cursor_id)s) '
+            params.update({'cursor_date': cursor[0], 'cursor_id': cursor[1]})
+        sql += ' ORDER BY l.date, l.id LIMIT %(limit)s '
+        self.env.cr.execute(sql, params)
+        return self.env.cr.dictfetchall()
+
+    def prepare_detailed_page(self, account_id, cursor=False, limit=FETCH_RANGE):
+        '''
+        One page of the account's move lines, keyset paginated on (date, id).
+        Initial balance comes with the first page and ending balance with the last one.
+        The cursor also carries the running balance at the end of its page.
+        :param cursor: cursor returned with the previous page, False for the first page
+        :return: {'lines': [rows], 'cursor': cursor of the next page or False on the last page}
+        '''
+        rows = self._fetch_detailed_rows(account_id, cursor, limit + 1)
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        totals = {}
+        if self.include_initial_balance == 'yes' and (not cursor or not has_next):
+            totals = self._compute_account_totals([account_id]).get(account_id, {})
+        if not cursor and self.include_initial_balance == 'yes':
+            rows.insert(0, self._prepare_balance_row('initial', account_id, totals))
+        rows = self.prepare_nunning_balance(rows, cursor[2] if cursor else 0)
+        next_cursor = False
+        if has_next:
+            next_cursor = [fields.Date.to_string(rows[-1]['ldate']), rows[-1]['lid'], rows[-1]['balance']]
+        elif self.include_initial_balance == 'yes':
+            rows.append(self._prepare_balance_row('ending', account_id, totals))
+        return {'lines': rows, 'cursor': next_cursor}
+
+    def prepare_detailed_lines(self, account_id=False, totals=None):
+        '''
+        All the move lines of the account, used by the PDF export.
+        :param totals: the account's main line, to avoid recomputing its initial and ending balances
+        '''
+        return list(self._iter_detailed_lines(account_id, totals))
+
+    def _iter_detailed_lines(self, account_id=False, totals=None):
+        '''
+        Same rows as prepare_detailed_lines, read FETCH_RANGE move lines at a time so that
+        the XLSX export holds one page of the account in memory, whatever its size.
+        '''
+        balance = 0
+        if self.include_initial_balance == 'yes':
+            if totals is None:
+                totals = self._compute_account_totals([account_id]).get(account_id, {})
+            initial = self._prepare_balance_row('initial', account_id, totals)
+            balance = initial['balance']
+            yield initial
+        cursor = False
+        while True:
+            rows = self._fetch_detailed_rows(account_id, cursor, FETCH_RANGE)
+            if not rows:
+                break
+            rows = self.prepare_nunning_balance(rows, balance)
+            balance = rows[-1]['balance']
+            yield from rows
+            if len(rows) < FETCH_RANGE:
+                break
+            cursor = [rows[-1]['ldate'], rows[-1]['lid']]
         if self.include_initial_balance == 'yes':
-            where_ending = self.prepare_where(mode='ending')
-            sql = ('''
-                    SELECT
-                        'ending' AS ttype,
-                        COALESCE(SUM(l.debit),0) AS debit, 
-                        COALESCE(SUM(l.credit),0) AS credit, 
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                        ''' + self.prepare_from() + where_ending +
-                        ''' AND l.account_id = %s 
-                    ''' % account_id)
-            cr.execute(sql)
-            dt_ending = cr.dictfetchone()
-            dt_ending.update({'lid': str(account_id) + 'ending'})
-            final_list.append(dt_ending)
-        fdata = self.prepare_nunning_balance(final_list, balance_previous_page)
-        return fdata
+            yield self._prepare_balance_row('ending', account_id, totals)
+        self.env['ins.report.job']._report_progress()
 
     def prepare_nunning_balance(self, data=[], balance_previous_page=0):
         initial_balance = balance_previous_page
@@ -425,6 +488,34 @@ class InsGeneralLedger(models.TransientModel):
                 dt['balance'] = initial_balance
         return data
 
+    def _get_move_line_domain(self, account_id):
+        '''
+        Domain equivalent of prepare_where(mode='strict') for the given account.
+        '''
+        cmpny_ids = self.env.company.ids + self.env.company.child_ids.ids
+        domain = [('company_id', 'in', cmpny_ids),
+                  ('account_id', '=', account_id),
+                  ('date', '>=', self.date_from),
+                  ('date', '<=', self.date_to)]
+        if self.journal_ids:
+            domain.append(('journal_id', 'in', self.journal_ids.ids))
+        if self.partner_ids:
+            domain.append(('partner_id', 'in', self.partner_ids.ids))
+        if self.target_moves == 'posted_only':
+            domain.append(('parent_state', '=', 'posted'))
+        return domain
+
+    def action_view_move_lines(self, account_id):
+        return {
+            'name': _('Account Move Lines'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.move.line',
+            'domain': self._get_move_line_domain(account_id),
+            'views': [[False, 'list']],
+            'view_mode': 'list',
+            'target': 'new',
+        }
+
     def prepare_values_for_component(self):
         self.onchange_date_range()
         model_id = self.env['ir.model'].sudo().search([('model', '=', 'ins.general.ledger')], limit=1)
@@ -499,11 +590,22 @@ class InsGeneralLedger(models.TransientModel):
         return res
 
     def action_xlsx(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/account_dynamic_reports/xlsx/%s/%s?%s' % (
+                self._name, self.id, urlencode({'filename': 'General Ledger.xlsx'})),
+            'target': 'new',
+        }
+
+    def _write_xlsx(self, workbook):
+        '''
+        Writes the report in the given workbook, which is opened in constant_memory mode:
+        the rows of each sheet have to be written in increasing order.
+        '''
         data = self.read()[0]
         # Initialize
         #############################################################
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
         sheet = workbook.add_worksheet('General Ledger')
         sheet.set_zoom(95)
         sheet_2 = workbook.add_worksheet('Filters')
@@ -514,6 +616,7 @@ class InsGeneralLedger(models.TransientModel):
 
         filter = record.prepare_values_for_component()
         account_lines = record.prepare_main_lines()
+        self.env['ins.report.job']._report_progress(total=len(account_lines))
 
         # Formats
         ############################################################
@@ -715,7 +818,7 @@ class InsGeneralLedger(models.TransientModel):
                 sheet.write(row_pos, 5, float(line.get('credit')), line_header)
                 sheet.write(row_pos, 6, float(line.get('balance')), line_header)
 
-                sub_lines = record.prepare_detailed_lines(line.get('id_list'), [], line.get('account_id'))
+                sub_lines = record._iter_detailed_lines(line.get('account_id'), line)
 
 
                 for sub_line in sub_lines:
@@ -741,19 +844,3 @@ class InsGeneralLedger(models.TransientModel):
                         sheet.write(row_pos, 4, float(sub_line.get('debit')), line_header_light_ending)
                         sheet.write(row_pos, 5, float(sub_line.get('credit')), line_header_light_ending)
                         sheet.write(row_pos, 6, float(sub_line.get('balance')), line_header_light_ending)
-
-        # Close and return
-        #################################################################
-        workbook.close()
-        output.seek(0)
-        result = base64.b64encode(output.read())
-
-        report_id = self.env['common.xlsx.out'].sudo().create({'filedata': result, 'filename': 'GL.xls'})
-        return {
-            'type': 'ir.actions.act_url',
-            'url': '/web/binary/download_document?model=common.xlsx.out&field=filedata&id=%s&filename=%s.xls' % (
-            report_id.id, 'General Ledger.xls'),
-            'target': 'new',
-        }
-
-        output.close()
@@ -5,14 +5,8 @@ import calendar
 from dateutil.relativedelta import relativedelta
 from odoo.tools import DEFAULT_SERVER_DATE_FORMAT
 import json
-import io
 from odoo.tools import date_utils
-import base64
-
-try:
-    from odoo.tools.misc import xlsxwriter
-except ImportError:
-    import xlsxwriter
+from urllib.parse import urlencode
 
 FETCH_RANGE = 2500
 
@@ -159,6 +153,127 @@ class InsPartnerAgeing(models.TransientModel):
         }
         return periods
 
+    def _prepare_bucket_case(self, period_dict):
+        '''
+        Builds the CASE expression that assigns a move line to its bucket key
+        from COALESCE(date_maturity, date), with the boundaries of prepare_bucket_list.
+        :return: sql string, params dict
+        '''
+        whens = []
+        params = {}
+        for period in period_dict:
+            start = period_dict[period].get('start')
+            stop = period_dict[period].get('stop')
+            if start and stop:
+                whens.append("WHEN COALESCE(l.date_maturity,l.date) BETWEEN %%(stop_%s)s AND %%(start_%s)s THEN %s" % (
+                    period, period, period))
+                params.update({'stop_%s' % period: stop, 'start_%s' % period: start})
+            elif not start:
+                whens.append("WHEN COALESCE(l.date_maturity,l.date) >= %%(stop_%s)s THEN %s" % (period, period))
+                params['stop_%s' % period] = stop
+            else:
+                whens.append("WHEN COALESCE(l.date_maturity,l.date) <= %%(start_%s)s THEN %s" % (period, period))
+                params['start_%s' % period] = start
+        return "CASE %s ELSE NULL END" % ' '.join(whens), params
+
+    def _get_account_types(self):
+        type = ('asset_receivable', 'liability_payable')
+        if self.report_type:
+            type = tuple([self.report_type, 'none'])
+        return type
+
+    def _prepare_aged_where(self, account_types):
+        '''
+        Conditions on the move lines taken into the ageing, shared by the summary and the details.
+        :return: sql string, params dict
+        '''
+        where = """
+            l.balance <> 0
+            AND m.state = 'posted'
+            AND a.account_type IN %(account_types)s
+            AND l.company_id = %(company_id)s
+        """
+        params = {
+            'as_on_date': self.as_on_date,
+            'account_types': tuple(account_types),
+            'company_id': self.env.company.id,
+        }
+        if self.account_ids:
+            where += " AND a.id IN %(account_ids)s "
+            params['account_ids'] = tuple(self.account_ids.ids)
+        return where, params
+
+    def _prepare_partial_query(self):
+        '''
+        Partial reconciles up to as_on_date summed per move line of the partners in
+        %(partner_ids)s, positive when the line is credited and negative when debited.
+        Shared by the summary and the detailed lines, so that they always agree.
+        '''
+        return """
+                SELECT move_line_id, SUM(amount) AS amount
+                FROM (
+                    SELECT credit_move_id AS move_line_id, amount
+                    FROM account_partial_reconcile
+                    WHERE max_date <= %(as_on_date)s
+                        AND credit_move_id IN (
+                            SELECT id FROM account_move_line WHERE partner_id IN %(partner_ids)s)
+                    UNION ALL
+                    SELECT debit_move_id AS move_line_id, -amount
+                    FROM account_partial_reconcile
+                    WHERE max_date <= %(as_on_date)s
+                        AND debit_move_id IN (
+                            SELECT id FROM account_move_line WHERE partner_id IN %(partner_ids)s)
+                ) pr
+                GROUP BY move_line_id
+        """
+
+    def _compute_ageing_buckets(self, period_dict, partner_ids, account_types):
+        '''
+        Computes the open amount of every partner for every bucket in a single statement.
+        Partial reconciles up to as_on_date are pre-aggregated once per move line in a CTE
+        (see _prepare_partial_query) and joined to the lines.
+        :return: dict {partner_id: {'range_<period>': amount, 'size': number of open move lines}}
+        '''
+        if not partner_ids:
+            return {}
+        bucket_case, params = self._prepare_bucket_case(period_dict)
+        where, where_params = self._prepare_aged_where(account_types)
+        params.update(where_params)
+        ranges = ', '.join(
+            "COALESCE(SUM(amount) FILTER (WHERE bucket = %s), 0) AS range_%s" % (period, period)
+            for period in period_dict)
+        sql = """
+            WITH partial AS (""" + self._prepare_partial_query() + """),
+            aged AS (
+                SELECT
+                    l.id AS id,
+                    l.partner_id AS partner_id,
+                    l.balance + COALESCE(partial.amount, 0) AS amount,
+                    """ + bucket_case + """ AS bucket
+                FROM
+                    account_move_line AS l
+                LEFT JOIN
+                    account_move AS m ON m.id = l.move_id
+                LEFT JOIN
+                    account_account AS a ON a.id = l.account_id
+                LEFT JOIN
+                    partial ON partial.move_line_id = l.id
+                WHERE
+                    """ + where + """
+                    AND l.partner_id IN %(partner_ids)s
+            )
+            SELECT
+                partner_id,
+                """ + ranges + """,
+                COUNT(*) FILTER (WHERE amount <> 0) AS size
+            FROM aged
+            WHERE bucket IS NOT NULL
+            GROUP BY partner_id
+        """
+        params['partner_ids'] = tuple(partner_ids)
+        self.env.cr.execute(sql, params)
+        return {row['partner_id']: row for row in self.env.cr.dictfetchall()}
+
     def prepare_main_lines(self):
         ''' Query Start Here
                 ['partner_id':
@@ -170,7 +285,7 @@ class InsPartnerAgeing(models.TransientModel):
                     'as_on_date_amount': 0.0,
                     'total': 0.0}]
                 1. Prepare bucket range list from bucket values
-                2. Fetch partner_ids and loop through bucket range for values
+                2. Compute every partner and bucket together with _compute_ageing_buckets
                 '''
         period_dict = self.prepare_bucket_list()
 
@@ -184,23 +299,9 @@ class InsPartnerAgeing(models.TransientModel):
             domain.append(('category_id', 'in', self.partner_category_ids.ids))
 
         partner_ids = self.partner_ids or self.env['res.partner'].search(domain)
-        as_on_date = self.as_on_date
         company_currency_id = self.env.company.currency_id.id
-        company_id = self.env.company
-
-        type = ('asset_receivable', 'liability_payable')
-        if self.report_type:
-            type = tuple([self.report_type, 'none'])
-
-        partner_dict = {}
-        for partner in partner_ids:
-            partner_dict.update({partner.id: {}})
 
-        partner_dict.update({'Total': {}})
-        for period in period_dict:
-            partner_dict['Total'].update({period_dict[period]['name']: 0.0})
-        partner_dict['Total'].update({'total': 0.0, 'partner_name': 'ZZZZZZZZZ'})
-        partner_dict['Total'].update({'company_currency_id': company_currency_id})
+        buckets = self._compute_ageing_buckets(period_dict, partner_ids.ids, self._get_account_types())
 
         ageing_lines = []
         total = {
@@ -208,85 +309,26 @@ class InsPartnerAgeing(models.TransientModel):
             'partner_name': 'Total',
             'currency_id': company_currency_id
         }
+        for period in period_dict:
+            total.update({period_dict[period]['name']: 0})
+
         for partner in partner_ids:
+            res = buckets.get(partner.id)
+            if not res:
+                continue
             age_dict = {
                 'partner_name': partner.name,
                 'partner_id': partner.id,
-                'id_list': [],
-                'size': 0,
+                'size': res.get('size') or 0,
                 'currency_id': company_currency_id,
-                'total': 0
+                'total': 0,
+                'time_string': fields.Datetime.now().strftime("%H:%M:%S") + str(partner.id)
             }
-            id_list = []
             for period in period_dict:
+                amount = res.get('range_%s' % period) or 0.0
+                age_dict.update({period_dict[period]['name']: amount})
+                age_dict['total'] += amount
 
-                total.update({period_dict[period]['name']: 0})
-
-                where = " AND l.partner_id = %s AND COALESCE(l.date_maturity,l.date) " % partner.id
-                if period_dict[period].get('start') and period_dict[period].get('stop'):
-                    where += " BETWEEN '%s' AND '%s'" % (
-                        period_dict[period].get('stop'), period_dict[period].get('start'))
-                elif not period_dict[period].get('start'):  # ie just
-                    where += " >= '%s'" % (period_dict[period].get('stop'))
-                else:
-                    where += " <= '%s'" % (period_dict[period].get('start'))
-
-                if self.account_ids:
-                    where += " AND a.id in %s " % str(tuple(self.account_ids.ids) + tuple([0]))
-
-                sql = """
-                            SELECT
-                                array_agg(l.id) AS id_list,
-                                sum(
-                                    l.balance
-                                    ) AS balance,
-                                sum(
-                                    COALESCE(
-                                        (SELECT 
-                                            SUM(amount)
-                                        FROM account_partial_reconcile
-                                        WHERE credit_move_id = l.id AND max_date <= '%s'), 0
-                                        )
-                                    ) AS sum_debit,
-                                sum(
-                                    COALESCE(
-                                        (SELECT 
-                                            SUM(amount) 
-                                        FROM account_partial_reconcile 
-                                        WHERE debit_move_id = l.id AND max_date <= '%s'), 0
-                                        )
-                                    ) AS sum_credit
-                            FROM
-                                account_move_line AS l
-                            LEFT JOIN
-                                account_move AS m ON m.id = l.move_id
-                            LEFT JOIN
-                                account_account AS a ON a.id = l.account_id
-                            WHERE
-                                l.balance <> 0
-                                AND m.state = 'posted'
-                                AND a.account_type IN %s
-                                AND l.company_id = %s
-                        """ % (as_on_date, as_on_date, type, company_id.id)
-                self.env.cr.execute(sql + where)
-                fetch_dict = self.env.cr.dictfetchall() or 0.0
-
-                if not fetch_dict[0].get('balance'):
-                    amount = 0.0
-                else:
-                    amount = fetch_dict[0]['balance'] + fetch_dict[0]['sum_debit'] - fetch_dict[0]['sum_credit']
-
-                age_dict.update({period_dict[period]['name']: amount or 0})
-                age_dict['total'] += amount or 0
-
-                if fetch_dict[0].get('id_list'):
-                    id_list.extend(fetch_dict[0].get('id_list'))
-
-            age_dict.update({
-                'id_list': id_list,
-                'size': len(id_list) or 0,
-                'time_string': fields.Datetime.now().strftime("%H:%M:%S") + str(partner.id)
-            })
             # Add only when a valid ageing found
             for p in period_dict:
                 if age_dict[period_dict[p]['name']]:
@@ -303,141 +345,109 @@ class InsPartnerAgeing(models.TransientModel):
         ageing_lines.append(total)
         return period_dict, ageing_lines
 
-    def prepare_detailed_lines(self, move_line_ids=[], account_id=False):
-        as_on_date = self.as_on_date
+    def _fetch_detailed_rows(self, partner_id, cursor=False, limit=None):
+        '''
+        Open move lines of the partner with their amount in their bucket, ordered by (date, id).
+        :param cursor: [date, id] of the last line already fetched, False to start from the beginning
+        :param limit: maximum number of rows, None for all of them
+        '''
         period_dict = self.prepare_bucket_list()
-        period_list = [period_dict[a]['name'] for a in period_dict]
-        company_id = self.env.company
-        user_language = self.env.user.lang
-        if account_id:
-            select = """SELECT m.name AS move_name,
-                            l.id AS lid, 
-                            m.id AS move_id,
-                            l.date AS date,
-                            l.date_maturity AS date_maturity, 
-                            j.code AS journal_code,
-                            cc.id AS company_currency_id,
-                            COALESCE(a.code_store::jsonb ->> %(company)s, a.code_store::jsonb ->> '1') AS account_code,
-                            """
-            for period in period_dict:
-                if period_dict[period].get('start') and period_dict[period].get('stop'):
-                    select += """ CASE 
-                        WHEN 
-                            COALESCE(l.date_maturity,l.date) >= '%s' AND 
-                            COALESCE(l.date_maturity,l.date) <= '%s'
-                        THEN
-                            sum(l.balance) +
-                            sum(
-                                COALESCE(
-                                    (SELECT 
-                                        SUM(amount)
-                                    FROM account_partial_reconcile
-                                    WHERE credit_move_id = l.id AND max_date <= '%s'), 0
-                                    )
-                                ) -
-                            sum(
-                                COALESCE(
-                                    (SELECT 
-                                        SUM(amount) 
-                                    FROM account_partial_reconcile 
-                                    WHERE debit_move_id = l.id AND max_date <= '%s'), 0
-                                    )
-                                )
-                        ELSE
-                            0
-                        END AS %s,""" % (period_dict[period].get('stop'),
-                                         period_dict[period].get('start'),
-                                         as_on_date,
-                                         as_on_date,
-                                         'range_' + str(period),
-                                         )
-                elif not period_dict[period].get('start'):
-                    select += """ CASE 
-                            WHEN 
-                                COALESCE(l.date_maturity,l.date) >= '%s' 
-                            THEN
-                                sum(
-                                    l.balance
-                                    ) +
-                                sum(
-                                    COALESCE(
-                                        (SELECT 
-                                            SUM(amount)
-                                        FROM account_partial_reconcile
-                                        WHERE credit_move_id = l.id AND max_date <= '%s'), 0
-                                        )
-                                    ) -
-                                sum(
-                                    COALESCE(
-                                        (SELECT 
-                                            SUM(amount) 
-                                        FROM account_partial_reconcile 
-                                        WHERE debit_move_id = l.id AND max_date <= '%s'), 0
-                                        )
-                                    )
-                            ELSE
-                                0
-                            END AS %s,""" % (
-                    period_dict[period].get('stop'), as_on_date, as_on_date, 'range_' + str(period))
-                else:
-                    select += """ CASE
-                            WHEN
-                                COALESCE(l.date_maturity,l.date) <= '%s' 
-                            THEN
-                                sum(
-                                    l.balance
-                                    ) +
-                                sum(
-                                    COALESCE(
-                                        (SELECT 
-                                            SUM(amount)
-                                        FROM account_partial_reconcile
-                                        WHERE credit_move_id = l.id AND max_date <= '%s'), 0
-                                        )
-                                    ) -
-                                sum(
-                                    COALESCE(
-                                        (SELECT 
-                                            SUM(amount) 
-                                        FROM account_partial_reconcile 
-                                        WHERE debit_move_id = l.id AND max_date <= '%s'), 0
-                                        )
-                                    )
-                            ELSE
-                                0
-                            END AS %s """ % (
-                    period_dict[period].get('start'), as_on_date, as_on_date, 'range_' + str(period))
-
-            sql = """
+        bucket_case, params = self._prepare_bucket_case(period_dict)
+        where, where_params = self._prepare_aged_where(self._get_account_types())
+        params.update(where_params)
+        params.update({'company': str(self.env.company.id), 'partner_id': partner_id,
+                       'partner_ids': (partner_id,), 'limit': limit})
+        if cursor:
+            where += " AND (l.date, l.id) > (%(cursor_date)s, %(cursor_id)s) "
+            params.update({'cursor_date': cursor[0], 'cursor_id': cursor[1]})
+        sql = """
+            WITH partial AS (""" + self._prepare_partial_query() + """)
+            SELECT * FROM (
+                SELECT
+                    m.name AS move_name,
+                    l.id AS lid,
+                    m.id AS move_id,
+                    l.date AS date,
+                    l.date_maturity AS date_maturity,
+                    j.code AS journal_code,
+                    l.company_currency_id AS company_currency_id,
+                    COALESCE(a.code_store::jsonb ->> %(company)s, a.code_store::jsonb ->> '1') AS account_code,
+                    l.balance + COALESCE(partial.amount, 0) AS amount,
+                    """ + bucket_case + """ AS bucket
                 FROM
                     account_move_line AS l
                 LEFT JOIN
                     account_move AS m ON m.id = l.move_id
                 LEFT JOIN
                     account_account AS a ON a.id = l.account_id
-                --LEFT JOIN
-                --    account_account_type AS ty ON a.user_type_id = ty.id
                 LEFT JOIN
                     account_journal AS j ON l.journal_id = j.id
-                LEFT JOIN 
-                    res_currency AS cc ON l.company_currency_id = cc.id
+                LEFT JOIN
+                    partial ON partial.move_line_id = l.id
                 WHERE
-                    l.balance <> 0 and l.id in %s
-                GROUP BY
-                    l.date, l.date_maturity, m.id, m.name, j.code, a.code_store, cc.id, l.id
-                
-            """ % str(tuple(move_line_ids) + tuple([0]))
-
-            self.env.cr.execute(select + sql,  {'company': company_id.id})
-            final_list = self.env.cr.dictfetchall() or []
-            move_lines = []
-            for m in final_list:
-                m['total'] = m['range_0'] + m['range_1'] + m['range_2'] + m['range_3'] + m['range_4'] + m['range_5'] + m['range_6']
-                if (m['range_0'] or m['range_1'] or m['range_2'] or m['range_3'] or m['range_4'] or m['range_5'] or m['range_6']):
-                    move_lines.append(m)
-            return move_lines
+                    """ + where + """
+                    AND l.partner_id = %(partner_id)s
+            ) aged
+            WHERE bucket IS NOT NULL AND amount <> 0
+            ORDER BY date, lid
+            LIMIT %(limit)s
+        """
+        self.env.cr.execute(sql, params)
+        move_lines = self.env.cr.dictfetchall()
+        for line in move_lines:
+            for period in period_dict:
+                line['range_%s' % period] = line['amount'] if line['bucket'] == period else 0.0
+            line['total'] = line['amount']
+        return move_lines
+
+    def prepare_detailed_page(self, partner_id, cursor=False, limit=FETCH_RANGE):
+        '''
+        One page of the partner's open move lines, keyset paginated on (date, id).
+        :param cursor: cursor returned with the previous page, False for the first page
+        :return: {'lines': [rows], 'cursor': cursor of the next page or False on the last page}
+        '''
+        rows = self._fetch_detailed_rows(partner_id, cursor, limit + 1)
+        next_cursor = False
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = [fields.Date.to_string(rows[-1]['date']), rows[-1]['lid']]
+        return {'lines': rows, 'cursor': next_cursor}
+
+    def prepare_detailed_lines(self, partner_id=False):
+        if partner_id:
+            return self._fetch_detailed_rows(partner_id)
         return []
 
+    def _iter_detailed_lines(self, partner_id=False):
+        '''
+        Same rows as prepare_detailed_lines, read FETCH_RANGE move lines at a time for the XLSX export.
+        '''
+        cursor = False
+        while partner_id:
+            rows = self._fetch_detailed_rows(partner_id, cursor, FETCH_RANGE)
+            yield from rows
+            if len(rows) < FETCH_RANGE:
+                break
+            cursor = [rows[-1]['date'], rows[-1]['lid']]
+
+    def action_view_move_lines(self, partner_id):
+        domain = [('balance', '!=', 0),
+                  ('parent_state', '=', 'posted'),
+                  ('account_id.account_type', 'in', self._get_account_types()),
+                  ('company_id', '=', self.env.company.id),
+                  ('partner_id', '=', partner_id)]
+        if self.account_ids:
+            domain.append(('account_id', 'in', self.account_ids.ids))
+        return {
+            'name': _('Account Move Lines'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.move.line',
+            'domain': domain,
+            'views': [[False, 'list']],
+            'view_mode': 'list',
+            'target': 'new',
+        }
+
     def prepare_values_for_component(self):
         model_id = self.env['ir.model'].sudo().search([('model', '=', 'ins.partner.ageing')], limit=1)
 
@@ -510,11 +520,22 @@ class InsPartnerAgeing(models.TransientModel):
 
 
     def action_xlsx(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/account_dynamic_reports/xlsx/%s/%s?%s' % (
+                self._name, self.id, urlencode({'filename': 'Partner Ageing.xlsx'})),
+            'target': 'new',
+        }
+
+    def _write_xlsx(self, workbook):
+        '''
+        Writes the report in the given workbook, which is opened in constant_memory mode:
+        the rows of each sheet have to be written in increasing order.
+        '''
         data = self.read()[0]
         # Initialize
         #############################################################
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
         sheet = workbook.add_worksheet('Partner Ageing')
         sheet.set_zoom(95)
         sheet_2 = workbook.add_worksheet('Filters')
@@ -698,7 +719,7 @@ class InsPartnerAgeing(models.TransientModel):
             sheet.write(row_pos, 10, '', line_header_light_period)
             sheet.write(row_pos, 11, '', line_header_light_period)
             row_pos += 1
-            if line.get('id_list'):
+            if line.get('partner_id'):
                 sheet.merge_range(row_pos, 0, row_pos, 3, line.get('partner_name'), line_header)
             else:
                 sheet.merge_range(row_pos, 0, row_pos, 3, _('Total'), line_header_total)
@@ -709,7 +730,7 @@ class InsPartnerAgeing(models.TransientModel):
             sheet.write(row_pos, k, line['total'], line_header)
 
             if record.include_details == 'yes':
-                sub_lines = record.prepare_detailed_lines(line.get('id_list'), line.get('partner_id'))
+                sub_lines = record._iter_detailed_lines(line.get('partner_id'))
                 for sub_line in sub_lines:
                     row_pos += 1
                     sheet.write(row_pos, 0, sub_line.get('move_name') or '',
@@ -729,19 +750,3 @@ class InsPartnerAgeing(models.TransientModel):
                     sheet.write(row_pos, 11, '', line_header_light_period)
         row_pos += 1
         k = 4
-
-        # Close and return
-        #################################################################
-        workbook.close()
-        output.seek(0)
-        result = base64.b64encode(output.read())
-
-        report_id = self.env['common.xlsx.out'].sudo().create({'filedata': result, 'filename': 'Ageing.xls'})
-        return {
-            'type': 'ir.actions.act_url',
-            'url': '/web/binary/download_document?model=common.xlsx.out&field=filedata&id=%s&filename=%s.xls' % (
-                report_id.id, 'Partner Ageing.xls'),
-            'target': 'new',
-        }
-
-        output.close()
\ No newline at end of file
@@ -5,14 +5,8 @@ import calendar
 from dateutil.relativedelta import relativedelta
 from odoo.tools import DEFAULT_SERVER_DATE_FORMAT
 import json
-import io
 from odoo.tools import date_utils
-import base64
-
-try:
-    from odoo.tools.misc import xlsxwriter
-except ImportError:
-    import xlsxwriter
+from urllib.parse import urlencode
 
 DATE_DICT = {
     '%m/%d/%Y' : 'mm/dd/yyyy',
@@ -291,17 +285,77 @@ class InsPartnerLedger(models.TransientModel):
         '''
         return sql_from
 
+    def _compute_partner_balances(self, partner_ids):
+        '''
+        Opening, period and closing balances of every partner from one grouped scan.
+        The period columns are a FILTER on date_from over the lines up to date_to.
+        Unless reconciliation is filtered, the months before date_from of posted entries
+        come from the balance snapshot and the scan starts on the first day of the month of date_from.
+        :param partner_ids: list of partner ids
+        :return: dict {partner_id: {column: value}}
+        '''
+        if not partner_ids:
+            return {}
+        snapshot = self.env['ins.account.balance.snapshot']
+        use_snapshot = self.target_moves == 'posted_only' and self.reconciled not in ('reconciled', 'unreconciled')
+        params = {'date_from': self.date_from, 'partner_ids': tuple(partner_ids)}
+        where = self.prepare_where(mode='ending')
+        if use_snapshot:
+            where += ' AND l.date >= %(edge_date)s '
+            params['edge_date'] = snapshot._get_edge_date(self.date_from)
+        sql = ('''
+            SELECT
+                l.partner_id AS partner_id,
+                COUNT(l.id) FILTER (WHERE l.date >= %(date_from)s) AS size,
+                COALESCE(SUM(l.debit) FILTER (WHERE l.date >= %(date_from)s),0) AS debit,
+                COALESCE(SUM(l.credit) FILTER (WHERE l.date >= %(date_from)s),0) AS credit,
+                COALESCE(SUM(l.debit - l.credit) FILTER (WHERE l.date >= %(date_from)s),0) AS balance,
+                COALESCE(SUM(l.debit) FILTER (WHERE l.date < %(date_from)s),0) AS initial_debit,
+                COALESCE(SUM(l.credit) FILTER (WHERE l.date < %(date_from)s),0) AS initial_credit,
+                COALESCE(SUM(l.debit - l.credit) FILTER (WHERE l.date < %(date_from)s),0) AS initial_balance,
+                COALESCE(SUM(l.debit),0) AS ending_debit,
+                COALESCE(SUM(l.credit),0) AS ending_credit,
+                COALESCE(SUM(l.debit - l.credit),0) AS ending_balance
+            ''' + self.prepare_from() + where + '''
+                AND l.partner_id IN %(partner_ids)s
+            GROUP BY l.partner_id
+        ''')
+        self.env.cr.execute(sql, params)
+        balances = {row['partner_id']: row for row in self.env.cr.dictfetchall()}
+        if use_snapshot:
+            account_types = None
+            if self.account_type in ('asset_receivable', 'liability_payable'):
+                account_types = [self.account_type]
+            history = snapshot._read_balances(
+                self.date_from, 'partner_id', self.env.company.ids + self.env.company.child_ids.ids,
+                account_ids=self.account_ids.ids or None,
+                partner_ids=partner_ids,
+                journal_ids=self.journal_ids.ids or None,
+                account_types=account_types)
+            snapshot._merge_history(balances, history, ['initial_', 'ending_'],
+                                    {'size': 0, 'debit': 0, 'credit': 0, 'balance': 0})
+        return balances
+
     def prepare_main_lines(self):
+        '''
+        Served from ins.report.cache when only posted entries are reported
+        without a reconciliation filter,
+        computed by _prepare_main_lines otherwise.
+        '''
+        if self.target_moves == 'posted_only' and self.reconciled not in ('reconciled', 'unreconciled'):
+            return self.env['ins.report.cache']._get_or_compute(self, '_prepare_main_lines')
+        return self._prepare_main_lines()
+
+    def _prepare_main_lines(self):
         '''
         It is the method for showing summary details of each accounts. Just basic details to show up
         Three sections,
         1. Initial Balance
         2. Current Balance
         3. Final Balance
+        Move lines are not listed here, they are fetched page by page with prepare_detailed_page.
         :return:
         '''
-        cr = self.env.cr
-
         partner_company_domain = [('parent_id', '=', False),
                                   '|',
                                   ('company_id', '=', self.env.company.id),
@@ -313,40 +367,31 @@ class InsPartnerLedger(models.TransientModel):
             partner_company_domain.append(('id', 'in', self.partner_ids.ids))
 
         partner_ids = self.env['res.partner'].search(partner_company_domain, order='name asc')
+        balances = self._compute_partner_balances(partner_ids.ids)
+        time_string = fields.Datetime.now().strftime('%H:%M:%S')
         pl_lines = []
         for partner in partner_ids:
 
             result = {
-                'id_list': [],
                 'size': 0,
                 'debit': 0,
                 'credit': 0,
-                'balance': 0
+                'balance': 0,
+                'initial_debit': 0,
+                'initial_credit': 0,
+                'initial_balance': 0,
+                'ending_debit': 0,
+                'ending_credit': 0,
+                'ending_balance': 0,
             }
-            # Current
-            sql = ('''
-                SELECT
-                    array_agg(l.id) AS id_list,
-                    COUNT(l.id) AS size,
-                    COALESCE(SUM(l.debit),0) AS debit, 
-                    COALESCE(SUM(l.credit),0) AS credit, 
-                    COALESCE(SUM(l.debit - l.credit),0) AS balance,
-                    EXTRACT(HOUR FROM CURRENT_TIME)::TEXT || ':' ||
-                    EXTRACT(MINUTE FROM CURRENT_TIME)::TEXT || ':' ||
-                    EXTRACT(SECOND FROM CURRENT_TIME)::TEXT || ':' || '%s' AS time_string
-                ''' % str(partner.id) + self.prepare_from() + self.prepare_where(mode='strict') +
-                   ''' AND l.partner_id = %s 
-                   ''' % partner.id)
-            cr.execute(sql)
-            res = cr.dictfetchone() or {}
-
-            result.update(res)
+            result.update(balances.get(partner.id, {}))
             # Extra args
             result.update(
                 {
                     'partner_id': partner.id,
                     'partner_name': partner.name,
                     'currency_id': self.currency_id.id,
+                    'time_string': '%s:%s' % (time_string, partner.id),
                 }
             )
 
@@ -358,35 +403,26 @@ class InsPartnerLedger(models.TransientModel):
             pl_lines.append(result)
         return pl_lines
 
-    def prepare_detailed_lines(self, move_line_ids=[], partner_id=False):
-        cr = self.env.cr
-        final_list = []
-        lang_code = self.env.user.lang
-        # Initial
-        if self.include_initial_balance == 'yes':
-            where_initial = self.prepare_where(mode='initial')
-            sql = ('''
-                    SELECT
-                        'initial' AS ttype,
-                        COALESCE(SUM(l.debit),0) AS debit, 
-                        COALESCE(SUM(l.credit),0) AS credit, 
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                        ''' + self.prepare_from() + where_initial +
-                   ''' AND l.partner_id = %s 
-          ''' % partner_id)
-            cr.execute(sql)
-            dt_initial = cr.dictfetchone()
-            dt_initial.update({'lid': str(partner_id) + 'initial'})
-            final_list.append(dt_initial)
-
-        # Current
-        where_current = self.prepare_where(mode='strict') + ' AND l.id in %s ' % str(
-            tuple(move_line_ids or []) + tuple([0, 0]))
+    def _prepare_balance_row(self, ttype, partner_id, balances):
+        return {
+            'ttype': ttype,
+            'lid': str(partner_id) + ttype,
+            'debit': balances.get(ttype + '_debit', 0),
+            'credit': balances.get(ttype + '_credit', 0),
+            'balance': balances.get(ttype + '_balance', 0),
+        }
+
+    def _fetch_detailed_rows(self, partner_id, cursor=False, limit=None):
+        '''
+        Move lines of the partner in the period, ordered by (date, id).
+        :param cursor: [date, id] of the last line already fetched, False to start from the beginning
+        :param limit: maximum number of rows, None for all of them
+        '''
         sql = ('''
             SELECT
                 'strict' AS ttype,
                 l.id AS lid,
-                l.date AS ldate, 
+                l.date AS ldate,
                 l.matching_number,
                 l.date_maturity,
                 j.code AS lcode,
@@ -403,32 +439,96 @@ class InsPartnerLedger(models.TransientModel):
                 l.debit AS debit,
                 l.credit AS credit,
                 l.balance AS balance
-            ''' + self.prepare_from() + where_current +
-               ''' AND l.partner_id = %(partner_id)s 
-               GROUP BY
-                   l.date, l.id, m.id, l.matching_number,
-                   l.date_maturity, j.code, a.name, l.currency_id, a.code_store, m.name, l.name, l.debit, l.credit, l.amount_currency
-               ORDER BY l.date
-           ''')
-        cr.execute(sql, {'lang': lang_code, 'partner_id': partner_id})
-        final_list += cr.dictfetchall()
-        # Ending
+            ''' + self.prepare_from() + self.prepare_where(mode='strict') + '''
+                AND l.partner_id = %(partner_id)s
+        ''')
+        params = {'lang': self.env.user.lang, 'partner_id': partner_id, 'limit': limit}
+        if cursor:
+            sql += ' AND (l.date, l.id) > (%(cursor_date)s, %(cursor_id)s) '
+            params.update({'cursor_date': cursor[0], 'cursor_id': cursor[1]})
+        sql += ' ORDER BY l.date, l.id LIMIT %(limit)s '
+        self.env.cr.execute(sql, params)
+        return self.env.cr.dictfetchall()
+
+    def prepare_detailed_page(self, partner_id, cursor=False, limit=FETCH_RANGE):
+        '''
+        One page of the partner's move lines, keyset paginated on (date, id).
+        Initial balance comes with the first page and ending balance with the last one.
+        :param cursor: cursor returned with the previous page, False for the first page
+        :return: {'lines': [rows], 'cursor': cursor of the next page or False on the last page}
+        '''
+        rows = self._fetch_detailed_rows(partner_id, cursor, limit + 1)
+        next_cursor = False
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = [fields.Date.to_string(rows[-1]['ldate']), rows[-1]['lid']]
+        if self.include_initial_balance == 'yes' and (not cursor or not next_cursor):
+            balances = self._compute_partner_balances([partner_id]).get(partner_id, {})
+            if not cursor:
+                rows.insert(0, self._prepare_balance_row('initial', partner_id, balances))
+            if not next_cursor:
+                rows.append(self._prepare_balance_row('ending', partner_id, balances))
+        return {'lines': rows, 'cursor': next_cursor}
+
+    def prepare_detailed_lines(self, partner_id=False, balances=None):
+        '''
+        All the move lines of the partner, used by the PDF export.
+        :param balances: the partner's main line, to avoid recomputing its initial and ending balances
+        '''
+        return list(self._iter_detailed_lines(partner_id, balances))
+
+    def _iter_detailed_lines(self, partner_id=False, balances=None):
+        '''
+        Same rows as prepare_detailed_lines, read FETCH_RANGE move lines at a time for the XLSX export.
+        '''
         if self.include_initial_balance == 'yes':
-            where_ending = self.prepare_where(mode='ending')
-            sql = ('''
-                    SELECT
-                        'ending' AS ttype,
-                        COALESCE(SUM(l.debit),0) AS debit, 
-                        COALESCE(SUM(l.credit),0) AS credit, 
-                        COALESCE(SUM(l.debit - l.credit),0) AS balance
-                        ''' + self.prepare_from() + where_ending +
-                   ''' AND l.partner_id = %s 
-               ''' % partner_id)
-            cr.execute(sql)
-            dt_ending = cr.dictfetchone()
-            dt_ending.update({'lid': str(partner_id) + 'ending'})
-            final_list.append(dt_ending)
-        return final_list
+            if balances is None:
+                balances = self._compute_partner_balances([partner_id]).get(partner_id, {})
+            yield self._prepare_balance_row('initial', partner_id, balances)
+        cursor = False
+        while True:
+            rows = self._fetch_detailed_rows(partner_id, cursor, FETCH_RANGE)
+            yield from rows
+            if len(rows) < FETCH_RANGE:
+                break
+            cursor = [rows[-1]['ldate'], rows[-1]['lid']]
+        if self.include_initial_balance == 'yes':
+            yield self._prepare_balance_row('ending', partner_id, balances)
+        self.env['ins.report.job']._report_progress()
+
+    def _get_move_line_domain(self, partner_id):
+        '''
+        Domain equivalent of prepare_where(mode='strict') for the given partner.
+        '''
+        cmpny_ids = self.env.company.ids + self.env.company.child_ids.ids
+        domain = [('company_id', 'in', cmpny_ids),
+                  ('partner_id', '=', partner_id),
+                  ('date', '>=', self.date_from),
+                  ('date', '<=', self.date_to)]
+        if self.journal_ids:
+            domain.append(('journal_id', 'in', self.journal_ids.ids))
+        if self.account_ids:
+            domain.append(('account_id', 'in', self.account_ids.ids))
+        if self.target_moves == 'posted_only':
+            domain.append(('parent_state', '=', 'posted'))
+        if self.reconciled == 'reconciled':
+            domain.append(('reconciled', '=', True))
+        if self.reconciled == 'unreconciled':
+            domain.append(('reconciled', '=', False))
+        if self.account_type in ('asset_receivable', 'liability_payable'):
+            domain.append(('account_id.account_type', '=', self.account_type))
+        return domain
+
+    def action_view_move_lines(self, partner_id):
+        return {
+            'name': _('Account Move Lines'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.move.line',
+            'domain': self._get_move_line_domain(partner_id),
+            'views': [[False, 'list']],
+            'view_mode': 'list',
+            'target': 'new',
+        }
 
     def prepare_values_for_component(self):
         self.onchange_date_range()
@@ -516,11 +616,22 @@ class InsPartnerLedger(models.TransientModel):
         return res
 
     def action_xlsx(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/account_dynamic_reports/xlsx/%s/%s?%s' % (
+                self._name, self.id, urlencode({'filename': 'Partner Ledger.xlsx'})),
+            'target': 'new',
+        }
+
+    def _write_xlsx(self, workbook):
+        '''
+        Writes the report in the given workbook, which is opened in constant_memory mode:
+        the rows of each sheet have to be written in increasing order.
+        '''
         data = self.read()[0]
         # Initialize
         #############################################################
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
         sheet = workbook.add_worksheet('Partnr Ledger')
         sheet.set_zoom(95)
         sheet_2 = workbook.add_worksheet('Filters')
@@ -531,6 +642,7 @@ class InsPartnerLedger(models.TransientModel):
 
         filter = record.prepare_values_for_component()
         account_lines = record.prepare_main_lines()
+        self.env['ins.report.job']._report_progress(total=len(account_lines))
 
         # Formats
         ############################################################
@@ -739,7 +851,7 @@ class InsPartnerLedger(models.TransientModel):
                 sheet.write(row_pos, 8, '', line_header)
                 sheet.write(row_pos, 9, float(line.get('balance')), line_header)
 
-                sub_lines = record.prepare_detailed_lines(line.get('id_list'), line.get('partner_id'))
+                sub_lines = record._iter_detailed_lines(line.get('partner_id'), line)
 
                 for sub_line in sub_lines:
                     if sub_line.get('ttype') == 'initial':
@@ -773,19 +885,3 @@ class InsPartnerLedger(models.TransientModel):
                         sheet.write(row_pos, 7, float(sub_line.get('credit')), line_header_light_ending)
                         sheet.write(row_pos, 8, '', line_header_light_ending)
                         sheet.write(row_pos, 9, float(sub_line.get('balance')), line_header_light_ending)
-
-        # Close and return
-        #################################################################
-        workbook.close()
-        output.seek(0)
-        result = base64.b64encode(output.read())
-
-        report_id = self.env['common.xlsx.out'].sudo().create({'filedata': result, 'filename': 'PL.xls'})
-        return {
-            'type': 'ir.actions.act_url',
-            'url': '/web/binary/download_document?model=common.xlsx.out&field=filedata&id=%s&filename=%s.xls' % (
-                report_id.id, 'Partner Ledger.xls'),
-            'target': 'new',
-        }
-
-        output.close()
@@ -6,14 +6,8 @@ from dateutil.relativedelta import relativedelta
 from odoo.tools import DEFAULT_SERVER_DATE_FORMAT
 from operator import itemgetter
 import json
-import io
 from odoo.tools import date_utils
-import base64
-
-try:
-    from odoo.tools.misc import xlsxwriter
-except ImportError:
-    import xlsxwriter
+from urllib.parse import urlencode
 
 DATE_DICT = {
     '%m/%d/%Y' : 'mm/dd/yyyy',
@@ -36,6 +30,8 @@ DATE_DICT = {
     '%e-%f-%y' : 'd-m-yy'
 }
 
+FETCH_RANGE = 2000
+
 
 class InsTrialBalance(models.TransientModel):
     _name = "ins.trial.balance"
@@ -335,7 +331,7 @@ class InsTrialBalance(models.TransientModel):
 
     def prepare_where(self, mode='strict'):
         '''
-        :param mode: 'strict', 'initial', 'ending', 'comparison'
+        :param mode: 'strict', 'initial', 'ending', 'comparison', 'unbounded' (no date condition)
         :return:
         '''
         where = 'WHERE (1=1) '
@@ -358,6 +354,8 @@ class InsTrialBalance(models.TransientModel):
             where += ''' AND l.date < '%s' ''' % self.date_from
         elif mode == 'ending':
             where += ''' AND l.date <= '%s' ''' % self.date_to
+        elif mode == 'unbounded':
+            pass
         else:
             where += ''' AND l.date >= '%s' AND l.date <= '%s' ''' % \
                      (self.comparison_date_from or self.date_from,
@@ -376,98 +374,138 @@ class InsTrialBalance(models.TransientModel):
         '''
         return sql_from
 
-    def execute_query(self, account, mode='strict'):
-        cr = self.env.cr
-        if mode == 'strict':
-            select = """ SELECT
-                    array_agg(l.id) AS id_list,
-                    COUNT(l.id) AS size,
-                    EXTRACT(HOUR FROM CURRENT_TIME)::TEXT || ':' ||
-                    EXTRACT(MINUTE FROM CURRENT_TIME)::TEXT || ':' ||
-                    EXTRACT(SECOND FROM CURRENT_TIME)::TEXT || ':' || '%s' AS time_string,
-                    CASE
-                        WHEN COALESCE(SUM(l.balance)) >= 0 THEN COALESCE(SUM(l.balance))
-                        ELSE 0
-                        END AS debit,
-                    CASE
-                        WHEN COALESCE(SUM(l.balance)) >= 0 THEN 0
-                        ELSE ABS(COALESCE(SUM(l.balance)))
-                        END AS credit,
-                    COALESCE(SUM(l.balance),0) AS balance
-            """ % account.id
-        if mode == 'initial':
-            select = """ SELECT
-                    CASE
-                        WHEN COALESCE(SUM(l.balance)) >= 0 THEN COALESCE(SUM(l.balance))
-                        ELSE 0
-                        END AS initial_debit,
-                    CASE
-                        WHEN COALESCE(SUM(l.balance)) >= 0 THEN 0
-                        ELSE ABS(COALESCE(SUM(l.balance)))
-                        END AS initial_credit,
-                    COALESCE(SUM(l.balance),0) AS initial_balance
-            """
-        if mode == 'ending':
-            select = """ SELECT
-                    CASE
-                        WHEN COALESCE(SUM(l.balance)) >= 0 THEN COALESCE(SUM(l.balance))
-                        ELSE 0
-                        END AS ending_debit,
-                    CASE
-                        WHEN COALESCE(SUM(l.balance)) >= 0 THEN 0
-                        ELSE ABS(COALESCE(SUM(l.balance)))
-                        END AS ending_credit,
-                    COALESCE(SUM(l.balance),0) AS ending_balance
-            """
-        if mode == 'comparison':
-            select = """ SELECT
-                    CASE
-                        WHEN COALESCE(SUM(l.balance)) >= 0 THEN COALESCE(SUM(l.balance))
-                        ELSE 0
-                        END AS comparison_debit,
-                    CASE
-                        WHEN COALESCE(SUM(l.balance)) >= 0 THEN 0
-                        ELSE ABS(COALESCE(SUM(l.balance)))
-                        END AS comparison_credit,
-                    COALESCE(SUM(l.balance),0) AS comparison_balance
-            """
-        sql = (select + self.prepare_from() + self.prepare_where(mode=mode) +
-               ''' AND l.account_id = %s 
-               ''' % account.id)
-        cr.execute(sql)
-        return cr.dictfetchone() or {}
+    def _compute_trial_balance_columns(self, account_ids):
+        '''
+        Computes the initial, current, ending and comparison columns of every account
+        from one scan of account_move_line, each column being a FILTER over the date ranges.
+        Debit and credit of a column are the positive and negative part of its net balance.
+        For posted entries the months before date_from come from the balance snapshot, so the
+        initial and ending columns only scan from the first day of the month of date_from.
+        When ins.report.parallel has workers, the scan of several accounts is split by company and
+        account range. A single account, as in the drill-downs, is always scanned serially.
+        :param account_ids: list of account ids
+        :return: dict {account_id: {column: value}}
+        '''
+        if not account_ids:
+            return {}
+        snapshot = self.env['ins.account.balance.snapshot']
+        use_snapshot = self.target_moves == 'posted_only'
+        comparison_date_from = self.comparison_date_from or self.date_from
+        comparison_date_to = self.comparison_date_to or self.date_to
+        params = {
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+            'comparison_date_from': comparison_date_from,
+            'comparison_date_to': comparison_date_to,
+            'date_max': max(self.date_to, comparison_date_to),
+            'account_ids': tuple(account_ids),
+        }
+        edge = where_edge = ''
+        if use_snapshot:
+            params['edge_date'] = snapshot._get_edge_date(self.date_from)
+            params['date_min'] = min(params['edge_date'], comparison_date_from)
+            edge = ' AND l.date >= %(edge_date)s'
+            where_edge = ' AND l.date >= %(date_min)s'
+        totals_sql = ('''
+            SELECT
+                l.account_id AS account_id,
+                COUNT(l.id) FILTER (WHERE l.date >= %(date_from)s AND l.date <= %(date_to)s) AS size,
+                COALESCE(SUM(l.balance) FILTER (WHERE l.date < %(date_from)s''' + edge + '''), 0) AS initial,
+                COALESCE(SUM(l.balance) FILTER (WHERE l.date >= %(date_from)s AND l.date <= %(date_to)s), 0) AS strict,
+                COALESCE(SUM(l.balance) FILTER (WHERE l.date <= %(date_to)s''' + edge + '''), 0) AS ending,
+                COALESCE(SUM(l.balance) FILTER (
+                    WHERE l.date >= %(comparison_date_from)s AND l.date <= %(comparison_date_to)s), 0) AS comparison
+            ''' + self.prepare_from() + '''
+            ''' + self.prepare_where(mode='unbounded') + '''
+                AND l.date <= %(date_max)s''' + where_edge + '''
+                AND l.account_id IN %(account_ids)s
+                AND l.company_id IN %(company_ids)s
+            GROUP BY l.account_id
+        ''')
+        company_ids = self.env.company.ids + self.env.company.child_ids.ids
+        parallel = self.env['ins.report.parallel']
+        chunks = parallel._split_chunks(company_ids, account_ids) if len(account_ids) > 1 else []
+        if chunks:
+            # One query per company and account range on its own connection, the nets are summed here
+            results = parallel._execute_chunks(totals_sql, [
+                dict(params, company_ids=(company_id,), account_ids=tuple(chunk_account_ids))
+                for company_id, chunk_account_ids in chunks])
+            nets = {}
+            for row in (row for result in results for row in result):
+                total = nets.setdefault(row['account_id'], dict.fromkeys(
+                    ['size', 'initial', 'strict', 'ending', 'comparison'], 0))
+                for column in total:
+                    total[column] += row[column] or 0
+            columns = {}
+            for account_id, total in nets.items():
+                row = {'account_id': account_id, 'size': total['size']}
+                for prefix, column in [('initial_', 'initial'), ('', 'strict'),
+                                       ('ending_', 'ending'), ('comparison_', 'comparison')]:
+                    net = total[column]
+                    row.update({prefix + 'debit': max(net, 0), prefix + 'credit': max(-net, 0), prefix + 'balance': net})
+                columns[account_id] = row
+        else:
+            params['company_ids'] = tuple(company_ids)
+            self.env.cr.execute('''
+                WITH totals AS (''' + totals_sql + ''')
+                SELECT
+                    account_id, size,
+                    GREATEST(initial, 0) AS initial_debit, GREATEST(-initial, 0) AS initial_credit, initial AS initial_balance,
+                    GREATEST(strict, 0) AS debit, GREATEST(-strict, 0) AS credit, strict AS balance,
+                    GREATEST(ending, 0) AS ending_debit, GREATEST(-ending, 0) AS ending_credit, ending AS ending_balance,
+                    GREATEST(comparison, 0) AS comparison_debit, GREATEST(-comparison, 0) AS comparison_credit,
+                    comparison AS comparison_balance
+                FROM totals
+            ''', params)
+            columns = {row['account_id']: row for row in self.env.cr.dictfetchall()}
+        if use_snapshot:
+            history = snapshot._read_balances(
+                self.date_from, 'account_id', company_ids,
+                account_ids=account_ids,
+                partner_ids=self.partner_ids.ids or None,
+                journal_ids=self.journal_ids.ids or None)
+            for account_id, values in history.items():
+                row = columns.setdefault(account_id, {
+                    'account_id': account_id, 'size': 0, 'debit': 0, 'credit': 0, 'balance': 0,
+                    'initial_balance': 0, 'ending_balance': 0,
+                    'comparison_debit': 0, 'comparison_credit': 0, 'comparison_balance': 0,
+                })
+                for prefix in ['initial_', 'ending_']:
+                    net = (row[prefix + 'balance'] or 0) + values['balance']
+                    row.update({prefix + 'debit': max(net, 0), prefix + 'credit': max(-net, 0), prefix + 'balance': net})
+        return columns
 
     def add_retained_earnings(self, data):
-        # Step 1: Calculate sum of initial_debit where carry_forward = True
-        sum_initial_debit = sum(entry['initial_debit'] for entry in data if not entry['carry_forward'] and entry['initial_debit'])
-        sum_initial_credit = sum(entry['initial_credit'] for entry in data if not entry['carry_forward'] and entry['initial_credit'])
-        sum_initial_balance = sum(entry['initial_balance'] for entry in data if not entry['carry_forward'] and entry['initial_balance'])
-
-        # Step 2: Update dictionaries with carry_forward = True
+        columns = ['debit', 'credit', 'balance',
+                   'initial_debit', 'initial_credit', 'initial_balance',
+                   'ending_debit', 'ending_credit', 'ending_balance',
+                   'comparison_debit', 'comparison_credit', 'comparison_balance']
+        sum_initial = {'debit': 0, 'credit': 0, 'balance': 0}
+        grand_total = dict.fromkeys(columns, 0)
+
+        # Single pass: move P&L initial balances to unallocated earnings and sum the columns
         for entry in data:
             if not entry['carry_forward']:
                 # P&L
-                entry['ending_debit'] = entry['debit'] or 0
-                entry['ending_credit'] = entry['credit'] or 0
-                entry['ending_balance'] = entry['balance'] or 0
-
-                entry['initial_debit'] = 0
-                entry['initial_credit'] = 0
-                entry['initial_balance'] = 0
-
-        # Step 3: Add a new entry for 'Unallocated Earnings'
+                for field in ['debit', 'credit', 'balance']:
+                    sum_initial[field] += entry['initial_' + field] or 0
+                    entry['ending_' + field] = entry[field] or 0
+                    entry['initial_' + field] = 0
+            for column in columns:
+                grand_total[column] += entry.get(column, 0) or 0
+
+        # Add a new entry for 'Unallocated Earnings'
         unallocated_earnings_entry = {
-            'id_list': [],
             'size': 0,
             'debit': 0.0,
             'credit': 0.0,
             'balance': 0.0,
-            'initial_debit': sum_initial_debit,
-            'initial_credit': sum_initial_credit,
-            'initial_balance': sum_initial_balance,
-            'ending_debit': sum_initial_debit,
-            'ending_credit': sum_initial_credit,
-            'ending_balance': sum_initial_balance,
+            'initial_debit': sum_initial['debit'],
+            'initial_credit': sum_initial['credit'],
+            'initial_balance': sum_initial['balance'],
+            'ending_debit': sum_initial['debit'],
+            'ending_credit': sum_initial['credit'],
+            'ending_balance': sum_initial['balance'],
             'comparison_debit': 0.0,
             'comparison_credit': 0.0,
             'comparison_balance': 0.0,
@@ -478,6 +516,9 @@ class InsTrialBalance(models.TransientModel):
             'currency_id': 1,
             'carry_forward': False  # Assuming this should be False for Unallocated Earnings
         }
+        for field in ['debit', 'credit', 'balance']:
+            grand_total['initial_' + field] += sum_initial[field]
+            grand_total['ending_' + field] += sum_initial[field]
 
         # Append unallocated_earnings_entry to data
         data.append(unallocated_earnings_entry)
@@ -486,36 +527,33 @@ class InsTrialBalance(models.TransientModel):
         total = {
             'account_id': 88888888, 'account_name': "", 'account_code': 'Total',
             'currency_id': self.currency_id.id,
-            'id_list': [], 'size': 0,
+            'size': 0,
             'time_string': fields.Datetime.now().strftime("%Y%m%d%H%M%S") + 'total',
-            'debit': sum([a.get('debit', 0) or 0 for a in data]) or 0,
-            'credit': sum([a.get('credit', 0) or 0 for a in data]) or 0,
-            'balance': sum([a.get('balance', 0) or 0 for a in data]) or 0,
-            'comparison_debit': sum([a.get('comparison_debit', 0) or 0 for a in data]) or 0,
-            'comparison_credit': sum([a.get('comparison_credit', 0) or 0 for a in data]) or 0,
-            'comparison_balance': sum([a.get('comparison_balance', 0) or 0 for a in data]) or 0,
-            'initial_debit': sum([a.get('initial_debit', 0) or 0 for a in data]) or 0,
-            'initial_credit': sum([a.get('initial_credit', 0) or 0 for a in data]) or 0,
-            'initial_balance': sum([a.get('initial_balance', 0) or 0 for a in data]) or 0,
-            'ending_debit': sum([a.get('ending_debit', 0) or 0 for a in data]) or 0,
-            'ending_credit': sum([a.get('ending_credit', 0) or 0 for a in data]) or 0,
-            'ending_balance': sum([a.get('ending_balance', 0) or 0 for a in data]) or 0,
             'carry_forward': False
         }
+        total.update(grand_total)
         data.append(total)
         return data
 
     def prepare_main_lines(self):
+        '''
+        Served from ins.report.cache when only posted entries are reported,
+        computed by _prepare_main_lines otherwise.
+        '''
+        if self.target_moves == 'posted_only':
+            return self.env['ins.report.cache']._get_or_compute(self, '_prepare_main_lines')
+        return self._prepare_main_lines()
+
+    def _prepare_main_lines(self):
         '''
         It is the method for showing summary details of each accounts. Just basic details to show up
         Three sections,
         1. Initial Balance
         2. Current Balance
         3. Final Balance
+        Every column of every account comes from _compute_trial_balance_columns.
         :return:
         '''
-        cr = self.env.cr
-
         if not self.date_from or not self.date_to:
             return []
 
@@ -526,31 +564,18 @@ class InsTrialBalance(models.TransientModel):
             account_company_domain.append(('id', 'in', self.account_ids.ids))
 
         account_ids = self.env['account.account'].search(account_company_domain, order='code asc')
+        columns = self._compute_trial_balance_columns(account_ids.ids)
         gl_lines = []
         for account in account_ids:
             carry_forward = True if account.internal_group not in ['income', 'expense'] else False
 
             result = {
-                'id_list': [], 'size': 0, 'debit': 0, 'credit': 0, 'balance': 0,
+                'size': 0, 'debit': 0, 'credit': 0, 'balance': 0,
                 'initial_debit': 0, 'initial_credit': 0, 'initial_balance': 0,
                 'ending_debit': 0, 'ending_credit': 0, 'ending_balance': 0,
                 'comparison_debit': 0, 'comparison_credit': 0, 'comparison_balance': 0,
             }
-            # Initial
-            res = self.execute_query(account, mode='initial')
-            result.update(res)
-
-            # Current
-            res = self.execute_query(account, mode='strict')
-            result.update(res)
-
-            # Ending
-            res = self.execute_query(account, mode='ending')
-            result.update(res)
-
-            # Comparison
-            res = self.execute_query(account, mode='comparison')
-            result.update(res)
+            result.update(columns.get(account.id, {}))
 
             # Extra args
             result.update(
@@ -559,7 +584,8 @@ class InsTrialBalance(models.TransientModel):
                     'account_name': account.name,
                     'account_code': account.code,
                     'currency_id': self.currency_id.id,
-                    'carry_forward': carry_forward
+                    'carry_forward': carry_forward,
+                    'time_string': '%s:%s' % (fields.Datetime.now().strftime('%H:%M:%S'), account.id),
                 }
             )
             if self.display_accounts == 'balance_not_zero' and self.currency_id.is_zero(result.get('ending_balance')):
@@ -570,68 +596,100 @@ class InsTrialBalance(models.TransientModel):
         updated_gl_lines = self.add_retained_earnings(gl_lines)
         return updated_gl_lines
 
-    def prepare_detailed_lines(self, move_line_ids=[], account_id=False):
-        cr = self.env.cr
-        final_list = []
-        # Initial
-        where_initial = self.prepare_where(mode='initial')
-        sql = ('''
-                SELECT
-                    'initial' AS ttype,
-                    COALESCE(SUM(l.debit),0) AS debit, 
-                    COALESCE(SUM(l.credit),0) AS credit, 
-                    COALESCE(SUM(l.debit - l.credit),0) AS balance
-                    ''' + self.prepare_from() + where_initial +
-               ''' AND l.account_id = %s 
-      ''' % account_id)
-        cr.execute(sql)
-        dt_initial = cr.dictfetchone()
-        dt_initial.update({'lid': str(account_id) + 'initial'})
-        final_list.append(dt_initial)
-
-        # Current
-        where_current = self.prepare_where(mode='strict') + ' AND l.id in %s ' % str(
-            tuple(move_line_ids) + tuple([0]))
-        sql = ('''
-                SELECT
-                    'strict' AS ttype,
-                    l.id AS lid,
-                    l.date AS ldate,
-                    j.code AS lcode,
-                    p.name AS partner_name,
-                    m.name AS move_name,
-                    m.id AS move_id,
-                    l.name AS lname,
-                    l.debit AS debit,
-                    l.credit AS credit,
-                    (l.debit - l.credit) AS balance
-                    ''' + self.prepare_from() + where_current +
-               ''' AND l.account_id = %s 
-               GROUP BY
-                   l.date, l.id, m.id ,j.code, p.name, m.name, l.name, l.debit, l.credit
-               ORDER BY l.date
-           ''' % account_id)
-        cr.execute(sql)
-        final_list += cr.dictfetchall()
-
-        # Ending
-        where_ending = self.prepare_where(mode='ending')
-        sql = ('''
-                SELECT
-                    'ending' AS ttype,
-                    COALESCE(SUM(l.debit),0) AS debit, 
-                    COALESCE(SUM(l.credit),0) AS credit, 
-                    COALESCE(SUM(l.debit - l.credit),0) AS balance
-                    ''' + self.prepare_from() + where_ending +
-               ''' AND l.account_id = %s 
-           ''' % account_id)
-        cr.execute(sql)
-        dt_ending = cr.dictfetchone()
-        dt_ending.update({'lid': str(account_id) + 'ending'})
-        final_list.append(dt_ending)
+    def _prepare_balance_row(self, ttype, account_id, columns):
+        return {
+            'ttype': ttype,
+            'lid': str(account_id) + ttype,
+            'debit': columns.get(ttype + '_debit', 0),
+            'credit': columns.get(ttype + '_credit', 0),
+            'balance': columns.get(ttype + '_balance', 0),
+        }
 
+    def _fetch_detailed_rows(self, account_id, cursor=False, limit=None):
+        '''
+        Move lines of the account in the period, ordered by (date, id).
+        :param cursor: [date, id] of the last line already fetched, False to start from the beginning
+        :param limit: maximum number of rows, None for all of them
+        '''
+        sql = ('''
+            SELECT
+                'strict' AS ttype,
+                l.id AS lid,
+                l.date AS ldate,
+                j.code AS lcode,
+                p.name AS partner_name,
+                m.name AS move_name,
+                m.id AS move_id,
+                l.name AS lname,
+                l.debit AS debit,
+                l.credit AS credit,
+                (l.debit - l.credit) AS balance
+            ''' + self.prepare_from() + self.prepare_where(mode='strict') + '''
+                AND l.account_id = %(account_id)s
+        ''')
+        params = {'account_id': account_id, 'limit': limit}
+        if cursor:
+            sql += ' AND (l.date, l.id) > (%(cursor_date)s, %(cursor_id)s) '
+            params.update({'cursor_date': cursor[0], 'cursor_id': cursor[1]})
+        sql += ' ORDER BY l.date, l.id LIMIT %(limit)s '
+        self.env.cr.execute(sql, params)
+        return self.env.cr.dictfetchall()
+
+    def prepare_detailed_page(self, account_id, cursor=False, limit=FETCH_RANGE):
+        '''
+        One page of the account's move lines, keyset paginated on (date, id).
+        Initial balance comes with the first page and ending balance with the last one.
+        :param cursor: cursor returned with the previous page, False for the first page
+        :return: {'lines': [rows], 'cursor': cursor of the next page or False on the last page}
+        '''
+        rows = self._fetch_detailed_rows(account_id, cursor, limit + 1)
+        next_cursor = False
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = [fields.Date.to_string(rows[-1]['ldate']), rows[-1]['lid']]
+        if not cursor or not next_cursor:
+            columns = self._compute_trial_balance_columns([account_id]).get(account_id, {})
+            if not cursor:
+                rows.insert(0, self._prepare_balance_row('initial', account_id, columns))
+            if not next_cursor:
+                rows.append(self._prepare_balance_row('ending', account_id, columns))
+        return {'lines': rows, 'cursor': next_cursor}
+
+    def prepare_detailed_lines(self, account_id=False):
+        columns = self._compute_trial_balance_columns([account_id]).get(account_id, {})
+        final_list = [self._prepare_balance_row('initial', account_id, columns)]
+        final_list += self._fetch_detailed_rows(account_id)
+        final_list.append(self._prepare_balance_row('ending', account_id, columns))
         return final_list
 
+    def _get_move_line_domain(self, account_id):
+        '''
+        Domain equivalent of prepare_where(mode='strict') for the given account.
+        '''
+        cmpny_ids = self.env.company.ids + self.env.company.child_ids.ids
+        domain = [('company_id', 'in', cmpny_ids),
+                  ('account_id', '=', account_id),
+                  ('date', '>=', self.date_from),
+                  ('date', '<=', self.date_to)]
+        if self.journal_ids:
+            domain.append(('journal_id', 'in', self.journal_ids.ids))
+        if self.partner_ids:
+            domain.append(('partner_id', 'in', self.partner_ids.ids))
+        if self.target_moves == 'posted_only':
+            domain.append(('parent_state', '=', 'posted'))
+        return domain
+
+    def action_view_move_lines(self, account_id):
+        return {
+            'name': _('Account Move Lines'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.move.line',
+            'domain': self._get_move_line_domain(account_id),
+            'views': [[False, 'list']],
+            'view_mode': 'list',
+            'target': 'new',
+        }
+
     def prepare_values_for_component(self):
         self.onchange_date_range()
         self.onchange_comparison_date_range()
@@ -754,12 +812,23 @@ class InsTrialBalance(models.TransientModel):
         return res
 
     def action_xlsx(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/account_dynamic_reports/xlsx/%s/%s?%s' % (
+                self._name, self.id, urlencode({'filename': 'Trial Balance.xlsx'})),
+            'target': 'new',
+        }
+
+    def _write_xlsx(self, workbook):
+        '''
+        Writes the report in the given workbook, which is opened in constant_memory mode:
+        the rows of each sheet have to be written in increasing order.
+        '''
         data = self.read()[0]
         lang_code = self.env.user.lang
         # Initialize
         #############################################################
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
         sheet = workbook.add_worksheet('Trial Balance')
         sheet.set_zoom(100)
         sheet_2 = workbook.add_worksheet('Filters')
@@ -770,6 +839,7 @@ class InsTrialBalance(models.TransientModel):
 
         filter = record.prepare_values_for_component()
         account_lines = record.prepare_main_lines()
+        self.env['ins.report.job']._report_progress(total=len(account_lines))
 
         # Formats
         ############################################################
@@ -1067,19 +1137,4 @@ class InsTrialBalance(models.TransientModel):
                                 line_header_light_initial_ending_total)
                     sheet.write(row_pos, tmp+4, float(line.get('ending_credit') or 0),
                                 line_header_light_initial_ending_total)
-
-        # Close and return
-        #################################################################
-        workbook.close()
-        output.seek(0)
-        result = base64.b64encode(output.read())
-        report_id = self.env['common.xlsx.out'].sudo().create({'filedata': result, 'filename': 'TrialBalance.xls'})
-
-        return {
-            'type': 'ir.actions.act_url',
-            'url': '/web/binary/download_document?model=common.xlsx.out&field=filedata&id=%s&filename=%s.xls' % (
-                report_id.id, 'Trial Balance.xls'),
-            'target': 'new',
-        }
-
-        output.close()
+                self.env['ins.report.job']._report_progress()
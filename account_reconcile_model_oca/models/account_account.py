@@ -0,0 +1,11 @@
+from odoo import models
+
+
+class AccountAccount(models.Model):
+    _inherit = "account.account"
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "reconcile" in vals:
+            self.env["account.move.line.matching.token"]._refresh_accounts(self)
+        return res
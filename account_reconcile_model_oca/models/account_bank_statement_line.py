@@ -47,8 +47,9 @@ class AccountBankStatementLine(models.Model):
                 ("company_id", "=", self.company_id.id),
             ]
         )
+        narration = html2plaintext(self.narration or "").rstrip()
         for rec_model in rec_models:
-            partner = rec_model._get_partner_from_mapping(self)
+            partner = rec_model._get_partner_from_mapping(self, narration=narration)
             if partner and rec_model._is_applicable_for(self, partner):
                 return partner
 
@@ -0,0 +1,24 @@
+from odoo import models
+
+
+class AccountMove(models.Model):
+    _inherit = "account.move"
+
+    def _post(self, soft=True):
+        posted = super()._post(soft=soft)
+        self.env["account.move.line.matching.token"]._refresh_lines(posted.line_ids)
+        return posted
+
+    def button_draft(self):
+        lines = self.line_ids
+        res = super().button_draft()
+        self.env["account.move.line.matching.token"]._refresh_lines(lines.exists())
+        return res
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "name" in vals or "ref" in vals:
+            self.env["account.move.line.matching.token"]._refresh_lines(
+                self.filtered(lambda move: move.state == "posted").line_ids
+            )
+        return res
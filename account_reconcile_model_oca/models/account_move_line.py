@@ -0,0 +1,13 @@
+from odoo import models
+
+
+class AccountMoveLine(models.Model):
+    _inherit = "account.move.line"
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "name" in vals or "account_id" in vals:
+            self.env["account.move.line.matching.token"]._refresh_lines(
+                self.filtered(lambda line: line.parent_state == "posted")
+            )
+        return res
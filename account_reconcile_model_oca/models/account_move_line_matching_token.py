@@ -0,0 +1,146 @@
+from odoo import api, fields, models, tools
+
+# Text of the move lines matched by the 'invoice_matching' rule, see
+# AccountReconcileModel._get_invoice_matching_token_sources.
+TOKEN_SOURCES = {
+    "label": "account_move_line.name",
+    "note": "account_move.name",
+    "reference": "account_move.ref",
+}
+
+
+class AccountMoveLineMatchingToken(models.Model):
+    """Tokens of the open move lines on reconcilable accounts, as matched against the
+    tokens of the statement lines by the 'invoice_matching' reconcile models.
+    The table is maintained in SQL when moves are posted or reset to draft, when
+    their texts change and when lines are reconciled or unreconciled.
+    """
+
+    _name = "account.move.line.matching.token"
+    _description = "Journal Item Matching Token"
+    _log_access = False
+
+    move_line_id = fields.Many2one(
+        "account.move.line", required=True, index=True, ondelete="cascade"
+    )
+    source = fields.Selection(
+        [("label", "Label"), ("note", "Note"), ("reference", "Reference")],
+        required=True,
+    )
+    kind = fields.Selection(
+        [("numerical", "Numerical"), ("exact", "Exact")], required=True
+    )
+    token = fields.Char(required=True)
+
+    def init(self):
+        # Exact tokens are whole labels or references, too long for a btree.
+        tools.create_index(
+            self._cr,
+            "account_move_line_matching_token_token_index",
+            self._table,
+            ["token"],
+            method="hash",
+        )
+        self._cr.execute(f"SELECT 1 FROM {self._table} LIMIT 1")
+        if not self._cr.fetchone():
+            self.rebuild()
+
+    def _insert_tokens(self, where, params):
+        """Computes the tokens of the move lines selected by the given condition on
+        account_move_line. Only the posted, unreconciled lines on reconcilable accounts
+        get tokens. The numerical tokens are split the same way the statement lines
+        are in AccountReconcileModel._get_invoice_matching_st_line_tokens.
+        """
+        values = ", ".join(
+            f"('{source}', {column})" for source, column in TOKEN_SOURCES.items()
+        )
+        self._cr.execute(
+            rf"""
+                WITH texts AS (
+                    SELECT account_move_line.id AS move_line_id, src.source, src.value
+                    FROM account_move_line
+                    JOIN account_move ON account_move.id = account_move_line.move_id
+                    JOIN account_account
+                        ON account_account.id = account_move_line.account_id
+                    CROSS JOIN LATERAL (VALUES {values}) AS src(source, value)
+                    WHERE account_move_line.parent_state = 'posted'
+                        AND account_account.reconcile
+                        AND NOT COALESCE(account_move_line.reconciled, FALSE)
+                        AND COALESCE(src.value, '') != ''
+                        AND {where}
+                )
+                INSERT INTO {self._table} (move_line_id, source, kind, token)
+                SELECT move_line_id, source, 'numerical', token
+                FROM (
+                    SELECT
+                        move_line_id,
+                        source,
+                        UNNEST(
+                            REGEXP_SPLIT_TO_ARRAY(
+                                SUBSTRING(
+                                    REGEXP_REPLACE(value, '[^0-9\s]', '', 'g'),
+                                    '\S(?:.*\S)*'
+                                ),
+                                '\s+'
+                            )
+                        ) AS token
+                    FROM texts
+                ) AS numerical
+                UNION ALL
+                SELECT move_line_id, source, 'exact', value
+                FROM texts
+            """,
+            params,
+        )
+
+    def _flush_sources(self):
+        self.env["account.move.line"].flush_model(
+            ["name", "move_id", "account_id", "parent_state", "reconciled"]
+        )
+        self.env["account.move"].flush_model(["name", "ref"])
+        self.env["account.account"].flush_model(["reconcile"])
+
+    @api.model
+    def _refresh_lines(self, lines):
+        """Recomputes the tokens of the given move lines, dropping them for the lines
+        that are not open anymore.
+        """
+        if not lines:
+            return
+        self._flush_sources()
+        params = [tuple(lines.ids)]
+        self._cr.execute(
+            f"DELETE FROM {self._table} WHERE move_line_id IN %s", params
+        )
+        self._insert_tokens("account_move_line.id IN %s", params)
+
+    @api.model
+    def _refresh_accounts(self, accounts):
+        """Recomputes the tokens of all the move lines of the given accounts, e.g. when
+        their reconcile flag changes.
+        """
+        if not accounts:
+            return
+        self._flush_sources()
+        params = [tuple(accounts.ids)]
+        self._cr.execute(
+            f"""
+                DELETE FROM {self._table} matching_token
+                USING account_move_line
+                WHERE account_move_line.id = matching_token.move_line_id
+                    AND account_move_line.account_id IN %s
+            """,
+            params,
+        )
+        self._insert_tokens("account_move_line.account_id IN %s", params)
+
+    @api.model
+    def rebuild(self):
+        """Recomputes the whole table, e.g. after move lines were changed directly in
+        the database:
+            env["account.move.line.matching.token"].rebuild()
+        """
+        self._flush_sources()
+        self._cr.execute(f"TRUNCATE {self._table}")
+        self._insert_tokens("TRUE", [])
+        return True
@@ -0,0 +1,19 @@
+from odoo import api, models
+
+
+class AccountPartialReconcile(models.Model):
+    _inherit = "account.partial.reconcile"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        partials = super().create(vals_list)
+        self.env["account.move.line.matching.token"]._refresh_lines(
+            partials.debit_move_id | partials.credit_move_id
+        )
+        return partials
+
+    def unlink(self):
+        lines = self.debit_move_id | self.credit_move_id
+        res = super().unlink()
+        self.env["account.move.line.matching.token"]._refresh_lines(lines.exists())
+        return res
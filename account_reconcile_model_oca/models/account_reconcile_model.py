@@ -3,7 +3,7 @@ from collections import defaultdict
 
 from dateutil.relativedelta import relativedelta
 
-from odoo import Command, fields, models, tools
+from odoo import Command, api, fields, models, tools
 
 
 class AccountReconcileModel(models.Model):
@@ -199,6 +199,19 @@ class AccountReconcileModel(models.Model):
                             continue
 
                         if candidate_vals.get("amls"):
+                            excluded_ids = self.env.context.get(
+                                "invoice_matching_excluded_aml_ids"
+                            )
+                            if excluded_ids:
+                                # Reserved for other statement lines
+                                candidate_vals = {
+                                    **candidate_vals,
+                                    "amls": candidate_vals["amls"].filtered(
+                                        lambda aml, ids=excluded_ids: aml.id not in ids
+                                    ),
+                                }
+                                if not candidate_vals["amls"]:
+                                    continue
                             res = rec_model._get_invoice_matching_amls_result(
                                 st_line, partner, candidate_vals
                             )
@@ -374,17 +387,37 @@ class AccountReconcileModel(models.Model):
                 exact_tokens.append(text_value)
         return numerical_tokens, exact_tokens, text_tokens
 
+    def _get_invoice_matching_token_sources(self):
+        """The texts of the move lines matched with the tokens of the statement lines,
+        as stored in account.move.line.matching.token.
+        """
+        sources = []
+        if self.match_text_location_label:
+            sources.append("label")
+        if self.match_text_location_note:
+            sources.append("note")
+        if self.match_text_location_reference:
+            sources.append("reference")
+        return sources
+
+    def _get_invoice_matching_order_by(self, alias=None):
+        direction = "DESC" if self.matching_order == "new_first" else "ASC"
+        dotted_alias = f"{alias}." if alias else ""
+        return f"{dotted_alias}date_maturity {direction}, {dotted_alias}date {direction}, {dotted_alias}id {direction}"  # noqa: E501
+
     def _get_invoice_matching_amls_candidates(self, st_line, partner):
         """Returns the match candidates for the 'invoice_matching' rule, with respect to
         the provided parameters.
         :param st_line: A statement line.
         :param partner: The partner associated to the statement line.
         """
-
-        def get_order_by_clause(alias=None):
-            direction = "DESC" if self.matching_order == "new_first" else "ASC"
-            dotted_alias = f"{alias}." if alias else ""
-            return f"{dotted_alias}date_maturity {direction}, {dotted_alias}date {direction}, {dotted_alias}id {direction}"  # noqa: E501
+        prefetched = self.env.context.get("invoice_matching_candidates")
+        if prefetched and (self.id, st_line.id) in prefetched:
+            candidates = prefetched[(self.id, st_line.id)]
+            # Lines reconciled since the prefetch, e.g. by a previous statement line,
+            # are not candidates anymore: match again in that case.
+            if not candidates or not any(candidates["amls"].mapped("reconciled")):
+                return candidates
 
         assert self.rule_type == "invoice_matching"
         self.env["account.move"].flush_model()
@@ -397,113 +430,192 @@ class AccountReconcileModel(models.Model):
         from_clause = from_string
         where_clause = where_string
 
-        sub_queries = []
-        all_params = []
-        aml_cte = ""
         (
             numerical_tokens,
             exact_tokens,
             _text_tokens,
         ) = self._get_invoice_matching_st_line_tokens(st_line)
-        if numerical_tokens or exact_tokens:
-            aml_cte = rf"""
-                WITH aml_cte AS (
+        sources = self._get_invoice_matching_token_sources()
+        if (numerical_tokens or exact_tokens) and sources:
+            kinds = []
+            if numerical_tokens:
+                kinds.append("numerical")
+            if exact_tokens:
+                kinds.append("exact")
+            order_by = self._get_invoice_matching_order_by(alias="account_move_line")
+            # The tokens of the open move lines are kept in
+            # account.move.line.matching.token, looked up through its token index.
+            self._cr.execute(
+                f"""
                     SELECT
-                        account_move_line.id as account_move_line_id,
-                        account_move_line.date as account_move_line_date,
-                        account_move_line.date_maturity as account_move_line_date_maturity,
-                        account_move_line.name as account_move_line_name,
-                        account_move_line__move_id.name as account_move_line__move_id_name,
-                        account_move_line__move_id.ref as account_move_line__move_id_ref
+                        account_move_line.id,
+                        COUNT(*) AS nb_match
                     FROM {from_clause}
-                    JOIN account_move account_move_line__move_id
-                        ON account_move_line__move_id.id = account_move_line.move_id
+                    JOIN account_move_line_matching_token matching_token
+                        ON matching_token.move_line_id = account_move_line.id
                     WHERE {where_clause}
-                )
-            """  # noqa: E501
-            all_params += where_params
+                        AND matching_token.token IN %s
+                        AND matching_token.kind IN %s
+                        AND matching_token.source IN %s
+                    GROUP BY account_move_line.id
+                    ORDER BY nb_match DESC, {order_by}
+                """,
+                where_params
+                + [
+                    tuple(numerical_tokens + exact_tokens),
+                    tuple(kinds),
+                    tuple(sources),
+                ],
+            )
+            candidate_ids = [r[0] for r in self._cr.fetchall()]
+            if candidate_ids:
+                return {
+                    "allow_auto_reconcile": True,
+                    "amls": self.env["account.move.line"].browse(candidate_ids),
+                }
+            # In the case any of the Label, Note or Reference matching rule has been
+            # toggled, and the query didn't return
+            # any candidates, the model should not try to mount another aml instead.
+            return
 
-        enabled_matches = []
-        if self.match_text_location_label:
-            enabled_matches.append(("account_move_line", "name"))
-        if self.match_text_location_note:
-            enabled_matches.append(("account_move_line__move_id", "name"))
-        if self.match_text_location_reference:
-            enabled_matches.append(("account_move_line__move_id", "ref"))
+        return self._get_invoice_matching_amls_fallback_candidates(
+            st_line, partner, aml_domain
+        )
 
-        if numerical_tokens:
-            for table_alias, field in enabled_matches:
-                sub_queries.append(
-                    rf"""
-                    SELECT
-                        account_move_line_id as id,
-                        account_move_line_date as date,
-                        account_move_line_date_maturity as date_maturity,
-                        UNNEST(
-                            REGEXP_SPLIT_TO_ARRAY(
-                                SUBSTRING(
-                                    REGEXP_REPLACE(
-                                        {table_alias}_{field}, '[^0-9\s]', '', 'g'
-                                    ),
-                                    '\S(?:.*\S)*'
-                                ),
-                                '\s+'
-                            )
-                        ) AS token
-                    FROM aml_cte
-                    WHERE {table_alias}_{field} IS NOT NULL
-                """
-                )
+    def _get_invoice_matching_amls_candidates_batch(self, st_lines, partners):
+        """Same result as _get_invoice_matching_amls_candidates for many statement
+        lines. The statement lines sharing the same domain (the exclusion of their own
+        move lines aside) are matched on their tokens by a single query.
+        :param st_lines: The statement lines.
+        :param partners: A dict mapping each statement line with its partner.
+        :return: A dict mapping each statement line id with its candidates.
+        """
+        self.ensure_one()
+        assert self.rule_type == "invoice_matching"
+        self.env["account.move"].flush_model()
+        self.env["account.move.line"].flush_model()
 
-        if exact_tokens:
-            for table_alias, field in enabled_matches:
-                sub_queries.append(
-                    rf"""
-                    SELECT
-                        account_move_line_id as id,
-                        account_move_line_date as date,
-                        account_move_line_date_maturity as date_maturity,
-                        {table_alias}_{field} AS token
-                    FROM aml_cte
-                    WHERE COALESCE({table_alias}_{field}, '') != ''
-                """
+        sources = self._get_invoice_matching_token_sources()
+        results = {}
+        groups = defaultdict(list)
+        for st_line in st_lines:
+            partner = partners.get(st_line) or self.env["res.partner"]
+            aml_domain = self._get_invoice_matching_amls_domain(st_line, partner)
+            (
+                numerical_tokens,
+                exact_tokens,
+                _text_tokens,
+            ) = self._get_invoice_matching_st_line_tokens(st_line)
+            own_leaf = ("statement_line_id", "!=", st_line.id)
+            if (
+                not sources
+                or not (numerical_tokens or exact_tokens)
+                or any(isinstance(leaf, str) for leaf in aml_domain)
+            ):
+                # Nothing to match on, or a domain that can not be shared
+                results[st_line.id] = self._get_invoice_matching_amls_candidates(
+                    st_line, partner
                 )
+                continue
+            shared_domain = [
+                leaf for leaf in aml_domain if tuple(leaf) != own_leaf
+            ]
+            kinds = []
+            if numerical_tokens:
+                kinds.append("numerical")
+            if exact_tokens:
+                kinds.append("exact")
+            tokens = set(numerical_tokens + exact_tokens)
+            groups[repr(shared_domain)].append(
+                (st_line, partner, shared_domain, tokens, kinds)
+            )
 
-        if sub_queries:
-            order_by = get_order_by_clause(alias="sub")
+        order_by = self._get_invoice_matching_order_by(alias="account_move_line")
+        for group in groups.values():
+            query = self.env["account.move.line"]._where_calc(group[0][2])
+            from_clause, _from_params = query.from_clause
+            where_clause, where_params = query.where_clause
+            # One row per token of each statement line, any of the line's tokens
+            # matches any of its kinds, as in _get_invoice_matching_amls_candidates.
+            st_line_ids, st_tokens, st_kinds = [], [], []
+            for st_line, _partner, _domain, tokens, kinds in group:
+                for token in tokens:
+                    st_line_ids.append(st_line.id)
+                    st_tokens.append(token)
+                    st_kinds.append(",".join(kinds))
             self._cr.execute(
-                aml_cte
-                + """
+                f"""
                     SELECT
-                        sub.id,
+                        st.st_line_id,
+                        account_move_line.id,
                         COUNT(*) AS nb_match
-                    FROM ("""
-                + " UNION ALL ".join(sub_queries)
-                + """) AS sub
-                    WHERE sub.token IN %s
-                    GROUP BY sub.date_maturity, sub.date, sub.id
-                    HAVING COUNT(*) > 0
-                    ORDER BY nb_match DESC, """
-                + order_by
-                + """
+                    FROM {from_clause}
+                    JOIN account_move_line_matching_token matching_token
+                        ON matching_token.move_line_id = account_move_line.id
+                    JOIN UNNEST(%s::int[], %s::varchar[], %s::varchar[])
+                        AS st(st_line_id, token, kinds)
+                        ON st.token = matching_token.token
+                        AND matching_token.kind = ANY(string_to_array(st.kinds, ','))
+                    WHERE {where_clause}
+                        AND matching_token.source IN %s
+                        AND account_move_line.statement_line_id
+                            IS DISTINCT FROM st.st_line_id
+                    GROUP BY st.st_line_id, account_move_line.id
+                    ORDER BY st.st_line_id, nb_match DESC, {order_by}
                 """,
-                all_params + [tuple(numerical_tokens + exact_tokens)],
+                [st_line_ids, st_tokens, st_kinds] + where_params + [tuple(sources)],
             )
-            candidate_ids = [r[0] for r in self._cr.fetchall()]
-            if candidate_ids:
-                return {
-                    "allow_auto_reconcile": True,
-                    "amls": self.env["account.move.line"].browse(candidate_ids),
-                }
-            elif (
-                self.match_text_location_label
-                or self.match_text_location_note
-                or self.match_text_location_reference
-            ):
-                # In the case any of the Label, Note or Reference matching rule has been
-                # toggled, and the query didn't return
-                # any candidates, the model should not try to mount another aml instead.
-                return
+            candidate_ids = defaultdict(list)
+            for st_line_id, aml_id, _nb_match in self._cr.fetchall():
+                candidate_ids[st_line_id].append(aml_id)
+            for st_line, partner, _domain, _tokens, _kinds in group:
+                if candidate_ids[st_line.id]:
+                    results[st_line.id] = {
+                        "allow_auto_reconcile": True,
+                        "amls": self.env["account.move.line"].browse(
+                            candidate_ids[st_line.id]
+                        ),
+                    }
+                else:
+                    # A text location is enabled, the model does not try other
+                    # candidates, as in _get_invoice_matching_amls_candidates.
+                    results[st_line.id] = None
+        return results
+
+    def _prefetch_invoice_matching_candidates(self, st_lines, partners):
+        """Computes the candidates of all the 'invoice_matching' models for the given
+        statement lines at once, to be passed in the context as
+        invoice_matching_candidates. _get_invoice_matching_amls_candidates then uses
+        them instead of running its query for each statement line.
+        :param partners: A dict mapping each statement line with its partner.
+        :return: A dict mapping (model id, statement line id) with the candidates.
+        """
+        prefetched = {}
+        for rec_model in self.filtered(lambda m: m.rule_type == "invoice_matching"):
+            applicable = st_lines.filtered(
+                lambda st_line, rec_model=rec_model: rec_model._is_applicable_for(
+                    st_line, partners.get(st_line) or self.env["res.partner"]
+                )
+            )
+            if not applicable:
+                continue
+            batch = rec_model._get_invoice_matching_amls_candidates_batch(
+                applicable, partners
+            )
+            for st_line_id, candidates in batch.items():
+                prefetched[(rec_model.id, st_line_id)] = candidates
+        return prefetched
+
+    def _get_invoice_matching_amls_fallback_candidates(
+        self, st_line, partner, aml_domain
+    ):
+        """Candidates of the 'invoice_matching' rule when the text of the statement
+        line gives no token to match: the lines of the partner, or without partner the
+        lines having the residual amount of the statement line.
+        """
+        query = self.env["account.move.line"]._where_calc(aml_domain)
+        from_clause, _from_params = query.from_clause
+        where_clause, where_params = query.where_clause
 
         if not partner:
             st_line_currency = (
@@ -516,7 +628,7 @@ class AccountReconcileModel(models.Model):
             else:
                 aml_amount_field = "amount_residual_currency"
 
-            order_by = get_order_by_clause(alias="account_move_line")
+            order_by = self._get_invoice_matching_order_by(alias="account_move_line")
             self._cr.execute(
                 f"""
                     SELECT account_move_line.id
@@ -540,7 +652,7 @@ class AccountReconcileModel(models.Model):
             )
         else:
             amls = self.env["account.move.line"].search(
-                aml_domain, order=get_order_by_clause()
+                aml_domain, order=self._get_invoice_matching_order_by()
             )
         if amls:
             return {
@@ -562,13 +674,74 @@ class AccountReconcileModel(models.Model):
         rules_map[10].append(self._get_invoice_matching_amls_candidates)
         return rules_map
 
-    def _get_partner_from_mapping(self, st_line):
+    @tools.ormcache("self.id")
+    def _get_partner_mapping_matchers(self):
+        """Compiled partner mapping lines of the model, cleared whenever they change.
+        Consecutive lines only having a payment reference regex without groups are
+        combined into one alternation, whose matching group gives the partner.
+        :return: A tuple of (payment_ref_regex, narration_regex, partner_ids), the
+          regexes being None when not set.
+        """
+        matchers = []
+        alternatives = []
+
+        def add_alternatives():
+            if len(alternatives) > 1:
+                try:
+                    matchers.append(
+                        (
+                            re.compile(
+                                "|".join(f"({pattern})" for pattern, _p in alternatives)
+                            ),
+                            None,
+                            tuple(partner_id for _r, partner_id in alternatives),
+                        )
+                    )
+                    alternatives.clear()
+                    return
+                except re.error:
+                    pass
+            for pattern, partner_id in alternatives:
+                matchers.append((re.compile(pattern), None, (partner_id,)))
+            alternatives.clear()
+
+        for partner_mapping in self.partner_mapping_line_ids:
+            payment_ref_regex = (
+                re.compile(partner_mapping.payment_ref_regex)
+                if partner_mapping.payment_ref_regex
+                else None
+            )
+            if (
+                payment_ref_regex
+                and not payment_ref_regex.groups
+                and not partner_mapping.narration_regex
+            ):
+                alternatives.append(
+                    (partner_mapping.payment_ref_regex, partner_mapping.partner_id.id)
+                )
+                continue
+            add_alternatives()
+            matchers.append(
+                (
+                    payment_ref_regex,
+                    re.compile(partner_mapping.narration_regex)
+                    if partner_mapping.narration_regex
+                    else None,
+                    (partner_mapping.partner_id.id,),
+                )
+            )
+        add_alternatives()
+        return tuple(matchers)
+
+    def _get_partner_from_mapping(self, st_line, narration=None):
         """Find partner with mapping defined on model.
         For invoice matching rules, matches the statement line against each
         regex defined in partner mapping, and returns the partner corresponding
         to the first one matching.
         :param st_line (Model<account.bank.statement.line>):
             The statement line that needs a partner to be found
+        :param narration: The narration of the statement line as plain text, when
+            already converted.
         :return Model<res.partner>:
             The partner found from the mapping. Can be empty an empty recordset
             if there was nothing found from the mapping or if the function is
@@ -579,23 +752,24 @@ class AccountReconcileModel(models.Model):
         if self.rule_type not in ("invoice_matching", "writeoff_suggestion"):
             return self.env["res.partner"]
 
-        for partner_mapping in self.partner_mapping_line_ids:
-            match_payment_ref = (
-                re.match(partner_mapping.payment_ref_regex, st_line.payment_ref)
-                if partner_mapping.payment_ref_regex
-                else True
-            )
-            match_narration = (
-                re.match(
-                    partner_mapping.narration_regex,
-                    tools.html2plaintext(st_line.narration or "").rstrip(),
-                )
-                if partner_mapping.narration_regex
-                else True
-            )
-
-            if match_payment_ref and match_narration:
-                return partner_mapping.partner_id
+        for (
+            payment_ref_regex,
+            narration_regex,
+            partner_ids,
+        ) in self._get_partner_mapping_matchers():
+            match = None
+            if payment_ref_regex:
+                match = payment_ref_regex.match(st_line.payment_ref or "")
+                if not match:
+                    continue
+            if narration_regex:
+                if narration is None:
+                    narration = tools.html2plaintext(st_line.narration or "").rstrip()
+                if not narration_regex.match(narration):
+                    continue
+            if len(partner_ids) > 1:
+                return self.env["res.partner"].browse(partner_ids[match.lastindex - 1])
+            return self.env["res.partner"].browse(partner_ids[0])
         return self.env["res.partner"]
 
     def _get_invoice_matching_amls_result(self, st_line, partner, candidate_vals):  # noqa: C901
@@ -801,6 +975,23 @@ class AccountReconcileModel(models.Model):
         return {"rejected"}
 
 
+class AccountReconcileModelPartnerMapping(models.Model):
+    _inherit = "account.reconcile.model.partner.mapping"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env.registry.clear_cache()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env.registry.clear_cache()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super().unlink()
+
+
 class AccountReconcileModelLine(models.Model):
     _inherit = "account.reconcile.model.line"
 
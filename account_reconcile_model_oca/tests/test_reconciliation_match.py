@@ -301,6 +301,109 @@ class TestReconciliationMatchingRules(AccountTestInvoicingCommon):
             },
         )
 
+    @freeze_time("2020-01-01")
+    def test_invoice_matching_candidates_batch(self):
+        st_lines = (
+            self.bank_line_1
+            + self.bank_line_2
+            + self.bank_line_3
+            + self.bank_line_4
+            + self.bank_line_5
+            + self.cash_line_1
+        )
+        partners = {st_line: st_line._retrieve_partner() for st_line in st_lines}
+        for label_matching in (True, False):
+            self.rule_1.match_text_location_label = label_matching
+            batch = self.rule_1._get_invoice_matching_amls_candidates_batch(
+                st_lines, partners
+            )
+            for st_line in st_lines:
+                expected = self.rule_1._get_invoice_matching_amls_candidates(
+                    st_line, partners[st_line]
+                )
+                if expected:
+                    self.assertEqual(
+                        batch[st_line.id]["amls"].ids, expected["amls"].ids
+                    )
+                    self.assertEqual(
+                        batch[st_line.id]["allow_auto_reconcile"],
+                        expected["allow_auto_reconcile"],
+                    )
+                else:
+                    self.assertFalse(batch[st_line.id])
+
+        # The prefetched candidates are used by _apply_rules
+        self.rule_1.match_text_location_label = False
+        prefetched = self.rule_1._prefetch_invoice_matching_candidates(
+            st_lines, partners
+        )
+        rule = self.rule_1.with_context(invoice_matching_candidates=prefetched)
+        self._check_statement_matching(
+            rule,
+            {
+                self.bank_line_1: {"amls": self.invoice_line_1, "model": self.rule_1},
+                self.cash_line_1: {"amls": self.invoice_line_4, "model": self.rule_1},
+            },
+        )
+
+    @freeze_time("2020-01-01")
+    def test_invoice_matching_candidates_batch_kinds(self):
+        # The numerical token of the label is the exact token of the invoice
+        # reference, and the statement line has an exact token of its own.
+        invoice_line = self._create_invoice_line(
+            700, self.partner_3, "out_invoice", ref="20190917"
+        )
+        st_line = self._create_st_line(
+            amount=700,
+            payment_ref="paid 20190917",
+            ref="QWERTY",
+            partner_id=self.partner_3.id,
+        )
+        self.rule_1.write(
+            {
+                "match_text_location_label": True,
+                "match_text_location_reference": True,
+            }
+        )
+        partners = {st_line: self.partner_3}
+        expected = self.rule_1._get_invoice_matching_amls_candidates(
+            st_line, self.partner_3
+        )
+        self.assertIn(invoice_line, expected["amls"])
+        batch = self.rule_1._get_invoice_matching_amls_candidates_batch(
+            st_line, partners
+        )
+        self.assertEqual(batch[st_line.id]["amls"].ids, expected["amls"].ids)
+
+    def test_invoice_matching_tokens(self):
+        def get_tokens(line):
+            return self.env["account.move.line.matching.token"].search_read(
+                [("move_line_id", "=", line.id)], ["source", "kind", "token"]
+            )
+
+        invoice = self.invoice_line_1.move_id
+        tokens = [
+            (token["source"], token["kind"], token["token"])
+            for token in get_tokens(self.invoice_line_1)
+        ]
+        self.assertIn(("note", "exact", invoice.name), tokens)
+        self.assertIn(
+            ("note", "numerical", "".join(x for x in invoice.name if x.isdecimal())),
+            tokens,
+        )
+
+        # Reconciled lines are not indexed, until they are unreconciled.
+        self.env["account.payment.register"].with_context(
+            active_model="account.move", active_ids=invoice.ids
+        ).create({})._create_payments()
+        self.assertTrue(self.invoice_line_1.reconciled)
+        self.assertFalse(get_tokens(self.invoice_line_1))
+        self.invoice_line_1.remove_move_reconcile()
+        self.assertTrue(get_tokens(self.invoice_line_1))
+
+        invoice.button_draft()
+        self.assertFalse(get_tokens(self.invoice_line_1))
+
     def test_matching_fields_match_journal_ids(self):
         self.rule_1.match_text_location_label = False
         self.rule_1.match_journal_ids |= self.cash_line_1.journal_id
@@ -1139,6 +1242,25 @@ class TestReconciliationMatchingRules(AccountTestInvoicingCommon):
         # Matching is back thanks to "coincoin".
         self.assertEqual(st_line._retrieve_partner(), self.partner_1)
 
+    def test_partner_mapping_rule_combined(self):
+        st_line = self._create_st_line(partner_id=None, payment_ref="toto42")
+
+        rule = self._create_reconcile_model(
+            partner_mapping_line_ids=[
+                {"partner_id": self.partner_1.id, "payment_ref_regex": "titi"},
+                {"partner_id": self.partner_2.id, "payment_ref_regex": "toto4"},
+                {"partner_id": self.partner_3.id, "payment_ref_regex": "toto.*"},
+            ],
+        )
+        # The first matching line of the alternation gives the partner.
+        self.assertEqual(len(rule._get_partner_mapping_matchers()), 1)
+        self.assertEqual(st_line._retrieve_partner(), self.partner_2)
+
+        # The compiled lines follow the changes of the mapping.
+        rule.partner_mapping_line_ids[1].payment_ref_regex = "(toto)5"
+        self.assertEqual(len(rule._get_partner_mapping_matchers()), 3)
+        self.assertEqual(st_line._retrieve_partner(), self.partner_3)
+
     def test_match_multi_currencies(self):
         """Ensure the matching of candidates is made using the right statement line
         currency. In this test, the value of the statement line is 100 USD = 300
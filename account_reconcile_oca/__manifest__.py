@@ -19,6 +19,7 @@
         "views/res_config_settings.xml",
         "security/ir.model.access.csv",
         "security/security.xml",
+        "data/ir_cron.xml",
         "views/account_account_reconcile.xml",
         "views/account_bank_statement_line.xml",
         "views/account_move_line.xml",
@@ -7,3 +7,5 @@ from . import account_move_line
 from . import res_company
 from . import res_config_settings
 from . import account_move
+from . import account_account
+from . import account_partial_reconcile
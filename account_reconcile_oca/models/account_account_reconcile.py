@@ -1,7 +1,9 @@
 # Copyright 2023 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import api, fields, models
+import json
+
+from odoo import api, fields, models, tools
 
 
 class CharId(fields.Id):
@@ -31,110 +33,97 @@ class AccountAccountReconcile(models.Model):
         )
         return query
 
+    @api.model
+    def _is_account_name_translated(self):
+        return bool(self.env["account.account"]._fields["name"].translate)
+
     def _select(self):
-        account_account_name_field = (
-            self.env["ir.model.fields"]
-            .sudo()
-            .search([("model", "=", "account.account"), ("name", "=", "name")])
-        )
         account_name = (
             f"a.name ->> '{self.env.user.lang}'"
-            if account_account_name_field.translate
+            if self._is_account_name_translated()
             else "a.name"
         )
         return f"""
             SELECT
-                min(aml.id) as id,
-                MAX({account_name}) as name,
-                CASE
-                    WHEN a.account_type in ('asset_receivable', 'liability_payable')
-                        THEN aml.partner_id
-                    ELSE NULL
-                    END as partner_id,
-                a.id as account_id,
+                s.first_line_id as id,
+                {account_name} as name,
+                s.partner_id,
+                s.account_id,
                 FALSE as is_reconciled,
-                aml.currency_id as currency_id,
-                am.company_id,
+                s.currency_id,
+                s.company_id,
                 null as foreign_currency_id,
-                (
-                    SUM(
-                        CASE WHEN aml.amount_residual > 0
-                        THEN aml.amount_residual
-                        ELSE 0 END
-                    ) > 0
-                    AND SUM(
-                        CASE WHEN aml.amount_residual < 0
-                        THEN -aml.amount_residual
-                        ELSE 0 END
-                    ) > 0
-                ) as active
+                (s.residual_debit > 0 AND s.residual_credit > 0) as active
         """
 
     def _from(self):
         return """
             FROM
-                account_account a
-                INNER JOIN account_move_line aml ON aml.account_id = a.id
-                INNER JOIN account_move am ON am.id = aml.move_id
+                account_account_reconcile_summary s
+                INNER JOIN account_account a ON a.id = s.account_id
             """
 
     def _where(self):
         return """
-            WHERE a.reconcile
-                AND am.state = 'posted'
         """
 
     def _groupby(self):
         return """
-            GROUP BY
-                a.id,
-                CASE
-                    WHEN a.account_type in ('asset_receivable', 'liability_payable')
-                        THEN aml.partner_id
-                    ELSE NULL
-                END,
-                aml.currency_id,
-                am.company_id
         """
 
     def _having(self):
         return """
         """
 
+    def _get_reconcile_data_records(self):
+        """:return: A dict mapping the ids of the records with the drafts of the
+        current user, fetched at once.
+        """
+        data_records = self.env["account.account.reconcile.data"].search(
+            [("user_id", "=", self.env.user.id), ("reconcile_id", "in", self.ids)]
+        )
+        data_by_reconcile_id = {}
+        for data_record in data_records:
+            data_by_reconcile_id.setdefault(data_record.reconcile_id, data_record)
+        return data_by_reconcile_id
+
     def _compute_reconcile_data_info(self):
-        data_obj = self.env["account.account.reconcile.data"]
-        for record in self:
-            if self.env.context.get("default_account_move_lines"):
+        if self.env.context.get("default_account_move_lines"):
+            for record in self:
                 data = {
                     "data": [],
                     "counterparts": self.env.context.get("default_account_move_lines"),
                 }
                 record.reconcile_data_info = self._recompute_data(data)
-                continue
-            data_record = data_obj.search(
-                [("user_id", "=", self.env.user.id), ("reconcile_id", "=", record.id)]
-            )
+            return
+        data_by_reconcile_id = self._get_reconcile_data_records()
+        for record in self:
+            data_record = data_by_reconcile_id.get(record.id)
             if data_record:
                 record.reconcile_data_info = data_record.data
             else:
                 record.reconcile_data_info = {"data": [], "counterparts": []}
 
     def _inverse_reconcile_data_info(self):
-        data_obj = self.env["account.account.reconcile.data"]
+        data_by_reconcile_id = self._get_reconcile_data_records()
+        vals_list = []
+        updates = []
         for record in self:
-            data_record = data_obj.search(
-                [("user_id", "=", self.env.user.id), ("reconcile_id", "=", record.id)]
-            )
+            data_record = data_by_reconcile_id.get(record.id)
             if data_record:
-                data_record.data = record.reconcile_data_info
+                updates.append((data_record.id, json.dumps(record.reconcile_data_info)))
             else:
-                data_obj.create(
+                vals_list.append(
                     {
                         "reconcile_id": record.id,
                         "user_id": self.env.user.id,
                         "data": record.reconcile_data_info,
                     }
                 )
+        if updates:
+            self.env["account.account.reconcile.data"]._write_data(updates)
+        if vals_list:
+            self.env["account.account.reconcile.data"].create(vals_list)
 
     @api.onchange("add_account_move_line_id")
     def _onchange_add_account_move_line(self):
@@ -208,5 +197,274 @@ class AccountAccountReconcileData(models.TransientModel):
     _description = "Reconcile data model to store user info"
 
     user_id = fields.Many2one("res.users", required=True)
-    reconcile_id = fields.Integer(required=True)
+    reconcile_id = fields.Integer(required=True, index=True)
     data = fields.Serialized()
+
+    @api.model
+    def _write_data(self, updates):
+        """Writes the drafts of the given (id, serialized data) pairs with a single
+        UPDATE.
+        """
+        ids, data = zip(*updates)
+        self.flush_model()
+        self.env.cr.execute(
+            f"""
+                UPDATE {self._table} d
+                SET data = u.data,
+                    write_uid = %s,
+                    write_date = (now() at time zone 'UTC')
+                FROM UNNEST(%s::int[], %s::text[]) AS u(id, data)
+                WHERE d.id = u.id
+            """,
+            [self.env.uid, list(ids), list(data)],
+        )
+        self.browse(ids).invalidate_recordset(["data", "write_uid", "write_date"])
+
+    @api.autovacuum
+    def _gc_stale_drafts(self):
+        """Drafts left on groups that are not open anymore, e.g. reconciled from
+        another screen, or of archived users. The other ones are removed by the
+        transient model vacuum once older than the transient age limit.
+        """
+        self.env["account.account.reconcile.summary"].flush_model()
+        self.flush_model()
+        self.env.cr.execute(
+            f"""
+                DELETE FROM {self._table} d
+                WHERE NOT EXISTS (
+                    SELECT 1
+                    FROM account_account_reconcile_summary s
+                    WHERE s.first_line_id = d.reconcile_id
+                        AND s.residual_debit > 0
+                        AND s.residual_credit > 0
+                )
+                OR d.user_id IN (SELECT id FROM res_users WHERE NOT active)
+            """
+        )
+        self.invalidate_model()
+
+
+class AccountAccountReconcileSummary(models.Model):
+    """Open amounts of the posted lines on reconcilable accounts, by account, partner
+    (receivable and payable accounts only), currency and company. Read by
+    account.account.reconcile. The residuals of the lines are subtracted before
+    and added back after the moves are posted or reset to draft, the lines change
+    and they are reconciled or unreconciled. The groups of an account are
+    recomputed when the account changes.
+    """
+
+    _name = "account.account.reconcile.summary"
+    _description = "Account Reconcile Summary"
+    _log_access = False
+
+    first_line_id = fields.Integer(
+        required=True, help="Smallest journal item of the group, used as id"
+    )
+    account_id = fields.Many2one("account.account", required=True, ondelete="cascade")
+    partner_id = fields.Many2one("res.partner", ondelete="cascade")
+    currency_id = fields.Many2one("res.currency")
+    company_id = fields.Many2one("res.company", required=True, ondelete="cascade")
+    # Numeric columns, the residuals are summed by deltas
+    residual_debit = fields.Float(digits=0)
+    residual_credit = fields.Float(digits=0)
+
+    def init(self):
+        tools.create_unique_index(
+            self._cr,
+            "account_account_reconcile_summary_key_unique_index",
+            self._table,
+            [
+                "account_id",
+                "COALESCE(partner_id, 0)",
+                "COALESCE(currency_id, 0)",
+                "company_id",
+            ],
+        )
+        tools.create_index(
+            self._cr,
+            "account_account_reconcile_summary_first_line_id_index",
+            self._table,
+            ["first_line_id"],
+        )
+        self._cr.execute(f"SELECT 1 FROM {self._table} LIMIT 1")
+        if not self._cr.fetchone():
+            self.rebuild()
+
+    def _partner_key(self):
+        return """
+            CASE
+                WHEN a.account_type in ('asset_receivable', 'liability_payable')
+                    THEN aml.partner_id
+                ELSE NULL
+            END
+        """
+
+    def _flush_sources(self):
+        self.env["account.move.line"].flush_model(
+            [
+                "account_id",
+                "partner_id",
+                "currency_id",
+                "move_id",
+                "amount_residual",
+            ]
+        )
+        self.env["account.move"].flush_model(["state", "company_id"])
+        self.env["account.account"].flush_model(["reconcile", "account_type"])
+
+    def _add_groups(self, where, params, sign=1):
+        """Adds the residuals of the posted lines on reconcilable accounts selected by
+        the given condition to their groups, or subtracts them when sign is -1. Each
+        group is updated in place by its own delta.
+        """
+        partner_key = self._partner_key()
+        self._cr.execute(
+            f"""
+                INSERT INTO {self._table} AS s
+                    (first_line_id, account_id, partner_id, currency_id, company_id,
+                     residual_debit, residual_credit)
+                SELECT
+                    MIN(aml.id),
+                    a.id,
+                    {partner_key},
+                    aml.currency_id,
+                    am.company_id,
+                    %s * SUM(
+                        CASE WHEN aml.amount_residual > 0
+                        THEN aml.amount_residual
+                        ELSE 0 END
+                    ),
+                    %s * SUM(
+                        CASE WHEN aml.amount_residual < 0
+                        THEN -aml.amount_residual
+                        ELSE 0 END
+                    )
+                FROM account_account a
+                INNER JOIN account_move_line aml ON aml.account_id = a.id
+                INNER JOIN account_move am ON am.id = aml.move_id
+                WHERE a.reconcile
+                    AND am.state = 'posted'
+                    {where}
+                GROUP BY a.id, {partner_key}, aml.currency_id, am.company_id
+                ON CONFLICT (
+                    account_id,
+                    COALESCE(partner_id, 0),
+                    COALESCE(currency_id, 0),
+                    company_id
+                )
+                DO UPDATE SET
+                    first_line_id = LEAST(s.first_line_id, EXCLUDED.first_line_id),
+                    residual_debit = s.residual_debit + EXCLUDED.residual_debit,
+                    residual_credit = s.residual_credit + EXCLUDED.residual_credit
+            """,
+            [sign, sign] + params,
+        )
+        self.invalidate_model()
+
+    @api.model
+    def _add_lines(self, lines, sign=1):
+        """Adds the residuals of the given move lines to their groups, or subtracts
+        them with sign -1 before the lines change.
+        """
+        if not lines:
+            return
+        self._flush_sources()
+        self._add_groups("AND aml.id IN %s", [tuple(lines.ids)], sign=sign)
+
+    @api.model
+    def _add_lines_back(self, lines):
+        """Adds back the residuals of the given move lines subtracted before their
+        change, for the ones still posted, then gives a new id to the groups they
+        were the first line of and left.
+        """
+        line_ids = lines.ids
+        self._add_lines(lines.exists())
+        self._move_first_lines(line_ids)
+
+    def _move_first_lines(self, line_ids):
+        """The groups whose first line is one of the given ones but does not belong to
+        them anymore, e.g. reset to draft or moved to another partner, get the smallest
+        line left as id. The ones left without lines are removed, as in rebuild.
+        """
+        if not line_ids:
+            return
+        self._flush_sources()
+        group_lines = f"""
+            FROM account_move_line aml
+            JOIN account_account a ON a.id = aml.account_id
+            JOIN account_move am ON am.id = aml.move_id
+            WHERE a.reconcile
+                AND am.state = 'posted'
+                AND aml.account_id = s.account_id
+                AND {self._partner_key()} IS NOT DISTINCT FROM s.partner_id
+                AND aml.currency_id IS NOT DISTINCT FROM s.currency_id
+                AND am.company_id = s.company_id
+        """
+        self._cr.execute(
+            f"""
+                SELECT s.id, (SELECT MIN(aml.id) {group_lines})
+                FROM {self._table} s
+                WHERE s.first_line_id IN %s
+                    AND NOT EXISTS (SELECT 1 {group_lines} AND aml.id = s.first_line_id)
+            """,
+            [tuple(line_ids)],
+        )
+        rows = self._cr.fetchall()
+        empty_ids = [row_id for row_id, first_line_id in rows if not first_line_id]
+        moved = [row for row in rows if row[1]]
+        if empty_ids:
+            self._cr.execute(
+                f"DELETE FROM {self._table} WHERE id IN %s", [tuple(empty_ids)]
+            )
+        if moved:
+            self._cr.execute(
+                f"""
+                    UPDATE {self._table} s
+                    SET first_line_id = m.first_line_id
+                    FROM UNNEST(%s::int[], %s::int[]) AS m(id, first_line_id)
+                    WHERE s.id = m.id
+                """,
+                [list(column) for column in zip(*moved)],
+            )
+        self.invalidate_model()
+
+    @api.model
+    def _get_lines_to_update(self, lines):
+        """:return: The given move lines but the ones an enclosing call already
+        subtracts and adds back, e.g. the lines of a move posted while its reversed
+        entry gets reconciled.
+        """
+        handled_ids = set(self.env.context.get("reconcile_summary_line_ids", ()))
+        return lines.filtered(lambda line: line.id not in handled_ids)
+
+    @api.model
+    def _with_lines_updated(self, records, lines):
+        """:return: The records with a context telling the nested calls that the
+        given lines are updated by the caller.
+        """
+        handled_ids = self.env.context.get("reconcile_summary_line_ids", ())
+        return records.with_context(
+            reconcile_summary_line_ids=tuple(handled_ids) + tuple(lines.ids)
+        )
+
+    @api.model
+    def _refresh_accounts(self, accounts):
+        if not accounts:
+            return
+        self._flush_sources()
+        self._cr.execute(
+            f"DELETE FROM {self._table} WHERE account_id IN %s",
+            [tuple(accounts.ids)],
+        )
+        self._add_groups("AND a.id IN %s", [tuple(accounts.ids)])
+
+    @api.model
+    def rebuild(self):
+        """Recomputes the whole summary, e.g. after move lines were changed directly
+        in the database:
+            env["account.account.reconcile.summary"].rebuild()
+        """
+        self._flush_sources()
+        self._cr.execute(f"TRUNCATE {self._table}")
+        self._add_groups("", [])
+        return True
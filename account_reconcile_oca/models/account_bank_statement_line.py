@@ -1,6 +1,7 @@
 # Copyright 2023 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+import logging
 from collections import defaultdict
 
 from dateutil import rrule
@@ -12,6 +13,7 @@ from odoo.fields import first
 from odoo.tools import LazyTranslate, float_compare, float_is_zero
 
 _lt = LazyTranslate(__name__, default_lang="en_US")
+_logger = logging.getLogger(__name__)
 
 
 class AccountBankStatementLine(models.Model):
@@ -549,12 +551,14 @@ class AccountBankStatementLine(models.Model):
 
     @api.depends("reconcile_data", "is_reconciled")
     def _compute_reconcile_data_info(self):
+        rule_results = self._get_reconcile_proposals()
         for record in self:
             if record.reconcile_data and not record.is_reconciled:
                 record.reconcile_data_info = record.reconcile_data
             else:
                 record.reconcile_data_info = record._default_reconcile_data(
-                    from_unreconcile=record.is_reconciled
+                    from_unreconcile=record.is_reconciled,
+                    rule_result=rule_results.get(record),
                 )
             record.can_reconcile = record.reconcile_data_info.get(
                 "can_reconcile", False
@@ -570,6 +574,177 @@ class AccountBankStatementLine(models.Model):
         )
         return action
 
+    def _get_reconcile_proposals(self, contested_ids=None):
+        """Applies the reconcile models to all the statement lines needing a proposal
+        at once, sharing their candidates. A journal item proposed to several
+        statement lines is reserved for the one it fits best, see
+        _get_reconcile_proposal_score. The other ones are matched again without it.
+        :param contested_ids: A set filled with the ids of the statement lines that
+          were proposed the same journal items as another one.
+        :return: A dict mapping each statement line with its _apply_rules result.
+        """
+        st_lines = self.filtered(
+            lambda r: not r.is_reconciled and not r.reconcile_data
+        )
+        if len(st_lines) < 2 and contested_ids is None:
+            return {}
+        rec_models = self.env["account.reconcile.model"].search(
+            [
+                ("rule_type", "in", ["invoice_matching", "writeoff_suggestion"]),
+                ("company_id", "in", st_lines.company_id.ids),
+            ]
+        )
+        partners = {st_line: st_line._retrieve_partner() for st_line in st_lines}
+        prefetched = st_lines._prefetch_invoice_matching_candidates(
+            models=rec_models, partners=partners
+        )
+        proposals = {}
+        reserved_ids = set()
+        pending = st_lines
+        while pending:
+            rule_results = {
+                st_line: rec_models.filtered(
+                    lambda m, c=st_line.company_id: m.company_id == c
+                )
+                .with_context(
+                    invoice_matching_candidates=prefetched,
+                    invoice_matching_excluded_aml_ids=frozenset(reserved_ids),
+                )
+                ._apply_rules(st_line, partners[st_line])
+                for st_line in pending
+            }
+            if contested_ids is not None:
+                st_line_ids_by_aml = defaultdict(set)
+                for st_line, rule_result in rule_results.items():
+                    for aml in rule_result.get("amls") or []:
+                        st_line_ids_by_aml[aml.id].add(st_line.id)
+                for st_line_ids in st_line_ids_by_aml.values():
+                    if len(st_line_ids) > 1:
+                        contested_ids |= st_line_ids
+            retry = self.browse()
+            for st_line in pending.sorted(
+                lambda r: r._get_reconcile_proposal_score(rule_results[r]),
+                reverse=True,
+            ):
+                amls = rule_results[st_line].get("amls")
+                aml_ids = set(amls.ids) if amls else set()
+                if aml_ids & reserved_ids:
+                    # Taken by a better fitting statement line of this round
+                    retry |= st_line
+                    continue
+                reserved_ids |= aml_ids
+                proposals[st_line] = rule_results[st_line]
+            pending = retry
+        return proposals
+
+    def _auto_reconcile_batch(self):
+        """Reconciles the statement lines having an auto reconcile proposal, without
+        opening them. Proposals that do not allow auto reconcile, or that other lines
+        of the batch were proposed too, are left for the users.
+        :return: A dict counting the lines by outcome.
+        """
+        stats = dict.fromkeys(
+            ["reconciled", "proposed", "ambiguous", "unmatched", "failed"], 0
+        )
+        contested_ids = set()
+        proposals = self._get_reconcile_proposals(contested_ids=contested_ids)
+        for st_line in self:
+            rule_result = proposals.get(st_line)
+            if rule_result is None:
+                # Reconciled meanwhile or being edited by a user
+                continue
+            if not rule_result:
+                stats["unmatched"] += 1
+                continue
+            if st_line.id in contested_ids:
+                stats["ambiguous"] += 1
+                continue
+            if not rule_result.get("auto_reconcile"):
+                stats["proposed"] += 1
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    data = st_line._default_reconcile_data(
+                        rule_result={**rule_result, "auto_reconcile": False}
+                    )
+                    if not data.get("can_reconcile"):
+                        stats["proposed"] += 1
+                        continue
+                    st_line.reconcile_mode = st_line.journal_id.reconcile_mode
+                    getattr(
+                        st_line, f"_reconcile_bank_line_{st_line.reconcile_mode}"
+                    )(st_line._prepare_reconcile_line_data(data["data"]))
+                stats["reconciled"] += 1
+            except Exception:
+                _logger.exception(
+                    "Auto reconcile of statement line %s failed", st_line.id
+                )
+                stats["failed"] += 1
+        return stats
+
+    def _get_reconcile_proposal_score(self, rule_result):
+        """Sort key of the proposals competing for the same journal items: the
+        proposals that can be auto reconciled first, then the ones leaving the
+        smallest open amount on the statement line.
+        """
+        amls = rule_result.get("amls")
+        if not amls:
+            return (False, 0.0)
+        liquidity_lines, _suspense_lines, _other_lines = self._seek_for_lines()
+        gap = sum(liquidity_lines.mapped("balance")) - sum(
+            amls.mapped("amount_residual")
+        )
+        return (
+            bool(rule_result.get("auto_reconcile")),
+            -self.company_currency_id.round(abs(gap)),
+        )
+
+    def _prefetch_invoice_matching_candidates(self, models=None, partners=None):
+        """Matches the statement lines needing a proposal against the open journal
+        items in one query per reconcile model, instead of one per statement line.
+        :param models: The reconcile models to use, by default the matching models
+          of the company of each statement line.
+        :param partners: A dict mapping the statement lines with their partner, when
+          already retrieved.
+        :return: The candidates, to be passed as invoice_matching_candidates in the
+          context of _apply_rules.
+        """
+        st_lines = self.filtered(
+            lambda r: not r.is_reconciled and not r.reconcile_data
+        )
+        if len(st_lines) < 2:
+            return {}
+        prefetched = {}
+        for company in st_lines.company_id:
+            company_lines = st_lines.filtered(lambda r, c=company: r.company_id == c)
+            if models is None:
+                company_models = self.env["account.reconcile.model"].search(
+                    [
+                        (
+                            "rule_type",
+                            "in",
+                            ["invoice_matching", "writeoff_suggestion"],
+                        ),
+                        ("company_id", "=", company.id),
+                    ]
+                )
+            else:
+                company_models = models.filtered(
+                    lambda m, c=company: m.company_id == c
+                )
+            company_partners = {
+                st_line: partners[st_line]
+                if partners is not None
+                else st_line._retrieve_partner()
+                for st_line in company_lines
+            }
+            prefetched.update(
+                company_models._prefetch_invoice_matching_candidates(
+                    company_lines, company_partners
+                )
+            )
+        return prefetched
+
     def _inverse_reconcile_data_info(self):
         for record in self:
             record.reconcile_data = record.reconcile_data_info
@@ -644,7 +819,7 @@ class AccountBankStatementLine(models.Model):
             new_data.append(new_line)
         return new_data, reconcile_auxiliary_id
 
-    def _default_reconcile_data(self, from_unreconcile=False):
+    def _default_reconcile_data(self, from_unreconcile=False, rule_result=None):
         liquidity_lines, suspense_lines, other_lines = self._seek_for_lines()
         data = []
         reconcile_auxiliary_id = 1
@@ -657,20 +832,22 @@ class AccountBankStatementLine(models.Model):
             )
             data += lines
         if not from_unreconcile:
-            res = (
-                self.env["account.reconcile.model"]
-                .search(
-                    [
-                        (
-                            "rule_type",
-                            "in",
-                            ["invoice_matching", "writeoff_suggestion"],
-                        ),
-                        ("company_id", "=", self.company_id.id),
-                    ]
+            res = rule_result
+            if res is None:
+                res = (
+                    self.env["account.reconcile.model"]
+                    .search(
+                        [
+                            (
+                                "rule_type",
+                                "in",
+                                ["invoice_matching", "writeoff_suggestion"],
+                            ),
+                            ("company_id", "=", self.company_id.id),
+                        ]
+                    )
+                    ._apply_rules(self, self._retrieve_partner())
                 )
-                ._apply_rules(self, self._retrieve_partner())
-            )
             if res and res.get("status", "") == "write_off":
                 return self._recompute_suspense_line(
                     *self._reconcile_data_by_model(
@@ -982,8 +1159,11 @@ class AccountBankStatementLine(models.Model):
                 ("auto_reconcile", "=", True),
             ]
         )
+        prefetched = result._prefetch_invoice_matching_candidates(models=models)
         for record in result:
-            res = models._apply_rules(record, record._retrieve_partner())
+            res = models.with_context(
+                invoice_matching_candidates=prefetched
+            )._apply_rules(record, record._retrieve_partner())
             if not res:
                 continue
             liquidity_lines, suspense_lines, other_lines = record._seek_for_lines()
@@ -1,7 +1,12 @@
 # Copyright 2023 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import _, fields, models
+import logging
+import time
+
+from odoo import _, api, fields, models
+
+_logger = logging.getLogger(__name__)
 
 
 class AccountJournal(models.Model):
@@ -25,6 +30,11 @@ class AccountJournal(models.Model):
         string="Reconcile aggregation",
         help="Aggregation to use on reconcile view",
     )
+    reconcile_auto_batch = fields.Boolean(
+        string="Auto reconcile in batch",
+        help="Reconcile the statement lines of this journal with the auto reconcile "
+        "models every night, before the users open them.",
+    )
 
     def get_rainbowman_message(self):
         self.ensure_one()
@@ -46,3 +56,72 @@ class AccountJournal(models.Model):
                 "account_reconcile_oca.action_bank_statement_line_reconcile_all"
             )
         return action
+
+    def action_auto_reconcile(self):
+        stats = self._auto_reconcile_statement_lines()
+        return {
+            "type": "ir.actions.client",
+            "tag": "display_notification",
+            "params": {
+                "title": _("Auto reconcile"),
+                "message": _(
+                    "%(reconciled)s of %(processed)s lines reconciled, "
+                    "%(ambiguous)s ambiguous, %(proposed)s left to review, "
+                    "%(unmatched)s without match, %(failed)s failed.",
+                    **stats,
+                ),
+                "type": "success",
+                "sticky": False,
+            },
+        }
+
+    @api.model
+    def _cron_auto_reconcile(self):
+        self.search(
+            [("reconcile_auto_batch", "=", True), ("type", "in", ("bank", "cash"))]
+        )._auto_reconcile_statement_lines(commit=True)
+
+    def _auto_reconcile_statement_lines(self, commit=False):
+        """Auto reconciles the open statement lines of the journals, by chunks of
+        account_reconcile_oca.auto_reconcile_chunk_size lines (500 by default).
+        :param commit: Commit after each chunk, for the scheduled action.
+        :return: A dict counting the lines by outcome.
+        """
+        chunk_size = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("account_reconcile_oca.auto_reconcile_chunk_size", 500)
+        )
+        start = time.monotonic()
+        st_lines = self.env["account.bank.statement.line"].search(
+            [("journal_id", "in", self.ids), ("is_reconciled", "=", False)],
+            order="date, id",
+        )
+        stats = dict.fromkeys(
+            ["processed", "reconciled", "proposed", "ambiguous", "unmatched", "failed"],
+            0,
+        )
+        for offset in range(0, len(st_lines), chunk_size):
+            chunk = st_lines[offset : offset + chunk_size]
+            for key, value in chunk._auto_reconcile_batch().items():
+                stats[key] += value
+            stats["processed"] += len(chunk)
+            if commit:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            self.env.invalidate_all()
+        duration = time.monotonic() - start
+        _logger.info(
+            "Auto reconcile of journals %s: %s lines in %.1fs (%.1f lines/s), "
+            "%s reconciled, %s ambiguous, %s left to review, %s without match, "
+            "%s failed",
+            self.ids,
+            stats["processed"],
+            duration,
+            stats["processed"] / duration if duration else 0.0,
+            stats["reconciled"],
+            stats["ambiguous"],
+            stats["proposed"],
+            stats["unmatched"],
+            stats["failed"],
+        )
+        return stats
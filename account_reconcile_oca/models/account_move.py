@@ -23,3 +23,24 @@ class AccountMove(models.Model):
                     move.is_bank_statements_reconciled = False
             else:
                 move.is_bank_statements_reconciled = False
+
+    def _post(self, soft=True):
+        summary = self.env["account.account.reconcile.summary"]
+        lines = summary._get_lines_to_update(self.line_ids)
+        posted = super(AccountMove, summary._with_lines_updated(self, lines))._post(
+            soft=soft
+        )
+        # The lines were not counted while the moves were draft, nor the ones added
+        # on posting
+        summary._add_lines(summary._get_lines_to_update(self.line_ids))
+        return posted.with_env(self.env)
+
+    def button_draft(self):
+        summary = self.env["account.account.reconcile.summary"]
+        lines = summary._get_lines_to_update(self.line_ids)
+        summary._add_lines(lines, sign=-1)
+        res = super(
+            AccountMove, summary._with_lines_updated(self, lines)
+        ).button_draft()
+        summary._add_lines_back(lines)
+        return res
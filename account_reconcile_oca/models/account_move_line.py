@@ -1,13 +1,44 @@
 # Copyright 2023 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from odoo import _, models
+from odoo import _, api, models
 from odoo.exceptions import ValidationError
 
 
 class AccountMoveLine(models.Model):
     _inherit = "account.move.line"
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        summary = self.env["account.account.reconcile.summary"]
+        summary._add_lines(
+            summary._get_lines_to_update(
+                lines.filtered(lambda line: line.parent_state == "posted")
+            )
+        )
+        return lines
+
+    def write(self, vals):
+        if not {"account_id", "partner_id", "currency_id"} & set(vals):
+            return super().write(vals)
+        summary = self.env["account.account.reconcile.summary"]
+        lines = summary._get_lines_to_update(self)
+        summary._add_lines(lines, sign=-1)
+        res = super(AccountMoveLine, summary._with_lines_updated(self, lines)).write(
+            vals
+        )
+        summary._add_lines_back(lines)
+        return res
+
+    def unlink(self):
+        summary = self.env["account.account.reconcile.summary"]
+        lines = summary._get_lines_to_update(self)
+        summary._add_lines(lines, sign=-1)
+        res = super(AccountMoveLine, summary._with_lines_updated(self, lines)).unlink()
+        summary._add_lines_back(lines)
+        return res
+
     def action_reconcile_manually(self):
         if not self:
             return {}
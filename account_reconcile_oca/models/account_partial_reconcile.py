@@ -0,0 +1,36 @@
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+
+class AccountPartialReconcile(models.Model):
+    _inherit = "account.partial.reconcile"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        summary = self.env["account.account.reconcile.summary"]
+        line_ids = {
+            vals[fname]
+            for vals in vals_list
+            for fname in ("debit_move_id", "credit_move_id")
+            if vals.get(fname)
+        }
+        lines = summary._get_lines_to_update(
+            self.env["account.move.line"].browse(line_ids)
+        )
+        summary._add_lines(lines, sign=-1)
+        partials = super(
+            AccountPartialReconcile, summary._with_lines_updated(self, lines)
+        ).create(vals_list)
+        summary._add_lines_back(lines)
+        return partials.with_env(self.env)
+
+    def unlink(self):
+        summary = self.env["account.account.reconcile.summary"]
+        lines = summary._get_lines_to_update(self.debit_move_id | self.credit_move_id)
+        summary._add_lines(lines, sign=-1)
+        res = super(
+            AccountPartialReconcile, summary._with_lines_updated(self, lines)
+        ).unlink()
+        summary._add_lines_back(lines)
+        return res
@@ -166,6 +166,48 @@ class TestReconciliationWidget(TestAccountReconciliationCommon):
         )
         self.assertFalse(reconcile_account)
 
+    def _read_summary(self):
+        summary = self.env["account.account.reconcile.summary"]
+        summary.invalidate_model()
+        return sorted(
+            (
+                row["first_line_id"],
+                row["account_id"],
+                row["partner_id"],
+                row["currency_id"],
+                row["company_id"],
+                row["residual_debit"],
+                row["residual_credit"],
+            )
+            for row in summary.search_read([], load=None)
+        )
+
+    def test_reconcile_summary(self):
+        account = self.non_current_assets_account
+        before = self._read_summary()
+        (self.move_1 | self.move_2).line_ids.filtered(
+            lambda r: r.account_id == account
+        ).reconcile()
+        after = self._read_summary()
+        self.assertNotEqual(before, after)
+        # The incremental updates give the same result as a full rebuild
+        self.env["account.account.reconcile.summary"].rebuild()
+        self.assertEqual(self._read_summary(), after)
+
+    def test_reconcile_summary_partner_change(self):
+        partner = self.env["res.partner"].create({"name": "Summary Partner"})
+        invoice = self.create_invoice_partner(partner_id=self.partner_agrolait_id)
+        self.create_invoice_partner(partner_id=partner.id)
+        invoice.button_draft()
+        invoice.partner_id = partner
+        invoice.action_post()
+        incremental = self._read_summary()
+        # The line left the group of its first partner, which can not keep its id
+        first_line_ids = [row[0] for row in incremental]
+        self.assertEqual(len(first_line_ids), len(set(first_line_ids)))
+        self.env["account.account.reconcile.summary"].rebuild()
+        self.assertEqual(self._read_summary(), incremental)
+
     def test_clean_reconcile(self):
         account = self.non_current_assets_account
         reconcile_account = self.env["account.account.reconcile"].search(
@@ -183,6 +225,27 @@ class TestReconciliationWidget(TestAccountReconciliationCommon):
         reconcile_account.clean_reconcile()
         self.assertFalse(reconcile_account.reconcile_data_info.get("counterparts"))
 
+    def test_reconcile_data_drafts(self):
+        reconcile_accounts = self.env["account.account.reconcile"].search([])
+        self.assertTrue(reconcile_accounts)
+        data = {"data": [], "counterparts": []}
+        reconcile_accounts.write({"reconcile_data_info": data})
+        data_obj = self.env["account.account.reconcile.data"]
+        drafts = data_obj.search([("reconcile_id", "in", reconcile_accounts.ids)])
+        self.assertEqual(
+            sorted(drafts.mapped("reconcile_id")), sorted(reconcile_accounts.ids)
+        )
+        reconcile_accounts.invalidate_recordset()
+        self.assertEqual(reconcile_accounts.mapped("reconcile_data_info")[0], data)
+
+        # Drafts on groups that are not open anymore are garbage collected
+        stale = data_obj.create(
+            {"reconcile_id": -1, "user_id": self.env.user.id, "data": data}
+        )
+        data_obj._gc_stale_drafts()
+        self.assertFalse(stale.exists())
+        self.assertEqual(drafts.exists(), drafts)
+
     def test_cannot_reconcile(self):
         """
         There is not enough records to reconcile for this account
@@ -629,6 +629,48 @@ class TestReconciliationWidget(TestAccountReconciliationCommon):
         )
         self.assertTrue(bank_stmt_line.is_reconciled)
 
+    def test_auto_reconcile_batch(self):
+        self.env["account.reconcile.model"].create(
+            {
+                "name": "write-off model suggestion",
+                "rule_type": "writeoff_suggestion",
+                "match_label": "contains",
+                "match_label_param": "DEMO WRITEOFF",
+                "auto_reconcile": True,
+                "line_ids": [
+                    Command.create({"account_id": self.current_assets_account.id})
+                ],
+            }
+        )
+        bank_stmt = self.acc_bank_stmt_model.create(
+            {
+                "journal_id": self.bank_journal_euro.id,
+                "date": time.strftime("%Y-07-15"),
+                "name": "test",
+            }
+        )
+        # Not reconciled on create
+        bank_stmt_lines = self.acc_bank_stmt_line_model.with_context(
+            _test_account_reconcile_oca=False
+        ).create(
+            [
+                {
+                    "name": payment_ref,
+                    "payment_ref": payment_ref,
+                    "journal_id": self.bank_journal_euro.id,
+                    "statement_id": bank_stmt.id,
+                    "amount": 100,
+                    "date": time.strftime("%Y-07-15"),
+                }
+                for payment_ref in ("DEMO WRITEOFF", "OTHER")
+            ]
+        )
+        self.assertFalse(any(bank_stmt_lines.mapped("is_reconciled")))
+        stats = self.bank_journal_euro._auto_reconcile_statement_lines()
+        self.assertEqual(stats["reconciled"], 1)
+        self.assertEqual(stats["failed"], 0)
+        self.assertEqual(bank_stmt_lines.mapped("is_reconciled"), [True, False])
+
     def test_reconcile_invoice_keep(self):
         """
         We want to test how the keep mode works, keeping the original move lines.
@@ -1159,6 +1201,58 @@ class TestReconciliationWidget(TestAccountReconciliationCommon):
             parent_partner,
         )
 
+    def test_reconcile_proposals_reserved(self):
+        partner = self.env["res.partner"].create({"name": "test_proposals"})
+        inv1 = self.create_invoice_partner(
+            currency_id=self.currency_euro_id, partner_id=partner.id
+        )
+        inv2 = self.create_invoice_partner(
+            currency_id=self.currency_euro_id, partner_id=partner.id
+        )
+        receivables = (inv1 + inv2).line_ids.filtered(
+            lambda line: line.account_id.account_type == "asset_receivable"
+        )
+        bank_stmt = self.acc_bank_stmt_model.create(
+            {
+                "journal_id": self.bank_journal_euro.id,
+                "date": time.strftime("%Y-07-15"),
+                "name": "test",
+            }
+        )
+        bank_stmt_lines = self.acc_bank_stmt_line_model.create(
+            [
+                {
+                    "name": "testLine",
+                    "statement_id": bank_stmt.id,
+                    "journal_id": self.bank_journal_euro.id,
+                    "partner_id": partner.id,
+                    "amount": 50,
+                    "date": time.strftime("%Y-07-15"),
+                    "payment_ref": "test",
+                }
+                for _i in range(2)
+            ]
+        )
+        self.invoice_matching_models.write(
+            {
+                "active": True,
+                "auto_reconcile": False,
+                "match_text_location_label": False,
+            }
+        )
+        # Both lines match the oldest invoice alone, the second one gets the other
+        counterparts = [
+            data["counterparts"]
+            for data in bank_stmt_lines.mapped("reconcile_data_info")
+        ]
+        self.assertEqual(
+            counterparts,
+            [
+                receivables.filtered(lambda line: line.move_id == inv1).ids,
+                receivables.filtered(lambda line: line.move_id == inv2).ids,
+            ],
+        )
+
     def test_journal_foreign_currency(self):
         inv1 = self.create_invoice(currency_id=self.currency_usd_id, invoice_amount=100)
         bank_stmt = self.acc_bank_stmt_model.create(
@@ -1,2 +1,4 @@
+from . import automation_mixin
 from . import macro
 from . import trigger
+from . import ticket
@@ -0,0 +1,38 @@
+from odoo import models
+
+
+class HelpdeskAutomationMixin(models.AbstractModel):
+    _name = 'ft.helpdesk.automation.mixin'
+    _description = 'Helpdesk Automation Actions'
+
+    # The inheriting models define set_state, set_priority, set_assigned_user_id,
+    # add_tag_ids and remove_tag_ids.
+
+    def _prepare_ticket_vals(self):
+        """Return the values written on the tickets the actions apply to."""
+        self.ensure_one()
+        vals = {}
+
+        # Set state
+        if self.set_state:
+            vals['state'] = self.set_state
+
+        # Set priority
+        if self.set_priority:
+            vals['priority'] = self.set_priority
+
+        # Set assignee
+        if self.set_assigned_user_id:
+            vals['assigned_user_id'] = self.set_assigned_user_id.id
+
+        # Update tags: add and remove
+        tag_commands = []
+        if self.add_tag_ids:
+            for tag in self.add_tag_ids:
+                tag_commands.append((4, tag.id))
+        if self.remove_tag_ids:
+            for tag in self.remove_tag_ids:
+                tag_commands.append((3, tag.id))
+        if tag_commands:
+            vals['tag_ids'] = tag_commands
+        return vals
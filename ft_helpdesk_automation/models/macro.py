@@ -25,6 +25,7 @@ PRIORITY_SELECTION = [
 
 class HelpdeskMacro(models.Model):
     _name = 'ft.helpdesk.macro'
+    _inherit = ['ft.helpdesk.automation.mixin']
     _description = 'Helpdesk Macro'
     _order = 'sequence, name'
 
@@ -85,57 +86,27 @@ class HelpdeskMacro(models.Model):
     # Methods
     # =====================
 
-    def action_apply(self, ticket):
-        """Apply all the macro's actions to a ticket.
+    def action_apply(self, tickets):
+        """Apply all the macro's actions to the tickets.
 
-        :param ticket: ft.helpdesk.ticket recordset (single record)
+        The field changes are written on all the tickets at once and the reply
+        is posted in batch, so bulk macros from the list view scale linearly.
+
+        :param tickets: ft.helpdesk.ticket recordset
         """
         self.ensure_one()
-        ticket.ensure_one()
-
-        vals = {}
-
-        # Set state
-        if self.set_state:
-            vals['state'] = self.set_state
-
-        # Set priority
-        if self.set_priority:
-            vals['priority'] = self.set_priority
-
-        # Set assignee
-        if self.set_assigned_user_id:
-            vals['assigned_user_id'] = self.set_assigned_user_id.id
-
-        # Update tags: add and remove
-        tag_commands = []
-        if self.add_tag_ids:
-            for tag in self.add_tag_ids:
-                tag_commands.append((4, tag.id))
-        if self.remove_tag_ids:
-            for tag in self.remove_tag_ids:
-                tag_commands.append((3, tag.id))
-        if tag_commands:
-            vals['tag_ids'] = tag_commands
 
         # Write all field changes at once
+        vals = self._prepare_ticket_vals()
         if vals:
-            ticket.write(vals)
+            tickets.write(vals)
 
         # Post reply if configured
         if self.reply_body:
-            if self.is_internal_note:
-                subtype_xmlid = 'ft_helpdesk_core.mt_ticket_internal_note'
-            else:
-                subtype_xmlid = 'mail.mt_comment'
-            ticket.message_post(
-                body=self.reply_body,
-                subtype_xmlid=subtype_xmlid,
-                message_type='comment',
-            )
+            tickets._post_automation_reply(self.reply_body, self.is_internal_note)
 
         _logger.info(
-            'Macro "%s" (id=%s) applied to ticket %s (id=%s)',
-            self.name, self.id, ticket.ticket_no, ticket.id,
+            'Macro "%s" (id=%s) applied to %s ticket(s): %s',
+            self.name, self.id, len(tickets), ', '.join(tickets.mapped('ticket_no')),
         )
         return True
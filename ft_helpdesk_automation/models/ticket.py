@@ -0,0 +1,44 @@
+from odoo import models
+
+
+class HelpdeskTicketAutomation(models.Model):
+    _inherit = 'ft.helpdesk.ticket'
+
+    def _post_automation_reply(self, body, is_internal_note=False):
+        """Post a macro or trigger reply on all the tickets.
+
+        Public replies go through message_post for each ticket, as they
+        notify the customer and update the response dates of that ticket.
+        Internal notes are the same for every ticket: they are created with
+        a single mail.message create, then their followers are notified.
+        Emails are queued instead of sent during the request.
+
+        :param body: html body of the reply
+        :param is_internal_note: post as internal note instead of public reply
+        """
+        if not self:
+            return
+        tickets = self.with_context(mail_notify_force_send=False)
+        if not is_internal_note:
+            for ticket in tickets:
+                ticket.message_post(
+                    body=body,
+                    subtype_xmlid='mail.mt_comment',
+                    message_type='comment',
+                )
+            return
+        author_id, email_from = self._message_compute_author()
+        subtype_id = self.env['ir.model.data']._xmlid_to_res_id(
+            'ft_helpdesk_core.mt_ticket_internal_note')
+        values_list = [{
+            'model': self._name,
+            'res_id': ticket.id,
+            'body': body,
+            'message_type': 'comment',
+            'subtype_id': subtype_id,
+            'author_id': author_id,
+            'email_from': email_from,
+        } for ticket in self]
+        messages = self.env['mail.message'].sudo().create(values_list)
+        for ticket, message, values in zip(tickets, messages, values_list):
+            ticket._notify_thread(message, msg_vals=values)
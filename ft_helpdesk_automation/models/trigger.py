@@ -1,7 +1,7 @@
 import ast
 import logging
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import UserError, ValidationError
 from odoo.osv import expression
 
@@ -24,6 +24,9 @@ PRIORITY_SELECTION = [
     ('3', 'Urgent'),
 ]
 
+# Operators evaluated in memory on the loaded tickets, others fall back to SQL
+MEMORY_OPERATORS = {'=', '!=', '<', '<=', '>', '>=', 'in', 'not in'}
+
 TRIGGER_ON_SELECTION = [
     ('create', 'Ticket Created'),
     ('state_change', 'Status Changed'),
@@ -34,6 +37,7 @@ TRIGGER_ON_SELECTION = [
 
 class HelpdeskTrigger(models.Model):
     _name = 'ft.helpdesk.trigger'
+    _inherit = ['ft.helpdesk.automation.mixin']
     _description = 'Helpdesk Trigger'
     _order = 'sequence, name'
 
@@ -129,18 +133,16 @@ class HelpdeskTrigger(models.Model):
     # Methods
     # =====================
 
-    def _evaluate_domain(self, ticket):
-        """Check whether the given ticket matches this trigger's domain.
+    @tools.ormcache('self.id', 'self.write_date')
+    def _get_compiled_domain(self):
+        """Parse and normalize the domain once per trigger version.
 
-        :param ticket: ft.helpdesk.ticket recordset (single record)
-        :returns: True if the ticket matches, False otherwise
+        :returns: tuple (domain, in_memory) where domain is the normalized
+            domain as a tuple, or None if the domain is invalid, and in_memory
+            tells whether every leaf can be evaluated without SQL
         """
-        self.ensure_one()
-        ticket.ensure_one()
-
         if not self.domain or self.domain == '[]':
-            return True
-
+            return (), True
         try:
             domain = ast.literal_eval(self.domain)
         except (ValueError, SyntaxError):
@@ -148,95 +150,107 @@ class HelpdeskTrigger(models.Model):
                 'Trigger "%s" (id=%s) has invalid domain: %s',
                 self.name, self.id, self.domain,
             )
-            return False
+            return None, False
+        domain = expression.normalize_domain(domain)
+        in_memory = all(
+            leaf[1] in MEMORY_OPERATORS
+            for leaf in domain
+            if expression.is_leaf(leaf) and not expression.is_operator(leaf)
+        )
+        return tuple(domain), in_memory
 
-        # Search for the ticket within the domain; if found, it matches
-        combined_domain = expression.AND([
-            domain,
-            [('id', '=', ticket.id)],
-        ])
-        return bool(self.env['ft.helpdesk.ticket'].search_count(combined_domain))
+    def _filter_tickets(self, tickets):
+        """Return the tickets matching this trigger's domain.
 
-    def _apply_actions(self, ticket):
-        """Apply the trigger's actions to the ticket.
+        Simple field comparisons are evaluated in memory on the loaded
+        tickets, other domains are checked with one query for the whole
+        recordset.
 
-        :param ticket: ft.helpdesk.ticket recordset (single record)
+        :param tickets: ft.helpdesk.ticket recordset
+        :returns: the matching subset of tickets
         """
         self.ensure_one()
-        ticket.ensure_one()
+        domain, in_memory = self._get_compiled_domain()
+        if domain is None:
+            return tickets.browse()
+        if not domain:
+            return tickets
+        if in_memory:
+            return tickets.filtered_domain(list(domain))
+        return tickets.search(expression.AND([
+            list(domain),
+            [('id', 'in', tickets.ids)],
+        ]))
 
-        vals = {}
+    def _evaluate_domain(self, ticket):
+        """Check whether the given ticket matches this trigger's domain.
 
-        # Set state
-        if self.set_state:
-            vals['state'] = self.set_state
+        :param ticket: ft.helpdesk.ticket recordset (single record)
+        :returns: True if the ticket matches, False otherwise
+        """
+        self.ensure_one()
+        ticket.ensure_one()
+        return bool(self._filter_tickets(ticket))
 
-        # Set priority
-        if self.set_priority:
-            vals['priority'] = self.set_priority
+    def _apply_actions(self, tickets):
+        """Apply the trigger's actions to the tickets.
 
-        # Set assignee
-        if self.set_assigned_user_id:
-            vals['assigned_user_id'] = self.set_assigned_user_id.id
+        The field changes are written on all the tickets at once, the reply is
+        posted in batch and the notification activities are created at once.
 
-        # Update tags: add and remove
-        tag_commands = []
-        if self.add_tag_ids:
-            for tag in self.add_tag_ids:
-                tag_commands.append((4, tag.id))
-        if self.remove_tag_ids:
-            for tag in self.remove_tag_ids:
-                tag_commands.append((3, tag.id))
-        if tag_commands:
-            vals['tag_ids'] = tag_commands
+        :param tickets: ft.helpdesk.ticket recordset
+        """
+        self.ensure_one()
+        if not tickets:
+            return
 
         # Write all field changes at once
+        vals = self._prepare_ticket_vals()
         if vals:
-            ticket.write(vals)
+            tickets.write(vals)
 
         # Post reply if configured
         if self.reply_body:
-            if self.is_internal_note:
-                subtype_xmlid = 'ft_helpdesk_core.mt_ticket_internal_note'
-            else:
-                subtype_xmlid = 'mail.mt_comment'
-            ticket.message_post(
-                body=self.reply_body,
-                subtype_xmlid=subtype_xmlid,
-                message_type='comment',
-            )
+            tickets._post_automation_reply(self.reply_body, self.is_internal_note)
 
         # Notify users
         if self.notify_user_ids:
-            ticket.activity_schedule(
-                'mail.mail_activity_data_todo',
-                user_id=self.notify_user_ids[0].id,
-                summary=_('Automation Trigger: %s') % self.name,
-                note=_('Trigger "%s" fired on ticket %s.') % (
+            activity_type = self.env.ref('mail.mail_activity_data_todo')
+            res_model_id = self.env['ir.model']._get_id(tickets._name)
+            self.env['mail.activity'].create([{
+                'res_model_id': res_model_id,
+                'res_id': ticket.id,
+                'activity_type_id': activity_type.id,
+                'automated': True,
+                'date_deadline': activity_type._get_date_deadline(),
+                'user_id': self.notify_user_ids[0].id,
+                'summary': _('Automation Trigger: %s') % self.name,
+                'note': _('Trigger "%s" fired on ticket %s.') % (
                     self.name, ticket.ticket_no or ticket.name),
-            )
+            } for ticket in tickets])
 
         _logger.info(
-            'Trigger "%s" (id=%s) fired on ticket %s (id=%s)',
-            self.name, self.id, ticket.ticket_no, ticket.id,
+            'Trigger "%s" (id=%s) fired on %s ticket(s): %s',
+            self.name, self.id, len(tickets), ', '.join(tickets.mapped('ticket_no')),
         )
 
-    def _check_and_apply(self, ticket):
-        """Evaluate the domain and apply actions if the ticket matches.
+    def _check_and_apply(self, tickets):
+        """Evaluate the domain and apply actions on the matching tickets.
 
         This is the main entry point for trigger evaluation.
 
-        :param ticket: ft.helpdesk.ticket recordset (single record)
-        :returns: True if the trigger fired, False otherwise
+        :param tickets: ft.helpdesk.ticket recordset
+        :returns: True if the trigger fired on at least one ticket, False otherwise
         """
         self.ensure_one()
-        ticket.ensure_one()
 
         if not self.active:
             return False
 
-        if self._evaluate_domain(ticket):
-            self._apply_actions(ticket)
+        matching = self._filter_tickets(tickets)
+        if matching:
+            self._apply_actions(matching)
             return True
 
         return False
+
@@ -1,7 +1,123 @@
-from odoo import api, fields, models
-from datetime import timedelta
+import bisect
+import math
+from datetime import datetime, time, timedelta
+
 import pytz
 
+from odoo import api, fields, models, tools, _
+from odoo.exceptions import UserError
+
+
+def _minute_to_float(minute):
+    """Float hour of a minute of the day, as compared against the hour lines."""
+    return minute // 60 + (minute % 60) / 60.0
+
+
+class BusinessCalendar:
+    """Compiled, immutable weekly calendar of a business hours record.
+
+    ``intervals`` holds for each weekday (0 = Monday) the sorted, merged
+    ``(start, stop)`` half-open ranges of working minutes of the local day.
+    ``holidays`` is the sorted list of merged ``(date_from, date_to)`` ranges
+    excluded from working time.
+    """
+
+    __slots__ = ('tz', 'intervals', 'holidays', '_holiday_starts')
+
+    def __init__(self, tz, lines, holidays):
+        self.tz = tz
+        intervals = {weekday: [] for weekday in range(7)}
+        for weekday, hour_from, hour_to in lines:
+            # A minute is working when hour_from <= its float hour <= hour_to
+            start = max(int(math.ceil(hour_from * 60)), 0)
+            while start > 0 and _minute_to_float(start - 1) >= hour_from:
+                start -= 1
+            while start < 1440 and _minute_to_float(start) < hour_from:
+                start += 1
+            stop = min(int(math.floor(hour_to * 60)), 1439)
+            while stop < 1439 and _minute_to_float(stop + 1) <= hour_to:
+                stop += 1
+            while stop >= 0 and _minute_to_float(stop) > hour_to:
+                stop -= 1
+            if start <= stop:
+                intervals[weekday].append((start, stop + 1))
+        self.intervals = tuple(tuple(self._merge(intervals[weekday])) for weekday in range(7))
+        self.holidays = tuple(self._merge(
+            [h for h in holidays if h[0] <= h[1]], adjacent=lambda stop, start: start <= stop + timedelta(days=1)))
+        self._holiday_starts = [date_from for date_from, _date_to in self.holidays]
+
+    @staticmethod
+    def _merge(ranges, adjacent=lambda stop, start: start <= stop):
+        merged = []
+        for start, stop in sorted(ranges):
+            if merged and adjacent(merged[-1][1], start):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            else:
+                merged.append((start, stop))
+        return merged
+
+    def _holiday_end(self, day):
+        """Last date of the holiday range containing ``day``, or None."""
+        index = bisect.bisect_right(self._holiday_starts, day) - 1
+        if index >= 0 and self.holidays[index][1] >= day:
+            return self.holidays[index][1]
+        return None
+
+    def _to_utc(self, day, minute):
+        local = datetime.combine(day, time()) + timedelta(minutes=minute)
+        return self.tz.localize(local).astimezone(pytz.utc)
+
+    @staticmethod
+    def _as_utc(dt):
+        # Naive datetimes are UTC, as stored by the ORM
+        if dt.tzinfo is None:
+            return pytz.utc.localize(dt)
+        return dt.astimezone(pytz.utc)
+
+    def is_working_time(self, dt):
+        local_dt = self._as_utc(dt).astimezone(self.tz)
+        if self._holiday_end(local_dt.date()):
+            return False
+        minute = local_dt.hour * 60 + local_dt.minute
+        return any(start <= minute < stop for start, stop in self.intervals[local_dt.weekday()])
+
+    def add_hours(self, start_dt, hours):
+        """Jump from working interval to working interval until ``hours`` of
+        working time are consumed, minute by minute equivalent."""
+        remaining = int(math.ceil(hours * 60)) if hours > 0 else 0
+        if remaining and not any(self.intervals):
+            raise UserError(_('The business hours have no working time.'))
+        start_utc = self._as_utc(start_dt)
+        offset = timedelta(seconds=start_utc.second, microseconds=start_utc.microsecond)
+        current = start_utc - offset
+        while remaining > 0:
+            local_dt = current.astimezone(self.tz)
+            day = local_dt.date()
+            holiday_end = self._holiday_end(day)
+            if holiday_end:
+                target = self._to_utc(holiday_end + timedelta(days=1), 0)
+                current = target if target > current else current + timedelta(minutes=1)
+                continue
+            minute = local_dt.hour * 60 + local_dt.minute
+            for start, stop in self.intervals[day.weekday()]:
+                if minute >= stop:
+                    continue
+                if minute < start:
+                    target = self._to_utc(day, start)
+                    current = target if target > current else current + timedelta(minutes=1)
+                else:
+                    consumed = min(remaining, stop - minute)
+                    remaining -= consumed
+                    current += timedelta(minutes=consumed)
+                break
+            else:
+                target = self._to_utc(day + timedelta(days=1), 0)
+                current = target if target > current else current + timedelta(minutes=1)
+        result = current + offset
+        if start_dt.tzinfo is None:
+            return result.replace(tzinfo=None)
+        return result.astimezone(start_dt.tzinfo)
+
 
 class HelpdeskBusinessHours(models.Model):
     _name = 'ft.helpdesk.business.hours'
@@ -27,37 +143,41 @@ class HelpdeskBusinessHours(models.Model):
     def _tz_get(self):
         return [(tz, tz) for tz in sorted(pytz.all_timezones_set)]
 
+    def write(self, vals):
+        self.env.registry.clear_cache()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super().unlink()
+
+    def _get_calendar(self):
+        """Return the compiled BusinessCalendar of the record.
+
+        The calendar is cached per process by id and write_date, and the cache
+        is cleared whenever the record, its lines or its holidays change, so
+        callers can check working time without reading the lines again.
+        """
+        self.ensure_one()
+        return self._get_calendar_cached()
+
+    @tools.ormcache('self.id', 'self.write_date')
+    def _get_calendar_cached(self):
+        return BusinessCalendar(
+            pytz.timezone(self.timezone),
+            [(int(line.day_of_week), line.hour_from, line.hour_to) for line in self.line_ids],
+            [(holiday.date_from, holiday.date_to) for holiday in self.holiday_ids],
+        )
+
     def _is_working_time(self, dt):
         """Check if a datetime falls within business hours."""
         self.ensure_one()
-        tz = pytz.timezone(self.timezone)
-        local_dt = dt.astimezone(tz)
-        # Check holidays
-        date_str = local_dt.date()
-        for holiday in self.holiday_ids:
-            if holiday.date_from <= date_str <= holiday.date_to:
-                return False
-        # Check working hours
-        weekday = str(local_dt.weekday())
-        time_float = local_dt.hour + local_dt.minute / 60.0
-        for line in self.line_ids:
-            if line.day_of_week == weekday:
-                if line.hour_from <= time_float <= line.hour_to:
-                    return True
-        return False
+        return self._get_calendar().is_working_time(dt)
 
     def _add_business_hours(self, start_dt, hours):
         """Add business hours to a datetime, skipping non-working time."""
         self.ensure_one()
-        remaining_minutes = hours * 60
-        current = start_dt
-        while remaining_minutes > 0:
-            if self._is_working_time(current):
-                remaining_minutes -= 1
-                current += timedelta(minutes=1)
-            else:
-                current += timedelta(minutes=1)
-        return current
+        return self._get_calendar().add_hours(start_dt, hours)
 
 
 class HelpdeskBusinessHoursLine(models.Model):
@@ -81,6 +201,19 @@ class HelpdeskBusinessHoursLine(models.Model):
     hour_from = fields.Float(string='From', required=True, default=9.0)
     hour_to = fields.Float(string='To', required=True, default=17.0)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env.registry.clear_cache()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env.registry.clear_cache()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super().unlink()
+
 
 class HelpdeskBusinessHoursHoliday(models.Model):
     _name = 'ft.helpdesk.business.hours.holiday'
@@ -94,3 +227,16 @@ class HelpdeskBusinessHoursHoliday(models.Model):
     name = fields.Char(string='Holiday Name', required=True, translate=True)
     date_from = fields.Date(string='From', required=True)
     date_to = fields.Date(string='To', required=True)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env.registry.clear_cache()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env.registry.clear_cache()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super().unlink()
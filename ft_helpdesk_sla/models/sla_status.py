@@ -1,10 +1,15 @@
 import logging
+import threading
+from collections import defaultdict
 from datetime import timedelta
 
 from odoo import api, fields, models, _
+from odoo.tools import split_every
 
 _logger = logging.getLogger(__name__)
 
+BREACH_BATCH_SIZE = 200
+
 
 class SLAStatus(models.Model):
     _name = 'ft.helpdesk.sla.status'
@@ -58,7 +63,11 @@ class SLAStatus(models.Model):
         ('at_risk', 'At Risk'),
         ('breached', 'Breached'),
         ('completed', 'Completed'),
-    ], string='SLA Status', compute='_compute_sla_state', store=True)
+    ], string='SLA Status', compute='_compute_sla_state', store=True, index=True)
+    at_risk_date = fields.Datetime(
+        string='At Risk From', compute='_compute_at_risk_date', store=True, index=True,
+        help='When the status gets within 25% of its next open deadline',
+    )
 
     @api.depends('first_response_deadline', 'resolution_deadline',
                  'first_response_done_at', 'resolution_done_at',
@@ -90,60 +99,159 @@ class SLAStatus(models.Model):
     def _compute_sla_state(self):
         now = fields.Datetime.now()
         for status in self:
-            if status.first_response_breached or status.resolution_breached:
-                status.sla_state = 'breached'
-            elif status.first_response_done_at and status.resolution_done_at:
-                status.sla_state = 'completed'
-            else:
-                # Check if at risk (within 25% of deadline)
-                at_risk = False
-                if (status.first_response_deadline and not status.first_response_done_at):
-                    remaining = (status.first_response_deadline - now).total_seconds()
-                    total = (status.first_response_deadline - status.create_date).total_seconds()
-                    if total > 0 and remaining / total < 0.25:
-                        at_risk = True
-                if (status.resolution_deadline and not status.resolution_done_at):
-                    remaining = (status.resolution_deadline - now).total_seconds()
-                    total = (status.resolution_deadline - status.create_date).total_seconds()
-                    if total > 0 and remaining / total < 0.25:
-                        at_risk = True
-                status.sla_state = 'at_risk' if at_risk else 'on_track'
+            status.sla_state = status._get_sla_state(now)
+
+    @api.depends('first_response_deadline', 'resolution_deadline',
+                 'first_response_done_at', 'resolution_done_at')
+    def _compute_at_risk_date(self):
+        now = fields.Datetime.now()
+        for status in self:
+            create_date = status.create_date or now
+            dates = [
+                deadline - (deadline - create_date) * 0.25
+                for deadline, done_at in (
+                    (status.first_response_deadline, status.first_response_done_at),
+                    (status.resolution_deadline, status.resolution_done_at),
+                )
+                if deadline and not done_at and deadline > create_date
+            ]
+            status.at_risk_date = min(dates) if dates else False
+
+    def _get_sla_state(self, now):
+        """Return the SLA state of the status at the given time."""
+        self.ensure_one()
+        if self.first_response_breached or self.resolution_breached:
+            return 'breached'
+        if self.first_response_done_at and self.resolution_done_at:
+            return 'completed'
+        # Check if at risk (within 25% of deadline)
+        create_date = self.create_date or now
+        if (self.first_response_deadline and not self.first_response_done_at):
+            remaining = (self.first_response_deadline - now).total_seconds()
+            total = (self.first_response_deadline - create_date).total_seconds()
+            if total > 0 and remaining / total < 0.25:
+                return 'at_risk'
+        if (self.resolution_deadline and not self.resolution_done_at):
+            remaining = (self.resolution_deadline - now).total_seconds()
+            total = (self.resolution_deadline - create_date).total_seconds()
+            if total > 0 and remaining / total < 0.25:
+                return 'at_risk'
+        return 'on_track'
+
+    @api.model
+    def _cron_update_sla_state(self):
+        """Cron job: apply the time-driven SLA state transitions.
+
+        ``sla_state`` only recomputes when its dependencies change, so the
+        on_track -> at_risk transition is applied here, only for the statuses
+        whose ``at_risk_date`` has passed, with one write per new state, which
+        also updates the stored SLA fields of the tickets.
+        """
+        now = fields.Datetime.now()
+        statuses = self.search([
+            ('sla_state', '=', 'on_track'),
+            ('at_risk_date', '<=', now),
+        ])
+        to_update = defaultdict(list)
+        for status in statuses:
+            state = status._get_sla_state(now)
+            if state != status.sla_state:
+                to_update[state].append(status.id)
+        for state, status_ids in to_update.items():
+            self.browse(status_ids).write({'sla_state': state})
 
     @api.model
     def _create_for_ticket(self, ticket):
         """Find matching SLA policy and create SLA status for a ticket."""
+        return bool(self._create_for_tickets(ticket))
+
+    @api.model
+    def _get_policy_index(self, policies):
+        """Index policies by (team, category, type), empty criteria as False.
+
+        Each bucket keeps the policies in sequence order with their position,
+        so the first policy matching the priority is the best of its bucket.
+        """
+        index = defaultdict(list)
+        for position, policy in enumerate(policies):
+            key = (policy.team_id.id, policy.category_id.id, policy.type_id.id)
+            index[key].append((position, policy))
+        return index
+
+    @api.model
+    def _match_policies(self, tickets):
+        """Return the first matching active SLA policy of each ticket.
+
+        Equivalent to calling ``_match_ticket`` on the policies in sequence
+        order, with the policies loaded once for the whole recordset.
+
+        :return: dict {ticket id: policy}
+        """
         policies = self.env['ft.helpdesk.sla.policy'].search([
             ('active', '=', True),
         ], order='sequence')
+        index = self._get_policy_index(policies)
+        result = {}
+        for ticket in tickets:
+            best = None
+            for team_id in {ticket.team_id.id, False}:
+                for category_id in {ticket.category_id.id, False}:
+                    for type_id in {ticket.type_id.id, False}:
+                        for position, policy in index.get((team_id, category_id, type_id), []):
+                            if policy.priority and ticket.priority < policy.priority:
+                                continue
+                            if best is None or position < best[0]:
+                                best = (position, policy)
+                            break
+            if best:
+                result[ticket.id] = best[1]
+        return result
 
-        for policy in policies:
-            if policy._match_ticket(ticket):
-                now = fields.Datetime.now()
-
-                # Compute deadlines
+    @api.model
+    def _create_for_tickets(self, tickets):
+        """Match SLA policies and create the SLA statuses of many tickets at once."""
+        matches = self._match_policies(tickets)
+        if not matches:
+            return self.browse()
+        now = fields.Datetime.now()
+        deadlines = {}
+        vals_list = []
+        for ticket in tickets:
+            policy = matches.get(ticket.id)
+            if not policy:
+                continue
+            # Deadlines only depend on the policy as all tickets share "now"
+            if policy.id not in deadlines:
                 if policy.business_hours_id:
                     bh = policy.business_hours_id
-                    fr_deadline = bh._add_business_hours(
-                        now, policy.first_response_hours)
-                    res_deadline = bh._add_business_hours(
-                        now, policy.resolution_hours)
+                    deadlines[policy.id] = (
+                        bh._add_business_hours(now, policy.first_response_hours),
+                        bh._add_business_hours(now, policy.resolution_hours),
+                    )
                 else:
-                    fr_deadline = now + timedelta(hours=policy.first_response_hours)
-                    res_deadline = now + timedelta(hours=policy.resolution_hours)
-
-                self.create({
-                    'ticket_id': ticket.id,
-                    'policy_id': policy.id,
-                    'first_response_deadline': fr_deadline,
-                    'resolution_deadline': res_deadline,
-                })
-                return True  # Use first matching policy
-        return False
+                    deadlines[policy.id] = (
+                        now + timedelta(hours=policy.first_response_hours),
+                        now + timedelta(hours=policy.resolution_hours),
+                    )
+            fr_deadline, res_deadline = deadlines[policy.id]
+            vals_list.append({
+                'ticket_id': ticket.id,
+                'policy_id': policy.id,
+                'first_response_deadline': fr_deadline,
+                'resolution_deadline': res_deadline,
+            })
+        return self.create(vals_list)
 
     @api.model
-    def _cron_check_sla_breaches(self):
-        """Cron job: check for SLA breaches and trigger escalations."""
+    def _cron_check_sla_breaches(self, batch_size=BREACH_BATCH_SIZE):
+        """Cron job: check for SLA breaches and trigger escalations.
+
+        Breached statuses are handled by batches: each batch is flagged with one
+        write, notified, then committed, so a backlog after downtime does not
+        run as one giant transaction.
+        """
         now = fields.Datetime.now()
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
 
         # Check first response breaches
         fr_breached = self.search([
@@ -152,12 +260,6 @@ class SLAStatus(models.Model):
             ('first_response_deadline', '<', now),
             ('ticket_id.state', 'not in', ('closed', 'cancelled')),
         ])
-        for status in fr_breached:
-            status.first_response_breached = True
-            _logger.info('SLA first response breached for ticket %s',
-                         status.ticket_id.ticket_no)
-            self._handle_breach(status, 'first_response')
-
         # Check resolution breaches
         res_breached = self.search([
             ('resolution_breached', '=', False),
@@ -165,39 +267,65 @@ class SLAStatus(models.Model):
             ('resolution_deadline', '<', now),
             ('ticket_id.state', 'not in', ('closed', 'cancelled')),
         ])
-        for status in res_breached:
-            status.resolution_breached = True
-            _logger.info('SLA resolution breached for ticket %s',
-                         status.ticket_id.ticket_no)
-            self._handle_breach(status, 'resolution')
+
+        total = len(fr_breached) + len(res_breached)
+        done = 0
+        for breach_type, statuses in (('first_response', fr_breached),
+                                      ('resolution', res_breached)):
+            for batch in split_every(batch_size, statuses.ids, self.browse):
+                batch.write({'%s_breached' % breach_type: True})
+                _logger.info('SLA %s breached for tickets %s', breach_type.replace('_', ' '),
+                             ', '.join(batch.ticket_id.mapped('ticket_no')))
+                batch._handle_breaches(breach_type)
+                done += len(batch)
+                self.env['ir.cron']._notify_progress(done=done, remaining=total - done)
+                if auto_commit:
+                    self.env.cr.commit()
+        if total:
+            _logger.info('SLA breach check: %s breaches processed', total)
 
     def _handle_breach(self, status, breach_type):
         """Handle SLA breach: escalate and notify."""
-        ticket = status.ticket_id
-        policy = status.policy_id
+        status._handle_breaches(breach_type)
 
+    def _handle_breaches(self, breach_type):
+        """Handle SLA breaches of the statuses: escalate and notify.
+
+        Activities are created with one create call per policy.
+        """
         breach_label = 'First Response' if breach_type == 'first_response' else 'Resolution'
 
         # Post internal note
-        ticket.message_post(
-            body=_('SLA Breach: %s deadline exceeded. Policy: %s') % (
-                breach_label, policy.name),
-            subtype_xmlid='ft_helpdesk_core.mt_ticket_internal_note',
-            message_type='notification',
-        )
+        for status in self:
+            status.ticket_id.message_post(
+                body=_('SLA Breach: %s deadline exceeded. Policy: %s') % (
+                    breach_label, status.policy_id.name),
+                subtype_xmlid='ft_helpdesk_core.mt_ticket_internal_note',
+                message_type='notification',
+            )
 
         # Escalate if configured
-        if policy.escalate_on_breach:
-            ticket.action_escalate()
+        self.filtered(lambda s: s.policy_id.escalate_on_breach).ticket_id.action_escalate()
 
         # Notify users
-        if policy.notify_user_ids:
-            for user in policy.notify_user_ids:
-                ticket.activity_schedule(
-                    'mail.mail_activity_data_todo',
-                    user_id=user.id,
-                    summary=_('SLA %s Breached: %s') % (
-                        breach_label, ticket.ticket_no),
-                    note=_('SLA policy "%s" %s deadline has been breached for ticket %s.') % (
-                        policy.name, breach_label.lower(), ticket.ticket_no),
-                )
+        activity_type = self.env.ref('mail.mail_activity_data_todo')
+        res_model_id = self.env['ir.model']._get_id('ft.helpdesk.ticket')
+        for policy, statuses in self.grouped('policy_id').items():
+            if not policy.notify_user_ids:
+                continue
+            vals_list = []
+            for ticket in statuses.ticket_id:
+                for user in policy.notify_user_ids:
+                    vals_list.append({
+                        'res_model_id': res_model_id,
+                        'res_id': ticket.id,
+                        'activity_type_id': activity_type.id,
+                        'automated': True,
+                        'date_deadline': activity_type._get_date_deadline(),
+                        'user_id': user.id,
+                        'summary': _('SLA %s Breached: %s') % (
+                            breach_label, ticket.ticket_no),
+                        'note': _('SLA policy "%s" %s deadline has been breached for ticket %s.') % (
+                            policy.name, breach_label.lower(), ticket.ticket_no),
+                    })
+            self.env['mail.activity'].create(vals_list)
@@ -12,18 +12,18 @@ class HelpdeskTicketSLA(models.Model):
         ('at_risk', 'At Risk'),
         ('breached', 'Breached'),
         ('completed', 'Completed'),
-    ], string='SLA State', compute='_compute_sla_fields', store=False)
+    ], string='SLA State', compute='_compute_sla_fields', store=True, index=True)
     sla_first_response_deadline = fields.Datetime(
         string='First Response Deadline',
-        compute='_compute_sla_fields', store=False,
+        compute='_compute_sla_fields', store=True, index=True,
     )
     sla_resolution_deadline = fields.Datetime(
         string='Resolution Deadline',
-        compute='_compute_sla_fields', store=False,
+        compute='_compute_sla_fields', store=True, index=True,
     )
     sla_breached = fields.Boolean(
         string='SLA Breached',
-        compute='_compute_sla_fields', store=False,
+        compute='_compute_sla_fields', store=True, index=True,
     )
 
     @api.depends(
@@ -52,8 +52,7 @@ class HelpdeskTicketSLA(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         tickets = super().create(vals_list)
-        for ticket in tickets:
-            self.env['ft.helpdesk.sla.status']._create_for_ticket(ticket)
+        self.env['ft.helpdesk.sla.status']._create_for_tickets(tickets)
         return tickets
 
     def write(self, vals):